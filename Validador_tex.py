@@ -1,4 +1,5 @@
-from typing import Any, Dict
+import re
+from typing import Any, Dict, List, Optional, Tuple
 from guardrails.validators import (
     FailResult,
     PassResult,
@@ -7,11 +8,163 @@ from guardrails.validators import (
     register_validator,
 )
 
+# Tokens relevant to the validation, matched in a single pass: comments,
+# \begin{...}/\end{...}, control sequences, braces and TeX's ^^ notation
+_TOKEN_PATTERN = re.compile(
+    r"(?P<comment>%[^\n]*)"
+    r"|\\(?P<env_command>begin|end)\s*\{(?P<env>[^{}\n]*)\}"
+    r"|\\(?P<command>[A-Za-z@]+|.)"
+    r"|(?P<brace>[{}])"
+    r"|(?P<caret>\^\^)",
+    re.DOTALL,
+)
+
+# Commands that read or write files, run programs, or can be used to build
+# such commands indirectly (\csname input\endcsname, \catcode)
+FORBIDDEN_COMMANDS = frozenset(
+    {
+        "input",
+        "include",
+        "includeonly",
+        "InputIfFileExists",
+        "openin",
+        "openout",
+        "read",
+        "readline",
+        "write",
+        "immediate",
+        "ShellEscape",
+        "directlua",
+        "csname",
+        "catcode",
+        "scantokens",
+        "endinput",
+    }
+)
+
+# Environments that write files (checked in the preamble as well)
+FORBIDDEN_ENVIRONMENTS = frozenset({"filecontents", "filecontents*"})
+
+# Environments whose content is not tokenized by TeX
+VERBATIM_ENVIRONMENTS = frozenset({"verbatim", "verbatim*", "Verbatim", "lstlisting"})
+
+# Definitions, by the number of brace groups after the name and the optional
+# arguments: \newcommand{\name}[1][x]{...}, \newenvironment{name}{...}{...}
+DEFINITION_COMMANDS = {
+    "newcommand": 1,
+    "renewcommand": 1,
+    "providecommand": 1,
+    "newenvironment": 2,
+    "renewenvironment": 2,
+}
+
+# Primitive definitions: \def\name<parameter text>{...}
+PRIMITIVE_DEFINITIONS = frozenset({"def", "gdef", "edef", "xdef"})
+
+# Commands whose (first) argument is a URL, where % and # are literal
+URL_COMMANDS = frozenset({"url", "href"})
+
+# What is still checked inside skipped text (definition bodies and URLs)
+_RESTRICTED_PATTERN = re.compile(
+    r"\\begin\s*\{(?P<env>[^{}\n]*)\}"
+    r"|\\(?P<command>[A-Za-z@]+|.)"
+    r"|(?P<caret>\^\^)",
+    re.DOTALL,
+)
+_CONTROL_SEQUENCE_PATTERN = re.compile(r"\s*\\(?:[A-Za-z@]+|.)", re.DOTALL)
+
+
+def _skip_spaces(value: str, position: int) -> int:
+    while position < len(value) and value[position].isspace():
+        position += 1
+    return position
+
+
+def _group_end(value: str, position: int, comments: bool = True) -> int:
+    """Returns the position after the {...} group at `position`, or -1.
+
+    Escaped characters are skipped and, if `comments` is set, so is the rest
+    of a line after %.
+    """
+    position = _skip_spaces(value, position)
+    if not value.startswith("{", position):
+        return -1
+    depth = 0
+    while position < len(value):
+        char = value[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == "%" and comments:
+            newline = value.find("\n", position)
+            position = len(value) if newline < 0 else newline
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return position + 1
+        position += 1
+    return -1
+
+
+def _definition_end(value: str, command: str, position: int) -> int:
+    """Returns the position after the definition started by \\command, or -1."""
+    if value.startswith("*", position):
+        position += 1
+    name = _CONTROL_SEQUENCE_PATTERN.match(value, position)
+    if command in PRIMITIVE_DEFINITIONS:
+        if name is None:
+            return -1
+        # The replacement text starts at the first brace after the parameters
+        body = value.find("{", name.end())
+        return -1 if body < 0 else _group_end(value, body)
+
+    position = name.end() if name is not None else _group_end(value, position)
+    for _ in range(2):
+        # Optional [number of arguments] and [default value]
+        if position < 0:
+            return -1
+        position = _skip_spaces(value, position)
+        if value.startswith("[", position):
+            end = value.find("]", position)
+            position = -1 if end < 0 else end + 1
+    for _ in range(DEFINITION_COMMANDS[command]):
+        if position < 0:
+            return -1
+        position = _group_end(value, position)
+    return position
+
+
+def _url_end(value: str, position: int) -> int:
+    """Returns the position after the URL argument at `position`, or -1."""
+    position = _skip_spaces(value, position)
+    if value.startswith("{", position):
+        return _group_end(value, position, comments=False)
+    # \url|...|, with any delimiter, like \verb
+    if position >= len(value):
+        return -1
+    end = value.find(value[position], position + 1)
+    return -1 if end < 0 else end + 1
+
 
 @register_validator(name="guardrails/valid_tex", data_type=["string"])
 class ValidTex(Validator):
     """Validates that a value is a valid TeX document.
 
+    The document is scanned once, in linear time, and rejected if:
+    - \\documentclass, \\begin{document} or \\end{document} are missing,
+      repeated or out of order, or there is content after \\end{document};
+    - braces or environments are unbalanced or improperly nested;
+    - it uses commands that access files or the shell (see FORBIDDEN_COMMANDS),
+      environments that write files, or the ^^ character notation, which can
+      spell those commands.
+
+    Definition bodies (\\newcommand, \\newenvironment, \\def, ...) and URLs
+    (\\url, \\href) are only checked for forbidden commands, and environments
+    are only paired inside the document body.
+
 
     **Key Properties**
 
@@ -29,18 +182,161 @@ class ValidTex(Validator):
                 error_message="Value is not a string, and thus cannot be valid TeX."
             )
 
-        # Required basic TeX commands
-        required_commands = [r"\documentclass", r"\begin{document}", r"\end{document}"]
-        missing_commands = [
-            command for command in required_commands if command not in value
-        ]
-
-        if missing_commands:
+        error = self._scan(value)
+        if error is not None:
             return FailResult(
-                error_message=(
-                    f"Value is not a valid TeX document! Missing required commands: "
-                    f"{', '.join(missing_commands)}"
-                )
+                error_message=f"Value is not a valid TeX document! {error}"
             )
 
         return PassResult()
+
+    def _scan(self, value: str) -> Optional[str]:
+        """Returns the first structural error of the document, if any."""
+        braces: List[int] = []  # Positions of the open braces
+        # (name, position, open braces) of the open environments
+        environments: List[Tuple[str, int, int]] = []
+        documentclass = begin_document = end_document = None
+
+        def line(position: int) -> int:
+            # Only computed for the error message, to keep the scan linear
+            return value.count("\n", 0, position) + 1
+
+        def skipped_error(start: int, end: int) -> Optional[str]:
+            # Text that is not tokenized here can still hide forbidden commands
+            for match in _RESTRICTED_PATTERN.finditer(value, start, end):
+                if match.lastgroup == "caret":
+                    return (
+                        f"The ^^ notation is not allowed (line {line(match.start())})."
+                    )
+                if match.lastgroup == "env":
+                    if match.group("env").strip() in FORBIDDEN_ENVIRONMENTS:
+                        return (
+                            f"Forbidden environment {match.group('env').strip()} on "
+                            f"line {line(match.start())}."
+                        )
+                elif match.group("command") in FORBIDDEN_COMMANDS:
+                    return (
+                        f"Forbidden command \\{match.group('command')} on line "
+                        f"{line(match.start())}."
+                    )
+            return None
+
+        position = 0
+        while True:
+            match = _TOKEN_PATTERN.search(value, position)
+            if match is None:
+                break
+            start, position = match.span()
+            kind = match.lastgroup
+
+            if kind == "comment":
+                continue
+            if end_document is not None:
+                return f"Content after \\end{{document}} on line {line(start)}."
+
+            if kind == "brace":
+                if match.group("brace") == "{":
+                    braces.append(start)
+                elif len(braces) > (environments[-1][2] if environments else 0):
+                    braces.pop()
+                else:
+                    return f"Unmatched '}}' on line {line(start)}."
+
+            elif kind == "caret":
+                return f"The ^^ notation is not allowed (line {line(start)})."
+
+            elif kind == "command":
+                command = match.group("command")
+                if command in FORBIDDEN_COMMANDS:
+                    return f"Forbidden command \\{command} on line {line(start)}."
+                if command == "documentclass":
+                    if documentclass is not None:
+                        return f"Repeated \\documentclass on line {line(start)}."
+                    if braces or environments:
+                        return f"\\documentclass inside a group on line {line(start)}."
+                    documentclass = start
+                elif command == "verb":
+                    # \verb|...|: the content goes up to the next delimiter
+                    if value.startswith("*", position):
+                        position += 1
+                    end = value.find(value[position : position + 1], position + 1)
+                    if position >= len(value) or end < 0:
+                        return f"Unterminated \\verb on line {line(start)}."
+                    position = end + 1
+                elif command in DEFINITION_COMMANDS or command in PRIMITIVE_DEFINITIONS:
+                    # The body is only parsed when the command is used
+                    end = _definition_end(value, command, position)
+                    if end < 0:
+                        return f"Incomplete \\{command} on line {line(start)}."
+                    error = skipped_error(position, end)
+                    if error is not None:
+                        return error
+                    position = end
+                elif command in URL_COMMANDS:
+                    end = _url_end(value, position)
+                    if end < 0:
+                        return f"Unterminated \\{command} on line {line(start)}."
+                    error = skipped_error(position, end)
+                    if error is not None:
+                        return error
+                    position = end
+
+            else:
+                name = match.group("env").strip()
+                if name in FORBIDDEN_ENVIRONMENTS:
+                    return f"Forbidden environment {name} on line {line(start)}."
+                if begin_document is None and name != "document":
+                    # Environments are only paired inside the document body
+                    continue
+                if match.group("env_command") == "begin":
+                    if name == "document":
+                        if documentclass is None:
+                            return "Missing \\documentclass before \\begin{document}."
+                        if begin_document is not None:
+                            return (
+                                f"Repeated \\begin{{document}} on line {line(start)}."
+                            )
+                        if braces or environments:
+                            return (
+                                f"\\begin{{document}} inside a group on line "
+                                f"{line(start)}."
+                            )
+                        begin_document = start
+                    environments.append((name, start, len(braces)))
+
+                    if name in VERBATIM_ENVIRONMENTS:
+                        # The content is not tokenized by TeX: skip to the end
+                        end = value.find(f"\\end{{{name}}}", position)
+                        if end < 0:
+                            return (
+                                f"Environment {name} opened on line {line(start)} "
+                                f"is never closed."
+                            )
+                        position = end
+
+                else:
+                    if not environments:
+                        return f"\\end{{{name}}} without \\begin on line {line(start)}."
+                    opened, opened_at, open_braces = environments.pop()
+                    if opened != name:
+                        return (
+                            f"\\end{{{name}}} on line {line(start)} closes "
+                            f"environment {opened} opened on line {line(opened_at)}."
+                        )
+                    if len(braces) > open_braces:
+                        return f"Unclosed '{{' on line {line(braces[-1])}."
+                    if name == "document":
+                        end_document = start
+
+        missing = [
+            command
+            for command, found in (
+                (r"\documentclass", documentclass),
+                (r"\begin{document}", begin_document),
+                (r"\end{document}", end_document),
+            )
+            if found is None
+        ]
+        if missing:
+            return f"Missing required commands: {', '.join(missing)}"
+        return None
@@ -1,120 +1,103 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    HTTPException,
+    UploadFile,
+    File,
+    Form,
+    Depends,
+    Request,
+)
 from pydantic import BaseModel
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import google.generativeai as genai
-from guardrails import Guard
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from Validador_tex import ValidTex  # Certifique-se de importar o validador criado
-from utils import (
-    extract_tex_content,
-    compile_latex,
-    extract_text_from_pdf,
-    chat_with_persona,
-)
-from auth import JWTBearer, create_access_token, SECRET_KEY, ALGORITHM
+from utils import cancel_on_disconnect, file_sha256, format_sse, spool_upload
+from pipeline import edit_pop, generate_pop, get_tex_guard, stream_pop
+from jobs import job_manager
+from batch import check_pdf_references, discard_uploads, parse_batch_items, run_batch
+from config import get_config
+from latex_format import latex_format
+from llm import warm_up
+from auth import JWTBearer, create_access_token
 from fastapi.security import HTTPBasicCredentials
-from typing import Dict
-from download_manager import DownloadManager
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import jwt
+from typing import Any, Dict, List, Optional
+from download_manager import download_manager, etag_matches, range_reaches_end
 from logger import api_logger
+from users import user_store
+from document_store import document_store
+from artifacts import artifact_store
+import metrics
+from metrics import stage_seconds
+from middleware import RequestContextMiddleware
 import time
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request as StarletteRequest
+from starlette.background import BackgroundTask, BackgroundTasks
 from starlette.responses import Response
 
 
-# Modelo de entrada atualizado
-class ChatInput(BaseModel):
-    question: str
-    has_pdf: bool = False  # Flag para indicar se há PDF anexado
-
-
 # Modelo de saída
 class ChatOutput(BaseModel):
     response: str
     pdf_path: str
+    document_id: Optional[str] = None  # Usado nas edições em /documents/
+    version: Optional[int] = None
 
 
-# Inicializar o FastAPI
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://127.0.0.1:8000", "http://localhost:8000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-# Middleware para logging de requisições
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: StarletteRequest, call_next) -> Response:
-        start_time = time.time()
-
-        try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-
-            # Log da requisição bem-sucedida
-            api_logger.log_request(request=request, response=response, error=None)
+# Rotas da API, incluídas na aplicação por create_app
+router = APIRouter()
 
-            return response
 
-        except Exception as e:
-            process_time = time.time() - start_time
-
-            # Log do erro
-            api_logger.log_error(
-                error=e,
-                context={
-                    "request_method": request.method,
-                    "request_url": str(request.url),
-                    "process_time": process_time,
-                },
-            )
-            raise
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia e encerra os recursos da aplicação."""
+    config = get_config()
+    api_logger.start()
 
+    # Gerar o formato LaTeX pré-compilado, criar o modelo principal e carregar
+    # o validador em segundo plano, sem atrasar o startup
+    loop = asyncio.get_running_loop()
+    pdflatex_path = config.get("pdflatex_path")
+    if latex_format is not None and pdflatex_path:
+        loop.run_in_executor(None, latex_format.build, pdflatex_path)
+    loop.run_in_executor(None, warm_up)
+    loop.run_in_executor(None, get_tex_guard)
 
-# Adicionar middleware ao app
-app.add_middleware(LoggingMiddleware)
+    # Limpeza periódica dos tokens de download expirados e dos PDFs gerados
+    download_manager.start_sweeper(config["download_sweep_interval_seconds"])
+    artifact_store.start_gc(config["artifact_gc_interval_seconds"])
+    try:
+        yield
+    finally:
+        await job_manager.cancel_all()
+        artifact_store.stop_gc()
+        download_manager.stop_sweeper()
+        # Grava os logs ainda na fila antes de encerrar
+        api_logger.shutdown()
 
 
 # Rota de teste/health check
-@app.get("/")
+@router.get("/")
 async def root():
     return {"status": "ok"}
 
 
-# Monta o diretório 'output' para servir arquivos estáticos
-app.mount("/static", StaticFiles(directory="output"), name="static")
-
-# Carregar variáveis de ambiente do arquivo .env
-load_dotenv()
-
-# Configurar a chave da API do Google Gemini
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError(
-        "API Key não encontrada. Certifique-se de que a variável 'GEMINI_API_KEY' está configurada no arquivo .env."
-    )
-
-# Configurar a API Key
-genai.configure(api_key=api_key)
-
-# Inicializar o gerenciador de downloads
-download_manager = DownloadManager()
+# Métricas no formato texto do Prometheus
+@router.get("/metrics")
+async def export_metrics():
+    # Algumas séries consultam o SQLite ao serem lidas: fora do event loop
+    content = await asyncio.to_thread(metrics.render)
+    return Response(content, media_type=metrics.CONTENT_TYPE)
 
 
 # Atualizar rota de login para incluir logs de segurança
-@app.post("/token", response_model=Dict[str, str])
+@router.post("/token", response_model=Dict[str, str])
 async def login(credentials: HTTPBasicCredentials, request: Request):
     try:
-        if credentials.username == "admin" and credentials.password == "senha123":
+        # A verificação do hash roda em uma thread, fora do event loop
+        if await user_store.authenticate(credentials.username, credentials.password):
             token = create_access_token({"sub": credentials.username})
 
             # Log do login bem-sucedido
@@ -145,102 +128,389 @@ async def login(credentials: HTTPBasicCredentials, request: Request):
         raise
 
 
+def get_user_id(claims: Dict[str, Any] = Depends(JWTBearer())) -> str:
+    """Retorna o user_id dos claims do token validado pelo JWTBearer."""
+    return claims["sub"]
+
+
 # Atualizar a rota de processamento
-@app.post(
+@router.post(
     "/chat_with_pdf/",
     response_model=ChatOutput,
     description="Enviar pergunta com PDF opcional",
-    dependencies=[Depends(JWTBearer())],
 )
 async def process_question_with_pdf(
-    request: Request,  # Adicionar request para pegar o token
+    request: Request,
     question: str = Form(...),
     pdf_file: UploadFile = File(None),
+    bypass_cache: bool = Form(False),
+    user_id: str = Depends(get_user_id),
 ):
     try:
-        # Extrair user_id do token
-        auth_header = request.headers.get("Authorization")
-        token = auth_header.split(" ")[1]
-        user_data = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = user_data["sub"]
 
+        upload = None
         if pdf_file is not None and pdf_file != "":
-            # Ler o conteúdo do PDF
-            pdf_content = await pdf_file.read()
-            pdf_text = extract_text_from_pdf(pdf_content)
+            # Salvar o PDF em disco, sem carregá-lo inteiro na memória
+            upload = await spool_upload(pdf_file)
 
-            # Modificar a pergunta para incluir o contexto do PDF
-            enhanced_question = f"""
-            Analise o seguinte POP existente e faça as alterações solicitadas:
+        # Geração assíncrona, cancelada se o cliente desconectar
+        result = await cancel_on_disconnect(
+            request,
+            generate_pop(question, user_id, upload, bypass_cache=bypass_cache),
+        )
 
-            POP Atual:
-            {pdf_text}
+        return {
+            "response": result["response"],
+            "pdf_path": result["pdf_path"],
+            "document_id": result["document_id"],
+            "version": result["version"],
+        }
+
+    except Exception as e:
+        api_logger.log_error(e, {"endpoint": "/chat_with_pdf"})
+        raise
 
-            Alterações solicitadas:
-            {question}
-            """
 
-            response = chat_with_persona(enhanced_question)
-        else:
-            # Comportamento padrão sem PDF
-            response = chat_with_persona(question)
+# Rota para gerar o POP com a resposta do modelo transmitida via SSE
+@router.post(
+    "/chat_with_pdf/stream",
+    description="Enviar pergunta com PDF opcional e receber o LaTeX via SSE",
+)
+async def stream_question_with_pdf(
+    request: Request,
+    question: str = Form(...),
+    pdf_file: UploadFile = File(None),
+    bypass_cache: bool = Form(False),
+    user_id: str = Depends(get_user_id),
+):
 
-        response = extract_tex_content(response)
-        guard = Guard().use(ValidTex, on_fail="exception")
-        guard.validate(response)
+    upload = None
+    if pdf_file is not None and pdf_file != "":
+        upload = await spool_upload(pdf_file)
 
-        output_directory = "./output"
-        os.makedirs(output_directory, exist_ok=True)
+    async def event_stream():
+        try:
+            async for event, data in stream_pop(
+                question, user_id, upload, bypass_cache
+            ):
+                yield format_sse(event, data)
+        except HTTPException as e:
+            api_logger.log_error(e, {"endpoint": "/chat_with_pdf/stream"})
+            yield format_sse("error", {"detail": e.detail})
+        except Exception as e:
+            api_logger.log_error(e, {"endpoint": "/chat_with_pdf/stream"})
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Se o cliente desconectar antes do início do stream, o gerador nunca
+        # roda e não remove o PDF enviado
+        background=BackgroundTask(upload.discard) if upload is not None else None,
+    )
 
-        pdf_path = compile_latex(response, output_directory)
-        if pdf_path:
-            pdf_filename = os.path.basename(pdf_path)
 
-            # Criar token único para download
-            download_token = download_manager.create_download_token(
-                pdf_filename, user_id
-            )
+# Rota para gerar o POP em segundo plano
+@router.post(
+    "/jobs/chat_with_pdf/",
+    status_code=202,
+    description="Enviar pergunta com PDF opcional e acompanhar a geração por job",
+)
+async def submit_job(
+    request: Request,
+    question: str = Form(...),
+    pdf_file: UploadFile = File(None),
+    bypass_cache: bool = Form(False),
+    user_id: str = Depends(get_user_id),
+):
+    try:
+
+        upload = None
+        if pdf_file is not None and pdf_file != "":
+            upload = await spool_upload(pdf_file)
+
+        job = job_manager.create_job(
+            user_id,
+            lambda on_stage: generate_pop(
+                question, user_id, upload, on_stage, bypass_cache
+            ),
+            cleanup=upload.discard if upload is not None else None,
+        )
+
+        return {
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events",
+        }
+    except Exception as e:
+        api_logger.log_error(e, {"endpoint": "/jobs/chat_with_pdf"})
+        raise
+
+
+# Consulta do estado de um job
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, user_id: str = Depends(get_user_id)):
+    job = job_manager.get_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.to_dict()
 
-            # URL de download com token
-            pdf_download_url = f"http://127.0.0.1:8001/secure_download/{download_token}"
 
-            api_logger.log_request(request=request, response=response)
+# Stream (Server-Sent Events) das transições de etapa de um job
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, user_id: str = Depends(get_user_id)):
+    job = job_manager.get_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
 
-            return {"response": response, "pdf_path": pdf_download_url}
-        else:
-            raise HTTPException(status_code=500, detail="Falha ao gerar o PDF.")
+    async def event_stream():
+        async for payload in job.subscribe():
+            yield format_sse(payload["event"], payload)
 
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Rota para gerar vários POPs e receber um ZIP montado conforme ficam prontos
+@router.post(
+    "/batch/chat_with_pdf/",
+    description=(
+        "Enviar uma lista de processos (JSONL ou CSV), com PDFs opcionais, e "
+        "receber um ZIP com os PDFs gerados e o manifesto"
+    ),
+)
+async def submit_batch(
+    items_file: UploadFile = File(...),
+    pdf_files: List[UploadFile] = File(None),
+    bypass_cache: bool = Form(False),
+    user_id: str = Depends(get_user_id),
+):
+    max_bytes = get_config()["max_upload_mb"] * 1024 * 1024
+    data = await items_file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail="Lista do lote muito grande")
+    items = parse_batch_items(data, items_file.filename)
+
+    uploads = {}
+    try:
+        for pdf_file in pdf_files or []:
+            if pdf_file.filename in uploads:
+                raise HTTPException(
+                    status_code=400, detail=f"PDF repetido: {pdf_file.filename}"
+                )
+            uploads[pdf_file.filename] = await spool_upload(pdf_file)
+        check_pdf_references(items, uploads)
+    except BaseException:
+        discard_uploads(uploads)
+        raise
+
+    return StreamingResponse(
+        run_batch(items, uploads, user_id, bypass_cache),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="pops.zip"'},
+        # Se o cliente desconectar antes do início do ZIP, run_batch nunca roda
+        background=BackgroundTask(discard_uploads, uploads),
+    )
+
+
+# Edição de um POP armazenado, regenerando só as seções afetadas
+@router.post(
+    "/documents/{document_id}/edit",
+    description="Alterar um POP gerado anteriormente, seção por seção",
+)
+async def edit_document(
+    request: Request,
+    document_id: str,
+    instruction: str = Form(...),
+    sections: str = Form(None),
+    base_version: int = Form(None),
+    user_id: str = Depends(get_user_id),
+):
+    try:
+        numbers = None
+        if sections:
+            try:
+                numbers = [int(n) for n in sections.split(",") if n.strip()]
+            except ValueError:
+                raise HTTPException(
+                    status_code=400,
+                    detail="sections deve listar números separados por vírgula",
+                )
+
+        result = await cancel_on_disconnect(
+            request,
+            edit_pop(document_id, user_id, instruction, numbers, base_version),
+        )
+
+        return {
+            "response": result["response"],
+            "pdf_path": result["pdf_path"],
+            "document_id": result["document_id"],
+            "version": result["version"],
+            "sections": result["sections"],
+        }
     except Exception as e:
-        api_logger.log_error(e, {"endpoint": "/chat_with_pdf"})
+        api_logger.log_error(e, {"endpoint": "/documents/edit"})
         raise
 
 
+# Código LaTeX de um POP armazenado e o histórico de versões
+@router.get("/documents/{document_id}")
+async def get_document(
+    document_id: str,
+    version: Optional[int] = None,
+    user_id: str = Depends(get_user_id),
+):
+    document = await asyncio.to_thread(
+        document_store.get, document_id, user_id, version
+    )
+    if document is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    document["versions"] = await asyncio.to_thread(
+        document_store.versions, document_id, user_id
+    )
+    return document
+
+
+class DownloadResponse(FileResponse):
+    """FileResponse que registra o status enviado e se o corpo foi concluído."""
+
+    sent_status: Optional[int] = None
+    body_complete = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        async def tracking_send(message) -> None:
+            await send(message)
+            if message["type"] == "http.response.start":
+                self.sent_status = message["status"]
+            elif message["type"] == "http.response.pathsend" or (
+                message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+            ):
+                self.body_complete = True
+
+        await super().__call__(scope, receive, tracking_send)
+
+
 # Nova rota para download seguro
-@app.get("/secure_download/{token}")
+@router.get("/secure_download/{token}")
 async def secure_download(token: str, request: Request):
+    start_time = time.perf_counter()
     try:
-        filename = download_manager.validate_token(token)
+        # O armazenamento de tokens pode ser SQLite ou Redis: fora do event loop
+        download = await asyncio.to_thread(download_manager.get_download, token)
 
-        if not filename:
+        if not download:
             raise HTTPException(
                 status_code=403, detail="Token de download inválido ou expirado"
             )
 
-        file_path = os.path.join("./output", filename)
-        if not os.path.exists(file_path):
+        # Caminho relativo ao diretório dos PDFs; nomes que saiam dele são
+        # recusados
+        file_path = artifact_store.resolve(download["filename"])
+        if file_path is None:
+            raise HTTPException(status_code=403, detail="Arquivo inválido")
+        filename = os.path.basename(file_path)
+        try:
+            stat_result = os.stat(file_path)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
+        # ETag forte derivado do conteúdo do PDF
+        sha256 = download.get("sha256") or await asyncio.to_thread(
+            file_sha256, file_path
+        )
+        etag = f'"{sha256}"'
+        headers = {
+            "Content-Disposition": f"attachment; filename={filename}",
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={int(download_manager.ttl_seconds)}",
+        }
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
         api_logger.log_security_event(
             "file_download",
             {"token": token, "ip": request.client.host, "filename": filename},
         )
 
-        return FileResponse(
+        # O token só é consumido depois que o último byte for enviado; até
+        # lá, downloads interrompidos podem ser retomados com Range
+        range_header = request.headers.get("range")
+
+        def consume_if_complete() -> None:
+            # O status enviado já reflete o If-Range e os Range inválidos (400)
+            # ou fora do arquivo (416), decididos pelo FileResponse
+            if not response.body_complete:
+                return
+            if response.sent_status == 200 or (
+                response.sent_status == 206
+                and range_reaches_end(range_header, stat_result.st_size)
+            ):
+                download_manager.consume_token(token)
+
+        background = BackgroundTasks()
+        background.add_task(consume_if_complete)
+        # Tarefas em segundo plano rodam após o envio do último byte
+        background.add_task(
+            lambda: stage_seconds.observe(
+                time.perf_counter() - start_time, stage="download"
+            )
+        )
+
+        response = DownloadResponse(
             file_path,
             media_type="application/pdf",
             filename=filename,
-            headers={"Content-Disposition": f"attachment; filename={filename}"},
+            headers=headers,
+            stat_result=stat_result,
+            background=background,
         )
+        return response
     except Exception as e:
         api_logger.log_error(e, {"endpoint": "/secure_download"})
         raise
+
+
+def create_app() -> FastAPI:
+    """
+    Cria a aplicação com middlewares, rotas e o lifespan.
+
+    Os recursos pesados (modelo do Gemini, guardrails, PyMuPDF) não são
+    carregados aqui: são importados sob demanda ou preparados em segundo
+    plano no startup.
+    """
+    # Carregar variáveis de ambiente do arquivo .env
+    load_dotenv()
+
+    # A chave da API do Google Gemini é lida ao criar o primeiro modelo
+    if get_config()["llm_provider"] == "gemini" and not os.getenv("GEMINI_API_KEY"):
+        raise ValueError(
+            "API Key não encontrada. Certifique-se de que a variável "
+            "'GEMINI_API_KEY' está configurada no arquivo .env."
+        )
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://127.0.0.1:8000", "http://localhost:8000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Id, Server-Timing, perfil e log de cada requisição
+    app.add_middleware(RequestContextMiddleware)
+
+    app.include_router(router)
+    return app
+
+
+# Aplicação usada pelo uvicorn (uvicorn app:app)
+app = create_app()
@@ -0,0 +1,289 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import get_config
+from metrics import artifact_removals, cache_bytes, cache_entries, cached
+
+# Subdiretório onde os PDFs são compilados antes de entrar no armazenamento
+STAGING_DIRECTORY = ".staging"
+# Artefatos removidos por transação na coleta de lixo
+GC_BATCH_SIZE = 256
+
+
+class ArtifactStore:
+    """PDFs gerados, em diretórios fragmentados pelo prefixo do SHA-256.
+
+    Cada PDF fica em `root/<2 primeiros caracteres do hash>/<nome>`, de modo
+    que nenhum diretório acumule todos os arquivos. Um índice SQLite guarda
+    dono, tamanho e data de criação de cada artefato, e a coleta de lixo
+    remove os mais antigos que `max_age_seconds` ou, acima de `max_bytes`,
+    os mais antigos primeiro. Artefatos com tokens de download válidos
+    (`keep_until` no futuro) nunca são removidos.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        index_path: str,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.root = os.path.abspath(root)
+        self.staging_directory = os.path.join(self.root, STAGING_DIRECTORY)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.index_path = index_path
+        self._local = threading.local()
+        self._gc_thread: Optional[threading.Thread] = None
+        self._stop_gc = threading.Event()
+        self._wake_gc = threading.Event()
+
+        os.makedirs(self.staging_directory, exist_ok=True)
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "path TEXT PRIMARY KEY, user_id TEXT NOT NULL, size INTEGER NOT NULL, "
+            "sha256 TEXT NOT NULL, created_at REAL NOT NULL, keep_until REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (created_at)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Uma conexão por thread; autocommit, cada comando é uma transação
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.index_path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA busy_timeout=10000")
+            self._local.db = db
+        return db
+
+    def add(self, pdf_path: str, user_id: str, sha256: str, keep_until: float) -> str:
+        """
+        Move o PDF compilado para o seu fragmento e o registra no índice.
+
+        Args:
+            pdf_path (str): PDF gerado em `staging_directory`.
+            user_id (str): Dono do artefato.
+            sha256 (str): Hash do conteúdo, que define o fragmento.
+            keep_until (float): Timestamp até o qual o artefato não pode ser
+                removido (expiração do token de download).
+
+        Returns:
+            str: Caminho relativo a `root`, usado nos tokens de download.
+        """
+        relative_path = f"{sha256[:2]}/{os.path.basename(pdf_path)}"
+        target = os.path.join(self.root, relative_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        db = self._connection()
+        # Registrado antes de mover, para que a coleta de lixo de outro worker
+        # nunca veja o arquivo fora do índice
+        db.execute(
+            "INSERT OR REPLACE INTO artifacts "
+            "(path, user_id, size, sha256, created_at, keep_until) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                relative_path,
+                user_id,
+                os.path.getsize(pdf_path),
+                sha256,
+                time.time(),
+                keep_until,
+            ),
+        )
+        try:
+            os.replace(pdf_path, target)
+        except OSError:
+            db.execute("DELETE FROM artifacts WHERE path = ?", (relative_path,))
+            raise
+        if self.max_bytes is not None and self.total_bytes() > self.max_bytes:
+            self._wake_gc.set()
+        return relative_path
+
+    def resolve(self, relative_path: str) -> Optional[str]:
+        """
+        Converte o caminho de um token de download em um caminho absoluto.
+
+        Returns:
+            str: Caminho dentro de `root`, ou None se o nome apontar para fora
+            dele (ex.: "../config.json") ou para a área de compilação.
+        """
+        path = os.path.realpath(os.path.join(self.root, relative_path))
+        if os.path.commonpath([path, self.root]) != self.root:
+            return None
+        if os.path.commonpath([path, self.staging_directory]) == self.staging_directory:
+            return None
+        return path
+
+    def total_bytes(self) -> int:
+        return (
+            self._connection()
+            .execute("SELECT COALESCE(SUM(size), 0) FROM artifacts")
+            .fetchone()[0]
+        )
+
+    def count(self) -> int:
+        return (
+            self._connection().execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        )
+
+    def usage(self) -> Dict[str, int]:
+        """Quantidade e tamanho total dos PDFs indexados, numa única consulta."""
+        entries, total = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts")
+            .fetchone()
+        )
+        return {"entries": entries, "bytes": total}
+
+    def _delete(self, rows: List[Tuple[str, int]], reason: str) -> None:
+        for relative_path, _ in rows:
+            try:
+                os.remove(os.path.join(self.root, relative_path))
+            except FileNotFoundError:
+                pass
+        self._connection().executemany(
+            "DELETE FROM artifacts WHERE path = ?", [(path,) for path, _ in rows]
+        )
+        artifact_removals.inc(len(rows), reason=reason)
+
+    def _expired(self, now: float) -> List[Tuple[str, int]]:
+        return (
+            self._connection()
+            .execute(
+                "SELECT path, size FROM artifacts "
+                "WHERE created_at < ? AND keep_until < ? LIMIT ?",
+                (now - self.max_age_seconds, now, GC_BATCH_SIZE),
+            )
+            .fetchall()
+        )
+
+    def _oldest(self, now: float) -> List[Tuple[str, int]]:
+        return (
+            self._connection()
+            .execute(
+                "SELECT path, size FROM artifacts WHERE keep_until < ? "
+                "ORDER BY created_at LIMIT ?",
+                (now, GC_BATCH_SIZE),
+            )
+            .fetchall()
+        )
+
+    def _is_indexed(self, relative_path: str) -> bool:
+        return (
+            self._connection()
+            .execute("SELECT 1 FROM artifacts WHERE path = ?", (relative_path,))
+            .fetchone()
+            is not None
+        )
+
+    def _sweep_orphans(self, now: float) -> int:
+        """
+        Remove arquivos antigos fora do índice: PDFs da estrutura plana
+        anterior e compilações interrompidas em `staging_directory`.
+        """
+        db = self._connection()
+        indexed = {path for (path,) in db.execute("SELECT path FROM artifacts")}
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                relative_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if relative_path in indexed:
+                    continue
+                try:
+                    if os.stat(path).st_mtime >= now - self.max_age_seconds:
+                        continue
+                    # Pode ter sido registrado por outro worker depois da leitura
+                    if not self._is_indexed(relative_path):
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            artifact_removals.inc(removed, reason="orphan")
+        return removed
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Aplica os limites de idade e de tamanho.
+
+        Returns:
+            dict: Artefatos removidos por motivo (`age`, `quota` e `orphan`).
+        """
+        now = time.time() if now is None else now
+        removed = {"age": 0, "quota": 0, "orphan": 0}
+
+        if self.max_age_seconds is not None:
+            while rows := self._expired(now):
+                self._delete(rows, "age")
+                removed["age"] += len(rows)
+            removed["orphan"] = self._sweep_orphans(now)
+
+        if self.max_bytes is not None:
+            excess = self.total_bytes() - self.max_bytes
+            while excess > 0:
+                rows = self._oldest(now)
+                if not rows:
+                    # Tudo o que resta tem token de download válido
+                    break
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    excess -= row[1]
+                    if excess <= 0:
+                        break
+                self._delete(batch, "quota")
+                removed["quota"] += len(batch)
+        return removed
+
+    def start_gc(self, interval_seconds: float = 300) -> None:
+        """Inicia a coleta de lixo periódica em segundo plano."""
+        if self._gc_thread is not None:
+            return
+
+        def run() -> None:
+            while not self._stop_gc.is_set():
+                try:
+                    self.collect()
+                except Exception as e:
+                    print("Erro na coleta de lixo dos PDFs gerados:", e)
+                # Acorda antes do intervalo quando um PDF novo excede o limite
+                self._wake_gc.wait(interval_seconds)
+                self._wake_gc.clear()
+
+        self._stop_gc.clear()
+        self._gc_thread = threading.Thread(target=run, name="artifact-gc", daemon=True)
+        self._gc_thread.start()
+
+    def stop_gc(self) -> None:
+        if self._gc_thread is not None:
+            self._stop_gc.set()
+            self._wake_gc.set()
+            self._gc_thread.join()
+            self._gc_thread = None
+
+
+def _create_artifact_store() -> ArtifactStore:
+    config = get_config()
+    max_mb = config["artifact_max_mb"]
+    max_age_hours = config["artifact_max_age_hours"]
+    return ArtifactStore(
+        config["artifact_directory"],
+        config["artifact_index_path"],
+        max_bytes=None if max_mb is None else max_mb * 1024 * 1024,
+        max_age_seconds=None if max_age_hours is None else max_age_hours * 3600,
+    )
+
+
+# Armazenamento dos PDFs gerados, compartilhado pela aplicação
+artifact_store = _create_artifact_store()
+# As consultas ao índice se repetiriam a cada coleta de /metrics
+_artifact_usage = cached(artifact_store.usage, ttl_seconds=15)
+cache_entries.set_function(lambda: _artifact_usage()["entries"], cache="artifacts")
+cache_bytes.set_function(lambda: _artifact_usage()["bytes"], cache="artifacts")
@@ -3,8 +3,14 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from datetime import datetime, timedelta
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
+from config import get_config
+
 load_dotenv()
 
 # Tornar as constantes disponíveis para importação
@@ -13,11 +19,51 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 
+class VerifiedTokenCache:
+    """Claims de tokens já verificados, guardados até a expiração do token.
+
+    Limitado a `max_entries` tokens; os menos usados são descartados primeiro.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def set(self, token: str, claims: Dict[str, Any]) -> None:
+        # Tokens sem "exp" não são guardados: não haveria quando descartá-los
+        if self.max_entries <= 0 or "exp" not in claims:
+            return
+        with self._lock:
+            self._entries[token] = (claims, float(claims["exp"]))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Tokens verificados, compartilhados por todas as instâncias de JWTBearer
+verified_tokens = VerifiedTokenCache(get_config()["jwt_cache_max_entries"])
+
+
 class JWTBearer(HTTPBearer):
+    """Dependência que valida o token Bearer e retorna os claims do JWT."""
+
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
-    async def __call__(self, request: Request):
+    async def __call__(self, request: Request) -> Dict[str, Any]:
         credentials: HTTPAuthorizationCredentials = await super(
             JWTBearer, self
         ).__call__(request)
@@ -32,19 +78,27 @@ class JWTBearer(HTTPBearer):
                 status_code=403, detail="Esquema de autenticação inválido"
             )
 
-        if not self.verify_jwt(credentials.credentials):
+        claims = self.verify_jwt(credentials.credentials)
+        if claims is None:
             raise HTTPException(status_code=403, detail="Token inválido ou expirado")
 
-        return credentials.credentials
+        return claims
 
-    def verify_jwt(self, token: str) -> bool:
+    def verify_jwt(self, token: str) -> Optional[Dict[str, Any]]:
+        """Retorna os claims do token, ou None se for inválido ou expirado."""
+        claims = verified_tokens.get(token)
+        if claims is not None:
+            return dict(claims)
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            return True
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         except jwt.ExpiredSignatureError:
-            return False
+            return None
         except jwt.InvalidTokenError:
-            return False
+            return None
+        if "sub" not in claims:
+            return None
+        verified_tokens.set(token, claims)
+        return dict(claims)
 
 
 def create_access_token(data: dict):
@@ -0,0 +1,242 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+from config import get_config
+from logger import api_logger
+from metrics import in_flight
+from pipeline import compile_pdf, extract_uploaded_pdf, generate_tex, store_document
+from utils import SpooledUpload
+
+# Caracteres aceitos nos nomes dos arquivos dentro do ZIP
+_UNSAFE_ID_CHARACTERS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class BatchItem(NamedTuple):
+    """Item de um lote: identificador, descrição do processo e PDF opcional."""
+
+    id: str
+    question: str
+    pdf: Optional[str] = None
+
+
+def parse_batch_items(data: bytes, filename: Optional[str] = None) -> List[BatchItem]:
+    """
+    Lê a lista de itens de um lote, em JSONL ou CSV.
+
+    Cada item tem `question` (obrigatório), `id` e `pdf` (nome de um dos PDFs
+    enviados junto com o lote). O formato é escolhido pela extensão do
+    arquivo ou, sem extensão conhecida, pelo primeiro caractere.
+
+    Raises:
+        HTTPException: 400 se o arquivo for inválido, 413 se exceder
+            `batch_max_items`.
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Lote deve estar em UTF-8")
+
+    extension = os.path.splitext(filename or "")[1].lower()
+    is_jsonl = extension in (".jsonl", ".ndjson", ".json") or (
+        extension != ".csv" and text.lstrip().startswith("{")
+    )
+
+    rows: List[Dict[str, Any]] = []
+    if is_jsonl:
+        for number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise HTTPException(
+                    status_code=400, detail=f"JSON inválido na linha {number}: {e}"
+                )
+            if not isinstance(row, dict):
+                raise HTTPException(
+                    status_code=400, detail=f"Linha {number} não é um objeto JSON"
+                )
+            rows.append(row)
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    max_items = get_config()["batch_max_items"]
+    if not rows:
+        raise HTTPException(status_code=400, detail="Lote vazio")
+    if len(rows) > max_items:
+        raise HTTPException(
+            status_code=413, detail=f"Lote excede o limite de {max_items} itens"
+        )
+
+    items: List[BatchItem] = []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        question = str(row.get("question") or "").strip()
+        if not question:
+            raise HTTPException(
+                status_code=400, detail=f"Item {number} sem o campo 'question'"
+            )
+        item_id = _UNSAFE_ID_CHARACTERS.sub("_", str(row.get("id") or "").strip())
+        item_id = item_id.strip("._") or f"{number:03d}"
+        if item_id in seen:
+            raise HTTPException(
+                status_code=400, detail=f"Identificador repetido no lote: {item_id}"
+            )
+        seen.add(item_id)
+        items.append(BatchItem(item_id, question, str(row.get("pdf") or "") or None))
+    return items
+
+
+def check_pdf_references(
+    items: List[BatchItem], uploads: Dict[str, SpooledUpload]
+) -> None:
+    """Garante que todo PDF citado pelos itens foi enviado com o lote."""
+    missing = sorted({item.pdf for item in items if item.pdf} - set(uploads))
+    if missing:
+        raise HTTPException(
+            status_code=400, detail=f"PDFs não enviados: {', '.join(missing)}"
+        )
+
+
+class _ZipStream:
+    """Destino de escrita do ZipFile que acumula os bytes até serem enviados.
+
+    Sem tell() e seek(), o zipfile grava cada arquivo com data descriptor,
+    sem voltar ao cabeçalho, e o ZIP pode ser transmitido à medida que é
+    montado.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _add_to_archive(
+    archive: zipfile.ZipFile, item: BatchItem, tex_content: str, pdf_path: str
+) -> None:
+    # PDFs já são comprimidos; só o LaTeX passa pelo deflate
+    archive.write(pdf_path, f"{item.id}.pdf", compress_type=zipfile.ZIP_STORED)
+    archive.writestr(f"{item.id}.tex", tex_content, zipfile.ZIP_DEFLATED)
+    os.remove(pdf_path)
+
+
+def discard_uploads(uploads: Dict[str, SpooledUpload]) -> None:
+    """Remove os PDFs enviados com o lote que ainda estiverem em disco."""
+    for upload in uploads.values():
+        upload.discard()
+
+
+async def run_batch(
+    items: List[BatchItem],
+    uploads: Dict[str, SpooledUpload],
+    user_id: str,
+    bypass_cache: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Gera os POPs do lote em paralelo e transmite um ZIP com os resultados.
+
+    Até `batch_concurrency` itens são processados ao mesmo tempo, sujeitos
+    também aos limites do modelo e do pool de compilação. Cada item entra no
+    ZIP (`<id>.pdf` e `<id>.tex`) assim que termina; o `manifest.json` com o
+    estado de todos os itens fecha o arquivo. Falhas de um item não
+    interrompem os demais.
+
+    Args:
+        items (list): Itens do lote.
+        uploads (dict): PDFs enviados, pelo nome do arquivo; cada um é
+            extraído uma vez, mesmo se citado por vários itens.
+        user_id (str): Usuário que enviou o lote.
+        bypass_cache (bool): Ignora respostas em cache e consulta o modelo.
+
+    Yields:
+        bytes: Partes do arquivo ZIP.
+    """
+    semaphore = asyncio.Semaphore(get_config()["batch_concurrency"])
+    work_directory = tempfile.mkdtemp(prefix="pop_batch_")
+    pdf_texts: Dict[str, asyncio.Future] = {}
+
+    def pdf_text(name: str) -> asyncio.Future:
+        if name not in pdf_texts:
+            pdf_texts[name] = asyncio.ensure_future(extract_uploaded_pdf(uploads[name]))
+        return pdf_texts[name]
+
+    async def process(item: BatchItem):
+        start = time.perf_counter()
+        entry: Dict[str, Any] = {"id": item.id, "question": item.question}
+        files = None
+        async with semaphore:
+            try:
+                text = await asyncio.shield(pdf_text(item.pdf)) if item.pdf else None
+                tex_content = await generate_tex(
+                    item.question, text, bypass_cache=bypass_cache
+                )
+                pdf_path = await compile_pdf(tex_content, work_directory)
+                entry.update(status="done", pdf=f"{item.id}.pdf", tex=f"{item.id}.tex")
+                entry.update(await store_document(user_id, tex_content, item.question))
+                files = (tex_content, pdf_path)
+            except HTTPException as e:
+                entry.update(status="failed", error=e.detail)
+            except Exception as e:
+                api_logger.log_error(e, {"batch_item": item.id, "user_id": user_id})
+                entry.update(status="failed", error=str(e))
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+        return item, entry, files
+
+    tasks = [asyncio.ensure_future(process(item)) for item in items]
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED)
+    manifest: Dict[str, Dict[str, Any]] = {}
+    try:
+        with in_flight.track_inprogress(operation="batch"):
+            for next_done in asyncio.as_completed(tasks):
+                item, entry, files = await next_done
+                if files is not None:
+                    await asyncio.to_thread(_add_to_archive, archive, item, *files)
+                manifest[item.id] = entry
+                data = stream.drain()
+                if data:
+                    yield data
+
+            archive.writestr(
+                "manifest.json",
+                json.dumps(
+                    {
+                        "total": len(items),
+                        "done": sum(e["status"] == "done" for e in manifest.values()),
+                        # Na ordem do arquivo enviado, não na de conclusão
+                        "items": [manifest[item.id] for item in items],
+                    },
+                    ensure_ascii=False,
+                    indent=2,
+                ),
+            )
+            archive.close()
+            yield stream.drain()
+    finally:
+        # Cliente desconectado ou erro: interromper os itens restantes
+        for task in [*tasks, *pdf_texts.values()]:
+            task.cancel()
+        discard_uploads(uploads)
+        shutil.rmtree(work_directory, ignore_errors=True)
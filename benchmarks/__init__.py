@@ -0,0 +1,5 @@
+"""Benchmarks e teste de carga do gerador de POPs.
+
+Rodam com dublês locais do Gemini e do pdflatex, sem acesso à rede; veja a
+seção "Benchmarks" do README.
+"""
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional
+
+# Raiz do repositório, para importar os módulos da aplicação
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_PDFLATEX = os.path.join(REPO_ROOT, "benchmarks", "fake_pdflatex.py")
+
+
+def fake_pop_document(prompt: str, output_chars: int) -> str:
+    """
+    Gera um POP em LaTeX determinístico para o prompt.
+
+    O conteúdo depende do hash do prompt, de modo que perguntas diferentes
+    geram documentos diferentes (sem acertos acidentais no cache de PDFs).
+
+    Args:
+        prompt (str): Prompt recebido pelo modelo.
+        output_chars (int): Tamanho aproximado do documento.
+
+    Returns:
+        str: Resposta com o documento completo entre textos livres.
+    """
+    from latex_format import standard_preamble
+
+    seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    body: List[str] = [rf"\section{{Objetivo {seed[:8]}}}"]
+    step = 0
+    while sum(len(line) + 1 for line in body) < output_chars:
+        if step % 8 == 0:
+            body.append(rf"\section{{Etapa {step // 8 + 1}}}")
+            body.append(r"\begin{itemize}")
+        body.append(rf"\item Verificar o item {seed[step % 56 : step % 56 + 8]}.")
+        if step % 8 == 7:
+            body.append(r"\end{itemize}")
+        step += 1
+    if step % 8:
+        body.append(r"\end{itemize}")
+
+    document = "\n".join(
+        standard_preamble() + [r"\begin{document}"] + body + [r"\end{document}"]
+    )
+    return f"Segue o POP solicitado:\n{document}\nFim."
+
+
+class _Usage:
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = len(prompt) // 4
+        self.cached_content_token_count = 0
+        self.candidates_token_count = len(text) // 4
+
+
+class _Response:
+    def __init__(self, text: str, usage: Optional[_Usage]):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class _Stream:
+    def __init__(self, text: str, usage: _Usage, latency: float, chunk_chars: int):
+        self._chunks = [
+            text[i : i + chunk_chars] for i in range(0, len(text), chunk_chars)
+        ]
+        self._usage = usage
+        self._delay = latency / max(len(self._chunks), 1)
+
+    async def __aiter__(self):
+        for index, chunk in enumerate(self._chunks):
+            await asyncio.sleep(self._delay)
+            last = index == len(self._chunks) - 1
+            yield _Response(chunk, self._usage if last else None)
+
+
+class FakeGenerativeModel:
+    """Dublê de genai.GenerativeModel com latência e tamanho configuráveis."""
+
+    latency = 0.5
+    output_chars = 4000
+    chunk_chars = 64
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    @classmethod
+    def from_cached_content(cls, cached_content: Any) -> "FakeGenerativeModel":
+        return cls()
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **_):
+        text = fake_pop_document(prompt, self.output_chars)
+        usage = _Usage(prompt, text)
+        if stream:
+            return _Stream(text, usage, self.latency, self.chunk_chars)
+        await asyncio.sleep(self.latency)
+        return _Response(text, usage)
+
+
+def install_fake_llm(latency: float, output_chars: int) -> None:
+    """Substitui o modelo do Gemini pelo dublê, antes de importar a aplicação."""
+    import google.generativeai as genai
+
+    FakeGenerativeModel.latency = latency
+    FakeGenerativeModel.output_chars = output_chars
+    genai.GenerativeModel = FakeGenerativeModel
+
+
+def prepare_workdir(config: Dict[str, Any], workdir: Optional[str] = None) -> str:
+    """
+    Cria um diretório de trabalho com o config.json do benchmark.
+
+    A aplicação lê config.json e grava output/, cache/ e logs/ no diretório
+    atual; o benchmark roda isolado nesse diretório.
+
+    Returns:
+        str: Caminho do diretório de trabalho.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="pop_bench_")
+    # app.py monta output/ como diretório estático
+    os.makedirs(os.path.join(workdir, "output"), exist_ok=True)
+    with open(os.path.join(workdir, "config.json"), "w") as file:
+        json.dump(config, file, indent=2)
+
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    # Sem envio de telemetria do guardrails durante as medições
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+    return workdir
+
+
+def repo_config() -> Dict[str, Any]:
+    """Lê o config.json do repositório, se existir."""
+    try:
+        with open(os.path.join(REPO_ROOT, "config.json")) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentil por interpolação linear (fraction entre 0 e 1)."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    """Contagem, média e percentis de uma lista de durações em segundos."""
+    values = list(values)
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else math.nan,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else math.nan,
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]]) -> None:
+    """Imprime um resumo por linha, com as durações em milissegundos."""
+    print(f"\n{title}")
+    print(f"{'':<14}{'n':>7}{'média':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'máx':>10}")
+    for name, stats in rows.items():
+        print(
+            f"{name:<14}{stats['count']:>7}"
+            + "".join(
+                f"{stats[key] * 1000:>10.1f}"
+                for key in ("mean", "p50", "p95", "p99", "max")
+            )
+        )
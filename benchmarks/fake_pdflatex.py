@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Substituto do pdflatex para benchmarks.
+
+Aceita os argumentos usados pela aplicação (-ini, -fmt, -jobname,
+-interaction, -halt-on-error e -no-shell-escape), espera FAKE_PDFLATEX_DELAY
+segundos (padrão 0.05) e grava um PDF mínimo válido com o tamanho do documento
+de entrada.
+
+Para os testes, também simula:
+- um erro com a linha do documento, para cada linha com \\undefined;
+- FAKE_PDFLATEX_RERUNS execuções iniciais que pedem nova execução no log;
+- FAKE_PDFLATEX_SIGNAL: o processo se encerra com esse sinal (ex.: 9), como
+  nos limites de CPU e memória.
+"""
+
+import os
+import sys
+import time
+
+PDF_TEMPLATE = (
+    "%PDF-1.4\n"
+    "1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+    "2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n"
+    "3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >> endobj\n"
+    "% {padding}\n"
+    "trailer << /Root 1 0 R >>\n"
+    "%%EOF\n"
+)
+
+
+def main(argv):
+    options = [arg for arg in argv if arg.startswith("-")]
+    files = [arg for arg in argv if not arg.startswith(("-", "&"))]
+    source = files[-1] if files else "texput.tex"
+
+    jobname = os.path.splitext(os.path.basename(source))[0]
+    for option in options:
+        if option.startswith("-jobname="):
+            jobname = option.split("=", 1)[1]
+
+    with open(source, encoding="utf-8") as file:
+        content = file.read()
+
+    if "-ini" in options:
+        # Geração do formato pré-compilado
+        with open(f"{jobname}.fmt", "wb") as file:
+            file.write(b"FAKEFMT")
+        return 0
+
+    time.sleep(float(os.environ.get("FAKE_PDFLATEX_DELAY", "0.05")))
+    if "FAKE_PDFLATEX_SIGNAL" in os.environ:
+        os.kill(os.getpid(), int(os.environ["FAKE_PDFLATEX_SIGNAL"]))
+
+    # Execuções anteriores no mesmo diretório de trabalho
+    runs_path = f"{jobname}.runs"
+    runs = 0
+    if os.path.exists(runs_path):
+        with open(runs_path) as file:
+            runs = int(file.read())
+    with open(runs_path, "w") as file:
+        file.write(str(runs + 1))
+
+    errors = []
+    for number, line in enumerate(content.splitlines(), start=1):
+        if r"\undefined" in line:
+            errors += ["! Undefined control sequence.", f"l.{number} \\undefined", ""]
+    log = ["This is fake pdfTeX", *errors]
+    if runs < int(os.environ.get("FAKE_PDFLATEX_RERUNS", "0")):
+        log.append(
+            "LaTeX Warning: Label(s) may have changed. "
+            "Rerun to get cross-references right."
+        )
+    with open(f"{jobname}.log", "w", encoding="utf-8") as file:
+        file.write("\n".join(log) + "\n")
+    if errors or r"\end{document}" not in content:
+        return 1
+
+    with open(f"{jobname}.pdf", "w", encoding="latin-1") as file:
+        file.write(PDF_TEMPLATE.format(padding="x" * len(content)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
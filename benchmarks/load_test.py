@@ -0,0 +1,223 @@
+"""Teste de carga de /token, /chat_with_pdf/ e /secure_download.
+
+As requisições passam pela aplicação FastAPI real (middlewares, autenticação,
+validação, compilação e download), via httpx.ASGITransport, com o Gemini
+substituído por um dublê determinístico e, opcionalmente, o pdflatex por
+benchmarks/fake_pdflatex.py.
+
+Exemplo:
+    python -m benchmarks.load_test --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from benchmarks.common import (
+    FAKE_PDFLATEX,
+    install_fake_llm,
+    prepare_workdir,
+    print_table,
+    repo_config,
+    summarize,
+)
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Converte o cabeçalho Server-Timing em durações por etapa, em segundos."""
+    timings: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value) / 1000
+    return timings
+
+
+class LoadTest:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._next = 0
+
+    async def _timed(self, name: str, request):
+        start = time.perf_counter()
+        response = await request
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    async def iteration(self, index: int) -> None:
+        response = await self._timed(
+            "token",
+            self.client.post(
+                "/token",
+                json={"username": self.args.username, "password": self.args.password},
+            ),
+        )
+        if response.status_code != 200:
+            return
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        files = None
+        if self.args.pdf:
+            with open(self.args.pdf, "rb") as file:
+                files = {"pdf_file": ("pop.pdf", file.read(), "application/pdf")}
+        response = await self._timed(
+            "chat_with_pdf",
+            self.client.post(
+                "/chat_with_pdf/",
+                headers=headers,
+                data={"question": f"POP de benchmark número {index}"},
+                files=files,
+            ),
+        )
+        if response.status_code != 200:
+            return
+        for stage, seconds in parse_server_timing(
+            response.headers.get("server-timing")
+        ).items():
+            self.stages[stage].append(seconds)
+
+        download_path = urlparse(response.json()["pdf_path"]).path
+        await self._timed("secure_download", self.client.get(download_path))
+
+    async def worker(self) -> None:
+        while self._next < self.args.requests:
+            index = self._next
+            self._next += 1
+            try:
+                await self.iteration(index)
+            except Exception as e:
+                self.errors["exception"] += 1
+                print(f"Erro na iteração {index}: {e!r}", file=sys.stderr)
+
+    async def run(self) -> float:
+        start = time.perf_counter()
+        await asyncio.gather(*(self.worker() for _ in range(self.args.concurrency)))
+        return time.perf_counter() - start
+
+
+async def main(args) -> Dict:
+    import httpx
+
+    from app import app
+
+    transport = httpx.ASGITransport(app=app)
+    # O ASGITransport não executa o lifespan: iniciado aqui, como no uvicorn
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=None
+    ) as client:
+        if args.warmup:
+            warmup = LoadTest(
+                client, argparse.Namespace(**{**vars(args), "requests": args.warmup})
+            )
+            await warmup.run()
+
+        test = LoadTest(client, args)
+        elapsed = await test.run()
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": args.requests / elapsed,
+        "endpoints": {name: summarize(v) for name, v in test.latencies.items()},
+        "stages": {name: summarize(v) for name, v in test.stages.items()},
+        "errors": dict(test.errors),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.5, help="Latência do dublê (s)"
+    )
+    parser.add_argument(
+        "--output-chars", type=int, default=4000, help="Tamanho do LaTeX gerado"
+    )
+    parser.add_argument(
+        "--compiler",
+        choices=("fake", "real"),
+        default="fake",
+        help="fake_pdflatex.py ou o pdflatex_path do config.json",
+    )
+    parser.add_argument(
+        "--compile-delay", type=float, default=0.05, help="Duração do pdflatex falso"
+    )
+    parser.add_argument(
+        "--latex-queue",
+        type=int,
+        help="Compilações pendentes antes do 503 (padrão: a concorrência)",
+    )
+    parser.add_argument("--pdf", help="PDF enviado junto com cada pergunta")
+    parser.add_argument(
+        "--cache", action="store_true", help="Mantém os caches da aplicação ligados"
+    )
+    parser.add_argument("--username", default="benchmark", help="Criado no users.json")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--workdir", help="Diretório de trabalho (padrão: temporário)")
+    parser.add_argument("--json", help="Grava o resultado em JSON neste arquivo")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.pdf:
+        args.pdf = os.path.abspath(args.pdf)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    config = {
+        "llm_cache_enabled": args.cache,
+        "pdf_cache_enabled": args.cache,
+        "extraction_cache_enabled": args.cache,
+        "latex_max_queue": args.latex_queue or args.concurrency,
+        "log_console": False,
+    }
+    if args.compiler == "fake":
+        config["pdflatex_path"] = FAKE_PDFLATEX
+        os.environ["FAKE_PDFLATEX_DELAY"] = str(args.compile_delay)
+    else:
+        config["pdflatex_path"] = repo_config()["pdflatex_path"]
+    workdir = prepare_workdir(config, args.workdir)
+    install_fake_llm(args.llm_latency, args.output_chars)
+
+    from users import user_store
+
+    user_store.set_password(args.username, args.password)
+
+    # As mensagens de compilação da aplicação não interessam ao relatório
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(main(args))
+
+    print(f"Diretório de trabalho: {workdir}")
+    print(
+        f"{result['requests']} iterações, concorrência {result['concurrency']}: "
+        f"{result['elapsed_seconds']:.2f}s, "
+        f"{result['throughput_per_second']:.2f} iterações/s"
+    )
+    print_table("Latência por endpoint (ms)", result["endpoints"])
+    print_table("Etapas de /chat_with_pdf/ via Server-Timing (ms)", result["stages"])
+    if result["errors"]:
+        print(f"\nErros: {result['errors']}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
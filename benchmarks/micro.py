@@ -0,0 +1,104 @@
+"""Micro-benchmarks das funções do pipeline executadas a cada requisição.
+
+Mede extract_tex_content, ValidTex.validate e extract_text_from_pdf com
+entradas sintéticas de tamanho configurável.
+
+Exemplo:
+    python -m benchmarks.micro --output-chars 20000 --pages 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import timeit
+from typing import Callable, Dict
+
+from benchmarks.common import fake_pop_document, prepare_workdir
+
+
+def synthetic_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """Gera um PDF com texto em todas as páginas."""
+    import fitz
+
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        text = "\n".join(
+            f"Página {number + 1}, linha {line + 1}: verificar o equipamento."
+            for line in range(lines_per_page)
+        )
+        page.insert_text((36, 36), text, fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def measure(function: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    Executa `function` em lotes calibrados e resume o tempo por chamada.
+
+    Returns:
+        dict: Melhor e mediana do tempo por chamada, em segundos.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    per_call = [total / number for total in timer.repeat(repeat, number)]
+    return {
+        "calls": number * repeat,
+        "best": min(per_call),
+        "median": statistics.median(per_call),
+    }
+
+
+def main(args) -> Dict[str, Dict[str, float]]:
+    from Validador_tex import ValidTex
+    from utils import extract_tex_content, extract_text_from_pdf
+
+    response = fake_pop_document("benchmark", args.output_chars)
+    tex_content = extract_tex_content(response)
+    validator = ValidTex()
+    pdf_bytes = synthetic_pdf(args.pages)
+
+    return {
+        "extract_tex_content": measure(
+            lambda: extract_tex_content(response), args.repeat
+        ),
+        "ValidTex.validate": measure(
+            lambda: validator.validate(tex_content, {}), args.repeat
+        ),
+        "extract_text_from_pdf": measure(
+            lambda: extract_text_from_pdf(pdf_bytes), args.repeat
+        ),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--output-chars", type=int, default=4000, help="Tamanho do LaTeX"
+    )
+    parser.add_argument("--pages", type=int, default=20, help="Páginas do PDF")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Grava o resultado em JSON neste arquivo")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    prepare_workdir({"log_console": False})
+
+    results = main(args)
+
+    print(f"{'':<24}{'chamadas':>10}{'melhor (µs)':>14}{'mediana (µs)':>14}")
+    for name, stats in results.items():
+        print(
+            f"{name:<24}{stats['calls']:>10}"
+            f"{stats['best'] * 1e6:>14.1f}{stats['median'] * 1e6:>14.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
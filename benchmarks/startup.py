@@ -0,0 +1,121 @@
+"""Tempo de inicialização de um worker da aplicação.
+
+Cada execução roda em um processo Python novo (como um worker do uvicorn ou
+uma réplica recém-criada pelo autoscaling) e mede, a partir do início do
+processo:
+- import: importação do módulo app (inclui create_app);
+- startup: execução do lifespan até a aplicação aceitar requisições;
+- primeira resposta: GET / respondido pela aplicação.
+
+Exemplo:
+    python -m benchmarks.startup --runs 10 --importtime
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.common import REPO_ROOT, prepare_workdir, print_table, summarize
+
+# Executado em cada processo novo; imprime os tempos em JSON
+CHILD_SCRIPT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo_root!r})
+from app import app
+imported = time.perf_counter()
+
+async def first_request():
+    import httpx
+
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            (await c.get("/")).raise_for_status()
+        return ready, time.perf_counter()
+
+ready, responded = asyncio.run(first_request())
+print(json.dumps({{
+    "import": imported - start,
+    "startup": ready - start,
+    "first_response": responded - start,
+}}))
+"""
+
+
+def run_child(python: str) -> Dict[str, float]:
+    """Mede um processo novo; o tempo do próprio interpretador fica de fora."""
+    script = CHILD_SCRIPT.format(repo_root=REPO_ROOT)
+    output = subprocess.run(
+        [python, "-c", script], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(python: str, top: int) -> List[str]:
+    """Módulos com maior tempo acumulado de importação (python -X importtime)."""
+    stderr = subprocess.run(
+        [
+            python,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys; sys.path.insert(0, {REPO_ROOT!r}); import app",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return [f"{us / 1000:>10.1f} ms  {name}" for us, name in sorted(rows)[-top:][::-1]]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--importtime",
+        type=int,
+        nargs="?",
+        const=15,
+        help="Mostra os N módulos mais lentos de importar (padrão: 15)",
+    )
+    parser.add_argument("--json", help="Grava o resultado em JSON neste arquivo")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    workdir = prepare_workdir({"log_console": False})
+
+    # Uma execução descartada aquece o cache de disco e os arquivos .pyc
+    run_child(sys.executable)
+    runs = [run_child(sys.executable) for _ in range(args.runs)]
+    result = {
+        name: summarize(run[name] for run in runs)
+        for name in ("import", "startup", "first_response")
+    }
+
+    print(f"Diretório de trabalho: {workdir}")
+    print_table(
+        f"Inicialização de um processo novo, {args.runs} execuções (ms)", result
+    )
+    if args.importtime:
+        print("\nImportações mais lentas (tempo acumulado):")
+        print("\n".join(import_profile(sys.executable, args.importtime)))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
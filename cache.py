@@ -0,0 +1,178 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class TieredCache:
+    """Cache LRU em memória com TTL e camada opcional persistida em SQLite.
+
+    A camada em memória guarda até `max_entries` itens e, se `max_bytes` for
+    informado, até esse total de caracteres nos valores. Se `disk_path` for
+    informado, os itens também são gravados em disco e sobrevivem a
+    reinícios; um acerto em disco promove o item de volta para a memória. O
+    disco guarda até `disk_max_entries` itens: a cada gravação, os expirados
+    e, acima do limite, os gravados há mais tempo são removidos.
+
+    Em código assíncrono, use `get_async` e `set_async`, que acessam o disco
+    fora do event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        disk_path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        disk_max_entries: Optional[int] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.expirations = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._total_bytes = 0
+
+        self._db = None
+        # Lock próprio do disco: consultas lentas não travam a camada em memória
+        self._db_lock = threading.Lock()
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_expiry ON entries (expires_at)"
+            )
+            self._db.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Retorna o valor em cache ou None se ausente ou expirado."""
+        now = time.time()
+        value = self._get_from_memory(key, now)
+        if value is None and self._db is not None:
+            value = self._get_from_disk(key, now)
+        if value is None:
+            self._count_miss()
+        return value
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """Como `get`, mas consulta o disco fora do event loop."""
+        now = time.time()
+        value = self._get_from_memory(key, now)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._get_from_disk, key, now)
+        if value is None:
+            self._count_miss()
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Armazena o valor na memória e, se configurado, em disco."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store_in_memory(key, value, expires_at)
+        if self._db is not None:
+            self._set_on_disk(key, value, expires_at)
+
+    async def set_async(self, key: str, value: str) -> None:
+        """Como `set`, mas grava em disco fora do event loop."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store_in_memory(key, value, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_on_disk, key, value, expires_at)
+
+    def _count_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def _get_from_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._forget(key)
+            self.expirations += 1
+            return None
+
+    def _get_from_disk(self, key: str, now: float) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM entries "
+                "WHERE key = ? AND expires_at >= ?",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._store_in_memory(key, row[0], row[1])
+            self.hits += 1
+            self.disk_hits += 1
+        return row[0]
+
+    def _set_on_disk(self, key: str, value: str, expires_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            if self.disk_max_entries is not None:
+                count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                if count > self.disk_max_entries:
+                    # Com o TTL fixo, a menor expiração é a gravação mais antiga
+                    self._db.execute(
+                        "DELETE FROM entries WHERE key IN "
+                        "(SELECT key FROM entries ORDER BY expires_at LIMIT ?)",
+                        (count - self.disk_max_entries,),
+                    )
+                    self.disk_evictions += count - self.disk_max_entries
+            self._db.commit()
+
+    def _store_in_memory(self, key: str, value: str, expires_at: float) -> None:
+        self._forget(key)
+        self._entries[key] = (value, expires_at)
+        self._total_bytes += len(value)
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self._total_bytes > self.max_bytes
+        ):
+            self._forget(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry[0])
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de uso do cache."""
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "expirations": self.expirations,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict
+
+from utils import link_or_copy
+
+
+def normalize_tex(tex_content: str) -> str:
+    """Remove diferenças de espaçamento que não alteram o PDF gerado."""
+    lines = tex_content.replace("\r\n", "\n").split("\n")
+    normalized = "\n".join(line.rstrip() for line in lines).strip()
+    # Várias linhas em branco equivalem a uma única quebra de parágrafo
+    return re.sub(r"\n{3,}", "\n\n", normalized)
+
+
+class CompiledPdfCache:
+    """Cache em disco de PDFs compilados, endereçado pelo hash do LaTeX.
+
+    Os arquivos ficam em `cache_directory`, nomeados pelo hash. Quando o
+    tamanho total passa de `max_bytes`, os PDFs usados há mais tempo são
+    removidos (LRU).
+    """
+
+    def __init__(self, cache_directory: str, max_bytes: int):
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+
+        os.makedirs(cache_directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Reconstrói o índice LRU a partir dos arquivos já em disco."""
+        files = []
+        for name in os.listdir(self.cache_directory):
+            if name.endswith(".pdf"):
+                stat = os.stat(os.path.join(self.cache_directory, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_directory, f"{key}.pdf")
+
+    @staticmethod
+    def make_key(tex_content: str, compiler_config: Dict[str, Any]) -> str:
+        """
+        Calcula a chave do cache para um documento.
+
+        Args:
+            tex_content (str): Código LaTeX do documento.
+            compiler_config (dict): Configuração que influencia a compilação.
+
+        Returns:
+            str: Hash SHA-256 do LaTeX normalizado e da configuração.
+        """
+        normalized = normalize_tex(tex_content)
+        fingerprint = dict(compiler_config)
+        # \today muda o PDF de um dia para o outro
+        if r"\today" in normalized:
+            fingerprint["date"] = date.today().isoformat()
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps(fingerprint, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalized.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str, destination: str) -> bool:
+        """
+        Copia o PDF em cache para `destination`, se existir.
+
+        Returns:
+            bool: True em caso de acerto no cache.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        path = self._path(key)
+        try:
+            link_or_copy(path, destination)
+            os.utime(path)  # Preserva a ordem LRU após reinícios
+            return True
+        except FileNotFoundError:
+            # Arquivo removido por fora do cache
+            with self._lock:
+                self._forget(key)
+                self.hits -= 1
+                self.misses += 1
+            return False
+
+    def put(self, key: str, pdf_path: str) -> None:
+        """Armazena uma cópia do PDF compilado e aplica o limite de tamanho."""
+        size = os.path.getsize(pdf_path)
+        if size > self.max_bytes:
+            return
+
+        temp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        shutil.copyfile(pdf_path, temp_path)
+        os.replace(temp_path, self._path(key))
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = size
+            self._total_bytes += size
+
+            while self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                self.evictions += 1
+                try:
+                    os.remove(self._path(oldest))
+                except FileNotFoundError:
+                    pass
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de uso do cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
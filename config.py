@@ -0,0 +1,88 @@
+import json
+from functools import lru_cache
+from typing import Any, Dict
+
+CONFIG_FILE = "config.json"
+
+# Valores padrão para as chaves opcionais do config.json
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "llm_model": "gemini-1.5-flash",
+    "llm_max_concurrency": 32,  # Chamadas simultâneas ao Gemini por worker
+    "llm_timeout_seconds": 120,
+    "llm_context_cache": False,  # Cache da persona no provedor (Gemini caching)
+    "llm_context_cache_ttl_seconds": 3600,
+    "llm_provider": "gemini",  # "gemini", "http" ou "fake"
+    "llm_http_url": None,  # Endpoint do provedor "http"
+    "llm_fallback_models": [],  # Modelos usados se o principal falhar ou esgotar
+    "llm_hedge_delay_seconds": None,  # Segundo pedido após esse tempo (None = não)
+    "llm_retry_attempts": 2,  # Novas tentativas por modelo em falhas transitórias
+    "llm_retry_base_delay_seconds": 0.5,
+    "llm_attempt_timeout_seconds": None,  # Limite de cada tentativa (None = sem)
+    "latex_max_workers": None,  # None = número de núcleos da máquina
+    "latex_max_queue": None,  # None = 4 compilações pendentes por worker
+    "latex_timeout_seconds": 60,  # Tempo máximo de cada execução do pdflatex
+    "latex_cpu_seconds": 30,  # Limite de CPU do pdflatex (Linux; None = sem)
+    "latex_memory_mb": 1024,  # Limite de memória do pdflatex (Linux; None = sem)
+    "latex_max_runs": 3,  # Execuções para estabilizar referências (LastPage)
+    "artifact_directory": "output",  # PDFs gerados, em subdiretórios pelo hash
+    "artifact_index_path": "data/artifacts.sqlite3",  # Dono e data de cada PDF
+    "artifact_max_mb": 2048,  # Tamanho máximo dos PDFs gerados (None = sem)
+    "artifact_max_age_hours": 24,  # Idade máxima dos PDFs gerados (None = sem)
+    "artifact_gc_interval_seconds": 300,
+    "pdf_cache_enabled": True,
+    "pdf_cache_directory": "cache/pdf",
+    "pdf_cache_max_mb": 256,
+    "latex_format_enabled": True,
+    "latex_format_directory": "cache/fmt",
+    "max_upload_mb": 20,
+    "batch_max_items": 100,  # Itens aceitos por lote em /batch/chat_with_pdf/
+    "batch_concurrency": 4,  # Itens de um lote processados ao mesmo tempo
+    "pdf_max_pages": 300,
+    "llm_input_token_budget": 16000,  # Tokens do prompt; POPs maiores são resumidos
+    "llm_input_token_budgets": {},  # Por modelo, ex.: {"gemini-1.5-pro": 64000}
+    "pdf_chunk_tokens": 4000,  # Tamanho de cada trecho resumido
+    "pdf_summary_max_chunks": 16,  # Trechos mais relevantes resumidos por POP
+    "pdf_pages_per_task": 16,  # Páginas extraídas por tarefa do pool
+    "pdf_extract_workers": None,  # None = número de núcleos da máquina
+    "extraction_cache_enabled": True,
+    "extraction_cache_max_entries": 128,
+    "extraction_cache_max_mb": 64,
+    "extraction_cache_ttl_seconds": 86400,
+    "extraction_cache_disk_path": None,  # Ex.: "cache/extraction.sqlite3"
+    "extraction_cache_disk_max_entries": 1024,  # Textos mantidos em disco
+    "document_store_path": "data/documents.sqlite3",  # LaTeX gerado e versões
+    "users_file": "users.json",  # Usuários e hashes de senha (python users.py)
+    "jwt_cache_max_entries": 1024,  # Tokens JWT verificados mantidos em memória
+    "download_token_store": "memory",  # "sqlite:///arquivo.db" ou "redis://host:6379/0"
+    "download_token_ttl_minutes": 5,
+    "download_sweep_interval_seconds": 60,
+    "llm_cache_enabled": True,
+    "llm_cache_max_entries": 256,
+    "llm_cache_ttl_seconds": 86400,
+    "llm_cache_disk_path": None,  # Ex.: "cache/llm.sqlite3" para persistir
+    "llm_cache_disk_max_entries": 4096,  # Respostas mantidas em disco
+    "log_request_sample_rate": 1.0,  # Fração das requisições com sucesso logadas
+    "log_console": True,  # Repete o log da API no console
+    "log_queue_max_records": 10000,  # Registros na fila; além disso são descartados
+    "profiling_sample_rate": 0.0,  # Fração das requisições perfiladas
+    "profiling_token": None,  # Valor do cabeçalho X-Profile-Token que ativa o perfil
+    "profiling_interval_ms": 5,
+    "profiling_directory": "logs/profiles",
+}
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Dict[str, Any]:
+    """
+    Lê o arquivo de configuração uma única vez e completa com os valores padrão.
+
+    Returns:
+        dict: Configuração efetiva da aplicação.
+    """
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(CONFIG_FILE, "r") as config_file:
+            config.update(json.load(config_file))
+    except FileNotFoundError as e:
+        print("Aviso: Arquivo de configuração não encontrado.", e)
+    return config
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_config
+
+
+class VersionConflictError(Exception):
+    """A versão base da edição não é mais a última versão do documento."""
+
+    def __init__(self, latest_version: int):
+        super().__init__(f"Documento já está na versão {latest_version}")
+        self.latest_version = latest_version
+
+
+class DocumentStore:
+    """Códigos LaTeX gerados, com um histórico de versões por documento.
+
+    Cada geração cria um documento (versão 1) e cada edição acrescenta uma
+    versão. O SQLite em modo WAL permite que vários workers compartilhem o
+    mesmo arquivo.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, "
+            "latest_version INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS document_versions ("
+            "document_id TEXT NOT NULL, version INTEGER NOT NULL, "
+            "tex TEXT NOT NULL, sha256 TEXT NOT NULL, instruction TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (document_id, version))"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Uma conexão por thread; autocommit, transações explícitas com BEGIN
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA busy_timeout=10000")
+            self._local.db = db
+        return db
+
+    def _insert_version(
+        self,
+        db: sqlite3.Connection,
+        document_id: str,
+        version: int,
+        tex: str,
+        instruction: str,
+        now: float,
+    ) -> None:
+        db.execute(
+            "INSERT INTO document_versions "
+            "(document_id, version, tex, sha256, instruction, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                document_id,
+                version,
+                tex,
+                hashlib.sha256(tex.encode("utf-8")).hexdigest(),
+                instruction,
+                now,
+            ),
+        )
+
+    def create(self, user_id: str, tex: str, instruction: str) -> Tuple[str, int]:
+        """
+        Armazena um documento novo.
+
+        Args:
+            user_id (str): Dono do documento.
+            tex (str): Código LaTeX validado.
+            instruction (str): Pergunta que originou o documento.
+
+        Returns:
+            tuple: Id do documento e versão (sempre 1).
+        """
+        document_id = uuid.uuid4().hex
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT INTO documents "
+                "(id, user_id, latest_version, created_at, updated_at) "
+                "VALUES (?, ?, 1, ?, ?)",
+                (document_id, user_id, now, now),
+            )
+            self._insert_version(db, document_id, 1, tex, instruction, now)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return document_id, 1
+
+    def add_version(
+        self, document_id: str, tex: str, instruction: str, base_version: int
+    ) -> int:
+        """
+        Acrescenta uma versão editada a partir de `base_version`.
+
+        Returns:
+            int: Número da nova versão.
+
+        Raises:
+            VersionConflictError: Outra edição já criou uma versão depois de
+                `base_version`.
+        """
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Só avança se ninguém tiver editado desde a versão base
+            updated = db.execute(
+                "UPDATE documents SET latest_version = latest_version + 1, "
+                "updated_at = ? WHERE id = ? AND latest_version = ?",
+                (now, document_id, base_version),
+            ).rowcount
+            if not updated:
+                row = db.execute(
+                    "SELECT latest_version FROM documents WHERE id = ?",
+                    (document_id,),
+                ).fetchone()
+                raise VersionConflictError(row[0] if row else 0)
+            version = base_version + 1
+            self._insert_version(db, document_id, version, tex, instruction, now)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return version
+
+    def get(
+        self, document_id: str, user_id: str, version: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Retorna uma versão do documento (a última, por padrão).
+
+        Documentos de outros usuários são tratados como inexistentes.
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT v.version, v.tex, v.sha256, v.instruction, v.created_at, "
+                "d.latest_version FROM documents d JOIN document_versions v "
+                "ON v.document_id = d.id AND v.version = COALESCE(?, d.latest_version) "
+                "WHERE d.id = ? AND d.user_id = ?",
+                (version, document_id, user_id),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return {
+            "document_id": document_id,
+            "version": row[0],
+            "tex": row[1],
+            "sha256": row[2],
+            "instruction": row[3],
+            "created_at": row[4],
+            "latest_version": row[5],
+        }
+
+    def versions(self, document_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """Lista as versões do documento, sem o código LaTeX."""
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT v.version, v.sha256, v.instruction, v.created_at "
+                "FROM document_versions v JOIN documents d ON d.id = v.document_id "
+                "WHERE d.id = ? AND d.user_id = ? ORDER BY v.version",
+                (document_id, user_id),
+            )
+            .fetchall()
+        )
+        return [
+            {"version": r[0], "sha256": r[1], "instruction": r[2], "created_at": r[3]}
+            for r in rows
+        ]
+
+
+# Documentos gerados, compartilhados pela aplicação
+document_store = DocumentStore(get_config()["document_store_path"])
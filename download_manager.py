@@ -1,38 +1,418 @@
+import heapq
+import json
 import os
+import re
 import secrets
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
+from config import get_config
+
+
+class TokenStore:
+    """Interface dos armazenamentos de tokens de download.
+
+    Os tempos de expiração são timestamps Unix, para que vários processos
+    possam compartilhar o mesmo armazenamento.
+    """
+
+    def add(self, token: str, data: Dict[str, Any], expires_at: float) -> None:
+        raise NotImplementedError
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Retorna os dados do token, se válido, sem removê-lo."""
+        raise NotImplementedError
+
+    def consume(self, token: str) -> Optional[Dict[str, Any]]:
+        """Remove o token e retorna seus dados, de forma atômica, se válido."""
+        raise NotImplementedError
+
+    def sweep(self, now: float) -> int:
+        """Remove os tokens expirados e retorna quantos foram removidos."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryTokenStore(TokenStore):
+    """Tokens em memória, com um heap ordenado pela expiração.
+
+    Só serve a um processo; com vários workers use SQLite ou Redis.
+    """
 
-class DownloadManager:
     def __init__(self):
-        self._download_tokens: Dict[str, Dict] = {}
+        self._tokens: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
 
-    def create_download_token(self, filename: str, user_id: str) -> str:
-        """Cria um token único para download."""
-        token = secrets.token_urlsafe(32)
-        expiry = datetime.utcnow() + timedelta(minutes=5)  # Token válido por 5 minutos
+    def add(self, token: str, data: Dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            self._tokens[token] = (data, expires_at)
+            heapq.heappush(self._expiry_heap, (expires_at, token))
 
-        self._download_tokens[token] = {
-            "filename": filename,
-            "user_id": user_id,
-            "expiry": expiry,
-        }
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        entry = self._tokens.get(token)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def consume(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._tokens.pop(token, None)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def sweep(self, now: float) -> int:
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < now:
+                expires_at, token = heapq.heappop(self._expiry_heap)
+                # Tokens já consumidos deixam entradas antigas no heap
+                entry = self._tokens.get(token)
+                if entry is not None and entry[1] == expires_at:
+                    del self._tokens[token]
+                    removed += 1
+        return removed
+
+    def count(self) -> int:
+        return len(self._tokens)
 
-        return token
 
-    def validate_token(self, token: str) -> Optional[str]:
-        """Valida o token e retorna o nome do arquivo se válido."""
-        if token not in self._download_tokens:
+class SqliteTokenStore(TokenStore):
+    """Tokens em um arquivo SQLite (modo WAL) compartilhado entre workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS download_tokens ("
+            "token TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS download_tokens_expiry "
+            "ON download_tokens (expires_at)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Uma conexão por thread; autocommit, cada comando é uma transação
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA busy_timeout=10000")
+            self._local.db = db
+        return db
+
+    def add(self, token: str, data: Dict[str, Any], expires_at: float) -> None:
+        self._connection().execute(
+            "INSERT INTO download_tokens (token, data, expires_at) VALUES (?, ?, ?)",
+            (token, json.dumps(data), expires_at),
+        )
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT data FROM download_tokens "
+                "WHERE token = ? AND expires_at >= ?",
+                (token, time.time()),
+            )
+            .fetchone()
+        )
+        return None if row is None else json.loads(row[0])
+
+    def consume(self, token: str) -> Optional[Dict[str, Any]]:
+        # DELETE ... RETURNING garante que só um worker consome o token
+        row = (
+            self._connection()
+            .execute(
+                "DELETE FROM download_tokens WHERE token = ? "
+                "RETURNING data, expires_at",
+                (token,),
+            )
+            .fetchone()
+        )
+        if row is None or row[1] < time.time():
             return None
+        return json.loads(row[0])
+
+    def sweep(self, now: float) -> int:
+        cursor = self._connection().execute(
+            "DELETE FROM download_tokens WHERE expires_at < ?", (now,)
+        )
+        return cursor.rowcount
+
+    def count(self) -> int:
+        return (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM download_tokens")
+            .fetchone()[0]
+        )
+
+
+class RedisError(Exception):
+    pass
+
+
+class _RespConnection:
+    """Cliente mínimo do protocolo Redis (RESP), sem dependências externas."""
+
+    def __init__(self, host: str, port: int, db: int = 0, password=None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self.host, self.port), timeout=5)
+        self._reader = self._socket.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def _close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+        self._socket = None
+        self._reader = None
+
+    def _call(self, *args: Any) -> Any:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            value = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+        self._socket.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Conexão com o Redis encerrada")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RedisError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Resposta inválida do Redis: {line!r}")
+
+    def execute(self, *args: Any) -> Any:
+        """Envia um comando, reconectando uma vez se a conexão caiu."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    return self._call(*args)
+                except (ConnectionError, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
 
-        token_data = self._download_tokens[token]
+class RedisTokenStore(TokenStore):
+    """Tokens em um servidor compatível com o protocolo Redis.
 
-        if datetime.utcnow() > token_data["expiry"]:
-            del self._download_tokens[token]
+    Cada token é uma chave com expiração própria (PX); um sorted set ordenado
+    pela expiração serve de índice para a limpeza e a contagem.
+    """
+
+    def __init__(self, url: str, prefix: str = "pops:download:"):
+        parsed = urlparse(url)
+        self.prefix = prefix
+        self._index = f"{prefix}expiry"
+        self._redis = _RespConnection(
+            parsed.hostname or "localhost",
+            parsed.port or 6379,
+            int(parsed.path.lstrip("/") or 0),
+            parsed.password,
+        )
+
+    def add(self, token: str, data: Dict[str, Any], expires_at: float) -> None:
+        ttl_ms = max(1, int((expires_at - time.time()) * 1000))
+        self._redis.execute("SET", self.prefix + token, json.dumps(data), "PX", ttl_ms)
+        self._redis.execute("ZADD", self._index, repr(expires_at), token)
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        value = self._redis.execute("GET", self.prefix + token)
+        return None if value is None else json.loads(value)
+
+    def consume(self, token: str) -> Optional[Dict[str, Any]]:
+        # GETDEL é atômico: só um worker recebe o valor
+        value = self._redis.execute("GETDEL", self.prefix + token)
+        self._redis.execute("ZREM", self._index, token)
+        if value is None:
             return None
+        return json.loads(value)
+
+    def sweep(self, now: float) -> int:
+        # As chaves expiram sozinhas; aqui só o índice é limpo
+        return self._redis.execute("ZREMRANGEBYSCORE", self._index, "-inf", repr(now))
+
+    def count(self) -> int:
+        return self._redis.execute("ZCARD", self._index)
+
+
+def create_token_store(url: str) -> TokenStore:
+    """
+    Cria o armazenamento de tokens a partir da configuração.
+
+    Args:
+        url (str): "memory", "sqlite:///caminho/arquivo.db" ou
+            "redis://host:porta/db".
+
+    Returns:
+        TokenStore: Armazenamento correspondente.
+    """
+    if url.startswith("redis://"):
+        return RedisTokenStore(url)
+    if url.startswith("sqlite://"):
+        return SqliteTokenStore(url[len("sqlite:///") :])
+    if url == "memory":
+        return MemoryTokenStore()
+    raise ValueError(f"Armazenamento de tokens desconhecido: {url}")
+
+
+class DownloadManager:
+    def __init__(self, store: Optional[TokenStore] = None, ttl_minutes: float = 5):
+        self._store = store or MemoryTokenStore()
+        self.ttl_seconds = ttl_minutes * 60
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_sweeper = threading.Event()
+
+    def create_download_token(
+        self, filename: str, user_id: str, sha256: Optional[str] = None
+    ) -> str:
+        """Cria um token único para download.
+
+        O SHA-256 do PDF, se informado, vira o ETag das respostas.
+        """
+        token = secrets.token_urlsafe(32)
+        expires_at = time.time() + self.ttl_seconds
+
+        data = {"filename": filename, "user_id": user_id}
+        if sha256:
+            data["sha256"] = sha256
+        self._store.add(token, data, expires_at)
+
+        return token
+
+    def get_download(self, token: str) -> Optional[Dict[str, Any]]:
+        """Retorna os dados do download sem consumir o token.
+
+        O token continua válido até expirar ou até um download completo, para
+        que downloads interrompidos possam ser retomados com Range.
+        """
+        return self._store.get(token)
+
+    def consume_token(self, token: str) -> None:
+        """Invalida o token depois que o arquivo foi entregue por inteiro."""
+        self._store.consume(token)
+
+    def sweep_expired(self) -> int:
+        """Remove os tokens expirados que nunca foram usados."""
+        return self._store.sweep(time.time())
+
+    def start_sweeper(self, interval_seconds: float = 60) -> None:
+        """Inicia a limpeza periódica dos tokens expirados em segundo plano."""
+        if self._sweeper is not None:
+            return
+
+        def run() -> None:
+            while not self._stop_sweeper.wait(interval_seconds):
+                try:
+                    self.sweep_expired()
+                except Exception as e:
+                    print("Erro ao remover tokens de download expirados:", e)
+
+        self._stop_sweeper.clear()
+        self._sweeper = threading.Thread(
+            target=run, name="download-token-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            self._stop_sweeper.set()
+            self._sweeper.join()
+            self._sweeper = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara o cabeçalho If-None-Match com o ETag (comparação fraca)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+# Um intervalo de bytes: "início-fim", "início-" ou o sufixo "-N"
+_RANGE_SPEC = re.compile(r"([0-9]+)-([0-9]*)|-([0-9]+)")
+
+
+def range_reaches_end(range_header: Optional[str], file_size: int) -> bool:
+    """
+    Indica se a resposta a um pedido com Range inclui o último byte do arquivo.
+
+    Sem Range, o arquivo inteiro é enviado. Um Range inválido ou que não
+    possa ser atendido não completa o download.
+    """
+    if range_header is None:
+        return True
+    unit, separator, ranges = range_header.partition("=")
+    if not separator or unit.strip().lower() != "bytes":
+        return False
+    reaches_end = False
+    for spec in ranges.split(","):
+        match = _RANGE_SPEC.fullmatch(spec.strip())
+        if match is None:
+            return False
+        start, end, suffix = match.groups()
+        if suffix is not None:
+            # Sufixo (bytes=-N): os últimos N bytes
+            if int(suffix) == 0 or file_size == 0:
+                return False
+            reaches_end = True
+        elif int(start) >= file_size or (end and int(end) < int(start)):
+            return False
+        elif not end or int(end) >= file_size - 1:
+            reaches_end = True
+    return reaches_end
+
+
+def _create_download_manager() -> DownloadManager:
+    config = get_config()
+    return DownloadManager(
+        create_token_store(config["download_token_store"]),
+        ttl_minutes=config["download_token_ttl_minutes"],
+    )
+
 
-        # Token válido - remover após uso
-        filename = token_data["filename"]
-        del self._download_tokens[token]
-        return filename
+# Instância global do gerenciador de downloads
+download_manager = _create_download_manager()
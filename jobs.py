@@ -0,0 +1,183 @@
+import asyncio
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
+
+from fastapi import HTTPException
+
+from logger import api_logger
+from metrics import in_flight
+
+# Eventos que encerram o stream de um job
+TERMINAL_EVENTS = ("done", "failed", "cancelled")
+
+
+class Job:
+    """Estado de uma geração de POP executada em segundo plano."""
+
+    def __init__(self, user_id: str):
+        self.id = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.stage: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        # Mensagem do erro, ou o detalhe estruturado (ex.: erros do LaTeX)
+        self.error: Optional[Union[str, Dict[str, Any]]] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.events: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_EVENTS
+
+    def publish(self, event: str, **data: Any) -> None:
+        """Registra um evento e o repassa aos assinantes do stream."""
+        payload = {
+            "event": event,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "status": self.status,
+            "stage": self.stage,
+            **data,
+        }
+        self.events.append(payload)
+        for queue in self._subscribers:
+            queue.put_nowait(payload)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """Reenvia os eventos já ocorridos e acompanha os novos até o fim."""
+        # A fila só recebe eventos posteriores ao snapshot do histórico
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        history = list(self.events)
+        try:
+            for payload in history:
+                yield payload
+            if history and history[-1]["event"] in TERMINAL_EVENTS:
+                return
+            while True:
+                payload = await queue.get()
+                yield payload
+                if payload["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+
+class JobManager:
+    def __init__(self, ttl_minutes: int = 30):
+        self._jobs: Dict[str, Job] = {}
+        self._ttl = timedelta(minutes=ttl_minutes)
+
+    def _purge_expired(self) -> None:
+        """Remove os jobs concluídos há mais tempo que o TTL."""
+        now = datetime.now(timezone.utc)
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self._ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def create_job(
+        self,
+        user_id: str,
+        run: Callable[[Callable[[str], None]], Awaitable[Dict[str, Any]]],
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """
+        Cria um job e inicia sua execução em segundo plano.
+
+        Args:
+            user_id (str): Usuário dono do job.
+            run (callable): Recebe o callback de etapas e executa o pipeline.
+            cleanup (callable, optional): Executado ao fim do job, mesmo se ele
+                for cancelado antes de começar (ex.: remover o PDF enviado).
+
+        Returns:
+            Job: Job criado.
+        """
+        self._purge_expired()
+
+        job = Job(user_id)
+        self._jobs[job.id] = job
+        job.publish("queued")
+        job.task = asyncio.create_task(self._run(job, run))
+        job.task.add_done_callback(lambda _: self._finish(job, cleanup))
+        return job
+
+    def _finish(self, job: Job, cleanup: Optional[Callable[[], None]]) -> None:
+        if not job.finished:
+            # Cancelado ainda na fila: _run não chegou a publicar o evento final
+            job.status = "cancelled"
+            job.error = "Job cancelado"
+            job.finished_at = datetime.now(timezone.utc)
+            job.publish("cancelled", error=job.error)
+        if cleanup is not None:
+            cleanup()
+
+    async def _run(self, job: Job, run) -> None:
+        def on_stage(stage: str) -> None:
+            job.stage = stage
+            job.publish("stage")
+
+        job.status = "running"
+        in_flight.inc(operation="job")
+        try:
+            job.result = await run(on_stage)
+            job.status = "done"
+        except asyncio.CancelledError:
+            # Sem o evento final, os assinantes do stream esperariam para sempre
+            job.status = "cancelled"
+            job.error = "Job cancelado"
+            job.publish("cancelled", error=job.error)
+            raise
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = e.detail
+            api_logger.log_error(e, {"job_id": job.id, "stage": job.stage})
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            api_logger.log_error(e, {"job_id": job.id, "stage": job.stage})
+        finally:
+            in_flight.dec(operation="job")
+            job.finished_at = datetime.now(timezone.utc)
+
+        if job.status == "done":
+            job.publish("done", result=job.result)
+        else:
+            job.publish("failed", error=job.error)
+
+    async def cancel_all(self) -> None:
+        """Cancela os jobs em execução e aguarda o evento final de cada um."""
+        tasks = [job.task for job in self._jobs.values() if not job.finished]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_job(self, job_id: str, user_id: str) -> Optional[Job]:
+        """Retorna o job se existir e pertencer ao usuário."""
+        self._purge_expired()
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+
+# Instância global do gerenciador de jobs
+job_manager = JobManager()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+
+from compile_cache import CompiledPdfCache
+from config import get_config
+from metrics import in_flight, register_cache, track_stage
+from utils import PDFLATEX_ARGS, compile_latex
+
+
+class LatexCompiler:
+    """Pool limitado de compilações LaTeX, com fila e back-pressure.
+
+    Cada compilação roda o pdflatex em um processo próprio, disparado a partir
+    de um pool de threads do tamanho do número de núcleos, sem bloquear o
+    event loop. Quando a fila está cheia, novas compilações são recusadas com
+    503 em vez de se acumularem indefinidamente.
+
+    Antes de ocupar um worker, o cache de PDFs compilados é consultado; um
+    acerto devolve o PDF sem executar o pdflatex.
+    """
+
+    def __init__(
+        self, max_workers: Optional[int] = None, max_queue: Optional[int] = None
+    ):
+        config = get_config()
+        self.max_workers = (
+            max_workers or config["latex_max_workers"] or os.cpu_count() or 1
+        )
+        self.max_queue = max_queue or config["latex_max_queue"] or self.max_workers * 4
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="pdflatex"
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.cache = None
+        if config["pdf_cache_enabled"]:
+            self.cache = CompiledPdfCache(
+                config["pdf_cache_directory"],
+                config["pdf_cache_max_mb"] * 1024 * 1024,
+            )
+
+    @property
+    def pending(self) -> int:
+        """Compilações em execução ou aguardando um worker livre."""
+        return self._pending
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def compile(self, tex_content: str, output_directory: str) -> Optional[str]:
+        """
+        Agenda a compilação no pool e aguarda o resultado.
+
+        Args:
+            tex_content (str): Código LaTeX a ser compilado.
+            output_directory (str): Diretório onde o PDF será salvo.
+
+        Returns:
+            str: Caminho do PDF gerado, ou None se o pdflatex não puder ser
+            executado.
+
+        Raises:
+            LatexCompileError: Se o documento não compilar.
+        """
+        with track_stage("compile"):
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self.cache.make_key(tex_content, self._compiler_config())
+                pdf_file = os.path.join(output_directory, f"pop_{uuid.uuid4().hex}.pdf")
+                # O cache copia arquivos em disco, fora do event loop
+                if await asyncio.to_thread(self.cache.get, cache_key, pdf_file):
+                    return pdf_file
+
+            with self._lock:
+                if self._pending >= self.max_queue:
+                    raise HTTPException(
+                        status_code=503,
+                        detail=(
+                            "Fila de compilação cheia. Tente novamente em instantes."
+                        ),
+                        headers={"Retry-After": "5"},
+                    )
+                self._pending += 1
+
+            # O contador só é liberado quando o pdflatex termina de fato, mesmo que
+            # a requisição que o disparou seja cancelada antes disso
+            future = self._executor.submit(compile_latex, tex_content, output_directory)
+            future.add_done_callback(self._release)
+            pdf_path = await asyncio.wrap_future(future)
+
+            if pdf_path and cache_key is not None:
+                await asyncio.to_thread(self.cache.put, cache_key, pdf_path)
+            return pdf_path
+
+    @staticmethod
+    def _compiler_config() -> dict:
+        """Parte da configuração que influencia o PDF gerado."""
+        return {
+            "pdflatex_path": get_config().get("pdflatex_path"),
+            "args": PDFLATEX_ARGS,
+            "max_runs": get_config()["latex_max_runs"],
+        }
+
+    def shutdown(self) -> None:
+        """Encerra o pool, aguardando as compilações em andamento."""
+        self._executor.shutdown(wait=True)
+
+
+# Instância global do compilador
+latex_compiler = LatexCompiler()
+in_flight.set_function(lambda: latex_compiler.pending, operation="latex")
+if latex_compiler.cache is not None:
+    register_cache("compiled_pdf", latex_compiler.cache)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+
+from config import get_config
+from personas import PERSONA_DESCRIPTION_GERAPOP
+
+
+def _normalize(line: str) -> str:
+    """Remove comentários e espaços para comparar linhas do preâmbulo."""
+    line = re.sub(r"(?<!\\)%.*$", "", line)
+    return re.sub(r"\s+", "", line)
+
+
+def standard_preamble() -> List[str]:
+    """
+    Extrai o \\documentclass e os \\usepackage do modelo <padrao> da persona.
+
+    Returns:
+        list: Linhas do preâmbulo que vão para o formato pré-compilado.
+    """
+    template = PERSONA_DESCRIPTION_GERAPOP.split("<padrao>", 1)[1]
+    lines = [line.strip() for line in template.splitlines()]
+
+    start = next(
+        i for i, line in enumerate(lines) if line.startswith(r"\documentclass")
+    )
+    preamble = [lines[start]]
+    for line in lines[start + 1 :]:
+        if line.startswith(r"\usepackage"):
+            preamble.append(line)
+        elif line:
+            break
+    return preamble
+
+
+class LatexFormat:
+    """Formato (.fmt) pré-compilado com o preâmbulo padrão dos POPs.
+
+    Carregar os pacotes do preâmbulo consome boa parte de cada execução do
+    pdflatex. Documentos que começam com o mesmo \\documentclass e carregam os
+    mesmos pacotes são compilados a partir do formato, sem essas linhas.
+    """
+
+    def __init__(self, format_directory: str, preamble: List[str]):
+        self.format_directory = format_directory
+        self.preamble = preamble
+        self._normalized = [_normalize(line) for line in preamble]
+
+        digest = hashlib.sha256("\n".join(self._normalized).encode("utf-8"))
+        self.name = f"pop_{digest.hexdigest()[:12]}"
+        self.path = os.path.join(format_directory, f"{self.name}.fmt")
+
+        self._lock = threading.Lock()
+        self._failed = False
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def build(self, pdflatex_path: str) -> bool:
+        """
+        Gera o arquivo .fmt, se ainda não existir.
+
+        Returns:
+            bool: True se o formato estiver disponível.
+        """
+        with self._lock:
+            if self.available:
+                return True
+            if self._failed:
+                return False
+
+            os.makedirs(self.format_directory, exist_ok=True)
+            build_directory = tempfile.mkdtemp(prefix="pop_fmt_")
+            try:
+                with open(
+                    os.path.join(build_directory, "preamble.tex"), "w", encoding="utf-8"
+                ) as file:
+                    file.write("\n".join(self.preamble) + "\n\\dump\n")
+
+                subprocess.run(
+                    [
+                        pdflatex_path,
+                        "-ini",
+                        "-interaction=nonstopmode",
+                        f"-jobname={self.name}",
+                        "&pdflatex",
+                        "preamble.tex",
+                    ],
+                    cwd=build_directory,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=get_config()["latex_timeout_seconds"],
+                    check=True,
+                )
+                shutil.move(
+                    os.path.join(build_directory, f"{self.name}.fmt"), self.path
+                )
+                print(f"Formato LaTeX gerado com sucesso: {self.path}")
+                return True
+            except (subprocess.SubprocessError, OSError) as e:
+                # Não tentar novamente a cada compilação
+                self._failed = True
+                print("Erro ao gerar o formato LaTeX pré-compilado:", e)
+                return False
+            finally:
+                shutil.rmtree(build_directory, ignore_errors=True)
+
+    def strip_preamble(self, tex_content: str) -> Optional[str]:
+        """
+        Remove do documento as linhas já contidas no formato.
+
+        O documento é compatível se a primeira linha útil for o mesmo
+        \\documentclass e o bloco de \\usepackage logo em seguida contiver todos
+        os pacotes do formato. Pacotes extras do documento são mantidos.
+
+        Returns:
+            str: Documento sem as linhas do formato, ou None se incompatível.
+        """
+        lines = tex_content.splitlines()
+        index = 0
+        while index < len(lines) and not _normalize(lines[index]):
+            index += 1
+        if index == len(lines) or _normalize(lines[index]) != self._normalized[0]:
+            return None
+
+        remaining = set(self._normalized[1:])
+        kept: List[str] = []
+        index += 1
+        while index < len(lines):
+            normalized = _normalize(lines[index])
+            if normalized and not normalized.startswith(r"\usepackage"):
+                break
+            if normalized in remaining:
+                remaining.discard(normalized)
+            else:
+                kept.append(lines[index])
+            index += 1
+
+        if remaining:
+            return None
+        return "\n".join(kept + lines[index:]) + "\n"
+
+    def prepare(self, tex_content: str) -> Tuple[str, Optional[str]]:
+        """
+        Prepara o documento para compilação a partir do formato.
+
+        Returns:
+            tuple: Documento a compilar e nome do formato, ou o documento
+            original e None quando o formato não se aplica.
+        """
+        stripped = self.strip_preamble(tex_content)
+        if stripped is None:
+            return tex_content, None
+
+        pdflatex_path = get_config().get("pdflatex_path")
+        if not pdflatex_path or not self.build(pdflatex_path):
+            return tex_content, None
+        return stripped, self.name
+
+
+def _create_latex_format() -> Optional[LatexFormat]:
+    config = get_config()
+    if not config["latex_format_enabled"]:
+        return None
+    return LatexFormat(config["latex_format_directory"], standard_preamble())
+
+
+# Formato do preâmbulo padrão (None se desabilitado)
+latex_format = _create_latex_format()
@@ -0,0 +1,142 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Linha de contexto que o TeX imprime após um erro: "l.42 \comando"
+_CONTEXT_PATTERN = re.compile(r"^l\.(\d+) ?(.*)$")
+# "LaTeX Warning:", "LaTeX Font Warning:", "Package hyperref Warning:", ...
+_WARNING_PATTERN = re.compile(
+    r"^(?:LaTeX|Package (?P<package>\S+)|Class (?P<class>\S+))"
+    r"(?: (?P<kind>\S+))? Warning: (?P<message>.*)$"
+)
+_INPUT_LINE_PATTERN = re.compile(r"on input line (\d+)")
+
+# Mensagens que só repetem que a compilação foi interrompida
+_ABORT_MESSAGES = ("Emergency stop.", "==> Fatal error occurred")
+
+# Linhas seguintes ao "!" em que o TeX pode imprimir o contexto do erro
+_CONTEXT_LOOKAHEAD = 20
+
+
+class LatexMessage(NamedTuple):
+    """Erro ou aviso do pdflatex, com a linha do documento quando conhecida."""
+
+    message: str
+    line: Optional[int] = None
+    context: Optional[str] = None
+    package: Optional[str] = None
+
+
+class LatexLog(NamedTuple):
+    """Resultado da leitura do .log de uma execução do pdflatex."""
+
+    errors: List[LatexMessage]
+    warnings: List[LatexMessage]
+    needs_rerun: bool
+
+
+class LatexCompileError(Exception):
+    """Falha do pdflatex, com os erros extraídos do .log.
+
+    `reason` é "error" (erro no documento), "timeout" (tempo limite) ou
+    "limit" (processo encerrado por limite de CPU ou memória).
+    """
+
+    def __init__(
+        self, reason: str, message: str, errors: Optional[List[LatexMessage]] = None
+    ):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.errors = errors or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message": self.message,
+            "reason": self.reason,
+            "errors": [error._asdict() for error in self.errors],
+        }
+
+
+def _continuation(lines: List[str], start: int, prefix: str) -> str:
+    """Junta as linhas de continuação de um aviso, até a primeira linha vazia."""
+    parts = []
+    for line in lines[start : start + 5]:
+        if not line.strip():
+            break
+        if prefix and line.startswith(prefix):
+            line = line[len(prefix) :]
+        parts.append(line.strip())
+    return " ".join(parts)
+
+
+def parse_log(text: str) -> LatexLog:
+    """
+    Extrai erros, avisos e o pedido de nova execução do .log do pdflatex.
+
+    Args:
+        text (str): Conteúdo do arquivo .log.
+
+    Returns:
+        LatexLog: Erros ("! ..." com a linha "l.N"), avisos do LaTeX, de
+        classes e de pacotes, e se o log pede uma nova execução (referências
+        como \\pageref{LastPage} mudaram).
+    """
+    lines = text.splitlines()
+    errors: List[LatexMessage] = []
+    warnings: List[LatexMessage] = []
+    needs_rerun = False
+
+    for index, line in enumerate(lines):
+        if line.startswith("! "):
+            message = line[2:].strip()
+            if message.startswith(_ABORT_MESSAGES) or not message:
+                continue
+            number = context = None
+            for following in lines[index + 1 : index + 1 + _CONTEXT_LOOKAHEAD]:
+                match = _CONTEXT_PATTERN.match(following)
+                if match:
+                    number, context = int(match.group(1)), match.group(2).strip()
+                    break
+                if following.startswith("! "):
+                    break
+            errors.append(LatexMessage(message, number, context or None))
+            continue
+
+        match = _WARNING_PATTERN.match(line)
+        if match is None:
+            continue
+        package = match.group("package") or match.group("class")
+        # Pacotes continuam o aviso em linhas que começam com "(nome)"; os
+        # avisos de fonte do LaTeX, com "(Font)"
+        source = package or match.group("kind")
+        prefix = f"({source})" if source else ""
+        message = " ".join(
+            part
+            for part in (
+                match.group("message").strip(),
+                _continuation(lines, index + 1, prefix),
+            )
+            if part
+        )
+        input_line = _INPUT_LINE_PATTERN.search(message)
+        warnings.append(
+            LatexMessage(
+                message,
+                int(input_line.group(1)) if input_line else None,
+                package=package,
+            )
+        )
+        if "Rerun" in message:
+            needs_rerun = True
+
+    return LatexLog(errors, warnings, needs_rerun)
+
+
+def read_log(path: str) -> LatexLog:
+    """Lê e interpreta o .log; um log ausente resulta em um LatexLog vazio."""
+    try:
+        # O pdflatex grava o log na codificação do documento, sem garantia de UTF-8
+        with open(path, encoding="utf-8", errors="replace") as file:
+            return parse_log(file.read())
+    except FileNotFoundError:
+        return LatexLog([], [], False)
@@ -0,0 +1,155 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# Início de uma seção: \section{...} ou \section*{...} no começo da linha
+_SECTION_PATTERN = re.compile(r"^\s*\\section\*?\s*\{(?P<title>.*)\}", re.MULTILINE)
+# Delimitador de cada seção no prompt e na resposta da edição
+_MARKER_PATTERN = re.compile(r"^%%% SECAO (\d+)\s*$", re.MULTILINE)
+_FENCE_PATTERN = re.compile(r"^```[a-zA-Z]*\s*$", re.MULTILINE)
+
+
+class Section(NamedTuple):
+    """Seção do POP: título e texto completo, da linha \\section até a próxima."""
+
+    title: str
+    text: str
+
+
+class SplitDocument(NamedTuple):
+    """Documento dividido em cabeçalho, seções e fechamento.
+
+    `head` vai do \\documentclass até antes da primeira seção (preâmbulo,
+    \\maketitle); `tail` começa no \\end{document}. A concatenação das
+    partes reproduz o documento original.
+    """
+
+    head: str
+    sections: List[Section]
+    tail: str
+
+    def join(self, replacements: Optional[Dict[int, str]] = None) -> str:
+        """Remonta o documento, trocando as seções indicadas (a partir de 1)."""
+        replacements = replacements or {}
+        parts = [self.head]
+        for number, section in enumerate(self.sections, start=1):
+            if number not in replacements:
+                parts.append(section.text)
+                continue
+            # Mantém o espaçamento original entre as seções
+            trailing = section.text[len(section.text.rstrip()) :]
+            parts.append(replacements[number].rstrip() + (trailing or "\n"))
+        parts.append(self.tail)
+        return "".join(parts)
+
+    def outline(self) -> str:
+        """Sumário compacto: uma linha numerada por seção."""
+        return "\n".join(
+            f"{number}) {section.title}"
+            for number, section in enumerate(self.sections, start=1)
+        )
+
+
+def _section_start(text: str, position: int) -> int:
+    """Recua o início da seção para incluir os comentários logo acima dela."""
+    while position > 0:
+        previous = text.rfind("\n", 0, position - 1) + 1
+        if not text[previous:position].lstrip().startswith("%"):
+            break
+        position = previous
+    return position
+
+
+def split_sections(tex_content: str) -> SplitDocument:
+    """
+    Divide o corpo do documento nas suas seções (\\section e \\section*).
+
+    Um documento sem seções resulta em uma única seção com todo o corpo.
+
+    Args:
+        tex_content (str): Documento LaTeX completo e já validado.
+
+    Returns:
+        SplitDocument: Cabeçalho, seções e fechamento.
+    """
+    body_start = tex_content.index(r"\begin{document}")
+    tail_start = tex_content.rindex(r"\end{document}")
+    # O fechamento começa no início da linha do \end{document}
+    tail_start = tex_content.rfind("\n", 0, tail_start) + 1
+
+    starts = [
+        _section_start(tex_content, match.start())
+        for match in _SECTION_PATTERN.finditer(tex_content, body_start, tail_start)
+    ]
+    titles = [
+        match.group("title").strip()
+        for match in _SECTION_PATTERN.finditer(tex_content, body_start, tail_start)
+    ]
+    if not starts:
+        # Sem seções: o corpo inteiro é editado como uma seção só
+        body_start = tex_content.index("\n", body_start) + 1
+        return SplitDocument(
+            tex_content[:body_start],
+            [Section("Documento", tex_content[body_start:tail_start])],
+            tex_content[tail_start:],
+        )
+
+    sections = [
+        Section(title, tex_content[start:end])
+        for title, start, end in zip(titles, starts, [*starts[1:], tail_start])
+    ]
+    return SplitDocument(tex_content[: starts[0]], sections, tex_content[tail_start:])
+
+
+def build_edit_prompt(
+    document: SplitDocument, numbers: Sequence[int], instruction: str
+) -> str:
+    """Monta o prompt da edição: sumário, seções afetadas e a alteração pedida."""
+    sections = "\n".join(
+        f"%%% SECAO {number}\n{document.sections[number - 1].text.rstrip()}"
+        for number in numbers
+    )
+    return (
+        f"Sumário do POP:\n{document.outline()}\n\n"
+        f"Seções a alterar:\n{sections}\n\n"
+        f"Alteração solicitada: {instruction}"
+    )
+
+
+def build_selection_prompt(document: SplitDocument, instruction: str) -> str:
+    """Monta o prompt que pergunta quais seções a alteração afeta."""
+    return (
+        f"Sumário do POP:\n{document.outline()}\n\n"
+        f"Alteração solicitada: {instruction}"
+    )
+
+
+def parse_section_numbers(response: str, count: int) -> List[int]:
+    """Lê os números de seção da resposta do modelo, ignorando os inválidos."""
+    numbers = {int(value) for value in re.findall(r"\d+", response)}
+    return sorted(number for number in numbers if 1 <= number <= count)
+
+
+def parse_edited_sections(response: str, numbers: Sequence[int]) -> Dict[int, str]:
+    """
+    Separa as seções devolvidas pelo modelo pelos marcadores %%% SECAO n.
+
+    Seções pedidas que não voltarem na resposta ficam como estavam. Se só uma
+    seção foi pedida e a resposta não tiver marcadores, a resposta inteira é
+    a nova seção.
+
+    Returns:
+        dict: Texto novo de cada seção, pelo número.
+    """
+    response = _FENCE_PATTERN.sub("", response).strip()
+    markers = list(_MARKER_PATTERN.finditer(response))
+    if not markers:
+        return {numbers[0]: response + "\n"} if len(numbers) == 1 and response else {}
+
+    edited: Dict[int, str] = {}
+    for marker, following in zip(markers, [*markers[1:], None]):
+        number = int(marker.group(1))
+        end = following.start() if following is not None else len(response)
+        text = response[marker.end() : end].strip("\n")
+        if number in numbers and text.strip():
+            edited[number] = text + "\n"
+    return edited
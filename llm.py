@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from cache import TieredCache
+from config import get_config
+from llm_providers import QuotaExceededError, ResilientLLM, create_provider
+from logger import api_logger
+from metrics import in_flight, llm_requests, llm_tokens, register_cache, track_stage
+from personas import PERSONA_DESCRIPTION_GERAPOP
+
+# Semáforo global que limita as chamadas simultâneas ao modelo
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Cria o semáforo na primeira chamada, já dentro do event loop."""
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(get_config()["llm_max_concurrency"])
+    return _llm_semaphore
+
+
+def _create_response_cache() -> Optional[TieredCache]:
+    config = get_config()
+    if not config["llm_cache_enabled"]:
+        return None
+    return TieredCache(
+        max_entries=config["llm_cache_max_entries"],
+        ttl_seconds=config["llm_cache_ttl_seconds"],
+        disk_path=config["llm_cache_disk_path"],
+        disk_max_entries=config["llm_cache_disk_max_entries"],
+    )
+
+
+# Cache das respostas do modelo (None se desabilitado)
+response_cache = _create_response_cache()
+if response_cache is not None:
+    register_cache("llm_response", response_cache)
+
+
+def response_cache_key(question: str, pdf_text: Optional[str] = None) -> str:
+    """
+    Calcula a chave do cache de respostas.
+
+    Args:
+        question (str): Pergunta do usuário, sem o contexto do PDF.
+        pdf_text (str, opcional): Texto extraído do PDF enviado.
+
+    Returns:
+        str: Hash da persona, do modelo, da pergunta e do texto do PDF.
+    """
+    pdf_digest = hashlib.sha256((pdf_text or "").encode("utf-8")).hexdigest()
+    digest = hashlib.sha256()
+    for part in (
+        PERSONA_DESCRIPTION_GERAPOP,
+        get_config()["llm_model"],
+        question,
+        pdf_digest if pdf_text is not None else "",
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _create_client() -> ResilientLLM:
+    """Cria o cliente com o modelo principal seguido dos modelos de fallback."""
+    config = get_config()
+    models = [config["llm_model"], *config["llm_fallback_models"]]
+    return ResilientLLM(
+        [create_provider(config["llm_provider"], model, config) for model in models],
+        hedge_delay=config["llm_hedge_delay_seconds"],
+        retry_attempts=config["llm_retry_attempts"],
+        retry_base_delay=config["llm_retry_base_delay_seconds"],
+        attempt_timeout=config["llm_attempt_timeout_seconds"],
+    )
+
+
+# Cliente compartilhado por todas as chamadas
+llm_client = _create_client()
+
+
+def warm_up() -> None:
+    """Prepara o modelo principal antes da primeira requisição."""
+    llm_client.primary.warm_up(PERSONA_DESCRIPTION_GERAPOP)
+
+
+def build_prompt(question: str) -> str:
+    """Monta o prompt da chamada; a persona vai como system instruction."""
+    return f"Pergunta: {question}"
+
+
+class TokenUsage:
+    """Contadores acumulados de tokens consumidos nos modelos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, usage: Dict[str, int]) -> None:
+        """
+        Soma o uso de uma chamada aos contadores.
+
+        Args:
+            usage (dict): Tokens consumidos, com as chaves prompt_tokens,
+                cached_tokens e output_tokens.
+        """
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.cached_tokens += usage.get("cached_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Totais acumulados desde o início do processo."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "output_tokens": self.output_tokens,
+            }
+
+
+# Uso de tokens acumulado pelo processo
+token_usage = TokenUsage()
+
+
+def _record_usage(model: str, usage: Dict[str, int]) -> None:
+    token_usage.record(usage)
+    llm_requests.inc()
+    for name, count in usage.items():
+        llm_tokens.inc(count, kind=name.removesuffix("_tokens"))
+    api_logger.log_llm_usage(model, usage)
+
+
+def _raise_http_error(error: Exception, timeout: float):
+    if isinstance(error, HTTPException):
+        raise error
+    if isinstance(error, asyncio.TimeoutError):
+        raise HTTPException(
+            status_code=504,
+            detail=f"Tempo limite de {timeout}s excedido ao acessar o modelo",
+        )
+    if isinstance(error, QuotaExceededError):
+        raise HTTPException(
+            status_code=503, detail=f"Cota dos modelos de linguagem esgotada: {error}"
+        )
+    raise HTTPException(status_code=500, detail=f"Erro ao acessar o modelo: {error}")
+
+
+async def chat_with_persona_async(
+    question: str,
+    timeout: Optional[float] = None,
+    system_instruction: Optional[str] = None,
+    accept: Optional[Callable[[str], bool]] = None,
+) -> str:
+    """
+    Envia uma pergunta ao modelo sem bloquear o event loop.
+
+    Args:
+        question (str): Pergunta enviada ao modelo.
+        timeout (float, opcional): Tempo máximo da geração, incluindo novas
+            tentativas e fallback, em segundos.
+        system_instruction (str, opcional): Substitui a persona GERAPOP.
+        accept (callable, opcional): Identifica respostas válidas, para que um
+            pedido de hedge possa substituir uma resposta inválida.
+
+    Returns:
+        str: Resposta gerada pelo modelo.
+    """
+    config = get_config()
+    timeout = timeout or config["llm_timeout_seconds"]
+
+    # Inclui as chamadas aguardando o semáforo
+    with track_stage("generate"), in_flight.track_inprogress(operation="llm"):
+        async with _get_semaphore():
+            try:
+                result = await asyncio.wait_for(
+                    llm_client.generate(
+                        build_prompt(question),
+                        system_instruction or PERSONA_DESCRIPTION_GERAPOP,
+                        accept=accept,
+                    ),
+                    timeout=timeout,
+                )
+                _record_usage(result.model, result.usage)
+                return result.text
+            except Exception as e:
+                _raise_http_error(e, timeout)
+
+
+async def stream_with_persona_async(
+    question: str,
+    timeout: Optional[float] = None,
+    system_instruction: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Envia a pergunta ao modelo e repassa os trechos da resposta à medida que
+    são gerados.
+
+    Args:
+        question (str): Pergunta enviada ao modelo.
+        timeout (float, opcional): Tempo máximo da geração completa, em segundos.
+        system_instruction (str, opcional): Substitui a persona GERAPOP.
+
+    Yields:
+        str: Trechos de texto da resposta.
+    """
+    config = get_config()
+    timeout = timeout or config["llm_timeout_seconds"]
+    deadline = time.monotonic() + timeout
+
+    # Inclui as chamadas aguardando o semáforo
+    with track_stage("generate"), in_flight.track_inprogress(operation="llm"):
+        async with _get_semaphore():
+            chunks = llm_client.stream(
+                build_prompt(question),
+                system_instruction or PERSONA_DESCRIPTION_GERAPOP,
+            )
+            usage = model = None
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), timeout=deadline - time.monotonic()
+                        )
+                    except StopAsyncIteration:
+                        return
+                    # O uso de tokens chega junto com os trechos finais
+                    usage = chunk.usage or usage
+                    model = chunk.model
+                    yield chunk.text
+            except Exception as e:
+                _raise_http_error(e, timeout)
+            finally:
+                await chunks.aclose()
+                if usage is not None:
+                    _record_usage(model, usage)
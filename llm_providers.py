@@ -0,0 +1,512 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from metrics import llm_events
+
+
+class TransientLLMError(Exception):
+    """Falha temporária do provedor (5xx, conexão, lentidão): vale repetir."""
+
+
+class QuotaExceededError(TransientLLMError):
+    """Cota ou limite de taxa do modelo esgotado (HTTP 429)."""
+
+
+class LLMResult(NamedTuple):
+    """Resposta completa de um modelo."""
+
+    text: str
+    usage: Dict[str, int]
+    model: str
+
+
+class LLMChunk(NamedTuple):
+    """Trecho de uma resposta em streaming; `usage` vem no último trecho."""
+
+    text: str
+    usage: Optional[Dict[str, int]] = None
+    model: Optional[str] = None
+
+
+class LLMProvider:
+    """Interface dos provedores de modelo de linguagem.
+
+    Cada instância atende um modelo. O uso de tokens é normalizado para as
+    chaves prompt_tokens, cached_tokens e output_tokens.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def generate(self, prompt: str, system_instruction: str) -> LLMResult:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, system_instruction: str) -> AsyncIterator[LLMChunk]:
+        raise NotImplementedError
+
+    def warm_up(self, system_instruction: str) -> None:
+        """Prepara o provedor antes da primeira chamada (opcional)."""
+
+
+class GeminiProvider(LLMProvider):
+    """Modelos do Google Gemini, via google-generativeai.
+
+    Um GenerativeModel é criado por system instruction e reaproveitado por
+    todas as chamadas. Com `context_cache`, a instrução fica no cache de
+    contexto do Gemini e é renovada antes de expirar.
+    """
+
+    def __init__(
+        self, model: str, context_cache: bool = False, context_cache_ttl: float = 3600
+    ):
+        super().__init__(model)
+        self.context_cache = context_cache
+        self.context_cache_ttl = context_cache_ttl
+        # system instruction -> (modelo, renovação do cache de contexto)
+        self._models: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _create_model(self, system_instruction: str) -> Tuple[Any, Optional[float]]:
+        import google.generativeai as genai
+
+        # A chave é lida do ambiente (.env) ao criar o primeiro modelo, e não
+        # na importação da aplicação
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        if self.context_cache:
+            # Guarda a instrução no provedor; o prompt de cada chamada só a
+            # referencia
+            try:
+                cached_content = genai.caching.CachedContent.create(
+                    model=self.model,
+                    system_instruction=system_instruction,
+                    ttl=timedelta(seconds=self.context_cache_ttl),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content)
+                # Renovar antes que o cache expire no provedor
+                return model, time.monotonic() + self.context_cache_ttl * 0.9
+            except Exception as e:
+                print(
+                    "Aviso: cache de contexto indisponível, usando system instruction.",
+                    e,
+                )
+
+        model = genai.GenerativeModel(
+            model_name=self.model, system_instruction=system_instruction
+        )
+        return model, None
+
+    def _needs_refresh(self, system_instruction: str) -> bool:
+        entry = self._models.get(system_instruction)
+        return entry is None or (entry[1] is not None and time.monotonic() >= entry[1])
+
+    def get_model(self, system_instruction: str):
+        """Retorna o GenerativeModel da instrução, criando-o se necessário."""
+        with self._lock:
+            if self._needs_refresh(system_instruction):
+                self._models[system_instruction] = self._create_model(
+                    system_instruction
+                )
+            return self._models[system_instruction][0]
+
+    async def _get_model_async(self, system_instruction: str):
+        # Criar o cache de contexto faz uma chamada de rede: fora do event loop
+        if self._needs_refresh(system_instruction):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.get_model, system_instruction
+            )
+        return self._models[system_instruction][0]
+
+    def warm_up(self, system_instruction: str) -> None:
+        self.get_model(system_instruction)
+
+    @staticmethod
+    def _usage(usage_metadata: Any) -> Dict[str, int]:
+        return {
+            name: getattr(usage_metadata, field, 0) or 0
+            for name, field in (
+                ("prompt_tokens", "prompt_token_count"),
+                ("cached_tokens", "cached_content_token_count"),
+                ("output_tokens", "candidates_token_count"),
+            )
+        }
+
+    @staticmethod
+    def _translate_error(error: Exception) -> Exception:
+        from google.api_core import exceptions
+
+        if isinstance(error, exceptions.TooManyRequests):
+            return QuotaExceededError(str(error))
+        if isinstance(error, (exceptions.ServerError, ConnectionError)):
+            return TransientLLMError(str(error))
+        return error
+
+    async def generate(self, prompt: str, system_instruction: str) -> LLMResult:
+        model = await self._get_model_async(system_instruction)
+        try:
+            response = await model.generate_content_async(prompt)
+        except Exception as e:
+            raise self._translate_error(e) from e
+        return LLMResult(
+            response.text, self._usage(response.usage_metadata), self.model
+        )
+
+    async def stream(
+        self, prompt: str, system_instruction: str
+    ) -> AsyncIterator[LLMChunk]:
+        model = await self._get_model_async(system_instruction)
+        try:
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                # O uso de tokens chega junto com os trechos finais
+                usage = chunk.usage_metadata
+                yield LLMChunk(chunk.text, self._usage(usage) if usage else None)
+        except Exception as e:
+            raise self._translate_error(e) from e
+
+
+class HttpProvider(LLMProvider):
+    """Modelo servido por HTTP, como um substituto local do Gemini.
+
+    Envia POST para `url` com o JSON {"model", "system_instruction",
+    "prompt", "stream"}. A resposta é {"text", "usage"}; em streaming, uma
+    linha JSON por trecho, no mesmo formato (usage opcional).
+    """
+
+    def __init__(self, model: str, url: str):
+        super().__init__(model)
+        self.url = url
+        self._client = None
+
+    def _get_client(self):
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=None)
+        return self._client
+
+    def _payload(self, prompt: str, system_instruction: str, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "system_instruction": system_instruction,
+            "prompt": prompt,
+            "stream": stream,
+        }
+
+    @staticmethod
+    def _check_status(status_code: int, body: str) -> None:
+        if status_code == 429:
+            raise QuotaExceededError(body)
+        if status_code >= 500:
+            raise TransientLLMError(f"HTTP {status_code}: {body}")
+        if status_code >= 400:
+            raise RuntimeError(f"HTTP {status_code}: {body}")
+
+    async def generate(self, prompt: str, system_instruction: str) -> LLMResult:
+        import httpx
+
+        try:
+            response = await self._get_client().post(
+                self.url, json=self._payload(prompt, system_instruction, False)
+            )
+        except httpx.TransportError as e:
+            raise TransientLLMError(str(e)) from e
+        self._check_status(response.status_code, response.text)
+        data = response.json()
+        return LLMResult(data["text"], data.get("usage") or {}, self.model)
+
+    async def stream(
+        self, prompt: str, system_instruction: str
+    ) -> AsyncIterator[LLMChunk]:
+        import httpx
+
+        try:
+            async with self._get_client().stream(
+                "POST", self.url, json=self._payload(prompt, system_instruction, True)
+            ) as response:
+                if response.status_code >= 400:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    self._check_status(response.status_code, body)
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        data = json.loads(line)
+                        yield LLMChunk(data.get("text", ""), data.get("usage"))
+        except httpx.TransportError as e:
+            raise TransientLLMError(str(e)) from e
+
+
+class FakeProvider(LLMProvider):
+    """Modelo falso, sem rede, para testes e desenvolvimento.
+
+    Responde sempre `response` após `latency` segundos; o padrão é um
+    documento LaTeX mínimo que passa na validação.
+    """
+
+    DEFAULT_RESPONSE = (
+        "\\documentclass{article}\n\\begin{document}\n"
+        "POP de teste.\n\\end{document}\n"
+    )
+
+    def __init__(
+        self,
+        model: str = "fake",
+        response: Optional[str] = None,
+        latency: float = 0.0,
+        chunk_chars: int = 64,
+    ):
+        super().__init__(model)
+        self.response = response or self.DEFAULT_RESPONSE
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+
+    def _usage(self, prompt: str) -> Dict[str, int]:
+        return {
+            "prompt_tokens": len(prompt) // 4,
+            "cached_tokens": 0,
+            "output_tokens": len(self.response) // 4,
+        }
+
+    async def generate(self, prompt: str, system_instruction: str) -> LLMResult:
+        await asyncio.sleep(self.latency)
+        return LLMResult(self.response, self._usage(prompt), self.model)
+
+    async def stream(
+        self, prompt: str, system_instruction: str
+    ) -> AsyncIterator[LLMChunk]:
+        chunks = [
+            self.response[i : i + self.chunk_chars]
+            for i in range(0, len(self.response), self.chunk_chars)
+        ]
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(self.latency / len(chunks))
+            last = index == len(chunks) - 1
+            yield LLMChunk(chunk, self._usage(prompt) if last else None)
+
+
+def create_provider(kind: str, model: str, config: Dict[str, Any]) -> LLMProvider:
+    """
+    Cria o provedor de um modelo a partir da configuração.
+
+    Args:
+        kind (str): "gemini", "http" ou "fake".
+        model (str): Nome do modelo.
+        config (dict): Configuração da aplicação.
+
+    Returns:
+        LLMProvider: Provedor do modelo.
+    """
+    if kind == "gemini":
+        return GeminiProvider(
+            model,
+            context_cache=config["llm_context_cache"],
+            context_cache_ttl=config["llm_context_cache_ttl_seconds"],
+        )
+    if kind == "http":
+        return HttpProvider(model, config["llm_http_url"])
+    if kind == "fake":
+        return FakeProvider(model)
+    raise ValueError(f"Provedor de LLM desconhecido: {kind}")
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 30.0) -> float:
+    """Espera antes da nova tentativa: backoff exponencial com jitter total."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class ResilientLLM:
+    """Chamadas a uma lista de modelos com hedge, retry e fallback.
+
+    Para cada modelo, na ordem:
+    - hedge: se a resposta não chegar em `hedge_delay` segundos, um segundo
+      pedido igual é disparado e vale o primeiro resultado aceito;
+    - retry: falhas transitórias são repetidas até `retry_attempts` vezes, com
+      backoff exponencial e jitter;
+    - fallback: se o modelo continuar falhando, estourar `attempt_timeout` ou
+      a cota, o próximo modelo da lista é usado.
+    Erros não transitórios (requisição inválida, resposta recusada) encerram
+    a chamada sem fallback.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[LLMProvider],
+        hedge_delay: Optional[float] = None,
+        retry_attempts: int = 2,
+        retry_base_delay: float = 0.5,
+        attempt_timeout: Optional[float] = None,
+    ):
+        if not providers:
+            raise ValueError("Nenhum provedor de LLM configurado")
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.attempt_timeout = attempt_timeout
+
+    @property
+    def primary(self) -> LLMProvider:
+        return self.providers[0]
+
+    async def _attempt(self, provider, prompt, system_instruction) -> LLMResult:
+        try:
+            return await asyncio.wait_for(
+                provider.generate(prompt, system_instruction), self.attempt_timeout
+            )
+        except asyncio.TimeoutError:
+            raise TransientLLMError(
+                f"{provider.model} não respondeu em {self.attempt_timeout}s"
+            )
+
+    async def _hedged(
+        self,
+        provider: LLMProvider,
+        prompt: str,
+        system_instruction: str,
+        accept: Optional[Callable[[str], bool]],
+    ) -> LLMResult:
+        """Primeiro resultado aceito entre o pedido original e o hedge."""
+        tasks = [
+            asyncio.ensure_future(self._attempt(provider, prompt, system_instruction))
+        ]
+        errors: List[BaseException] = []
+        rejected: Optional[LLMResult] = None
+        try:
+            if self.hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+                if not done:
+                    llm_events.inc(event="hedge")
+                    tasks.append(
+                        asyncio.ensure_future(
+                            self._attempt(provider, prompt, system_instruction)
+                        )
+                    )
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        continue
+                    result = task.result()
+                    if accept is None or accept(result.text):
+                        return result
+                    rejected = result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Nenhuma resposta aceita: a validação da chamada reporta o problema
+        if rejected is not None:
+            return rejected
+        # Se algum pedido falhou por motivo transitório, o erro é transitório
+        transient = [e for e in errors if isinstance(e, TransientLLMError)]
+        raise (transient or errors)[0]
+
+    async def generate(
+        self,
+        prompt: str,
+        system_instruction: str,
+        accept: Optional[Callable[[str], bool]] = None,
+    ) -> LLMResult:
+        """
+        Gera uma resposta completa.
+
+        Args:
+            prompt (str): Prompt da chamada.
+            system_instruction (str): Instrução de sistema (persona).
+            accept (callable, opcional): Identifica respostas válidas; uma
+                resposta recusada dá lugar ao hedge ainda em andamento e só é
+                devolvida se nenhuma outra for aceita.
+
+        Returns:
+            LLMResult: Texto, uso de tokens e modelo que respondeu.
+        """
+        last_error: Optional[Exception] = None
+        for index, provider in enumerate(self.providers):
+            if index:
+                llm_events.inc(event="fallback")
+            for attempt in range(self.retry_attempts + 1):
+                if attempt:
+                    llm_events.inc(event="retry")
+                    await asyncio.sleep(
+                        backoff_delay(attempt - 1, self.retry_base_delay)
+                    )
+                try:
+                    return await self._hedged(
+                        provider, prompt, system_instruction, accept
+                    )
+                except QuotaExceededError as e:
+                    # Repetir no mesmo modelo só agrava o limite de taxa
+                    last_error = e
+                    break
+                except TransientLLMError as e:
+                    last_error = e
+        raise last_error
+
+    async def stream(
+        self, prompt: str, system_instruction: str
+    ) -> AsyncIterator[LLMChunk]:
+        """
+        Gera uma resposta em streaming.
+
+        Retry e fallback valem até a chegada do primeiro trecho; depois disso,
+        um erro interrompe a resposta. Não há hedge em streaming.
+        """
+        last_error: Optional[Exception] = None
+        for index, provider in enumerate(self.providers):
+            if index:
+                llm_events.inc(event="fallback")
+            for attempt in range(self.retry_attempts + 1):
+                if attempt:
+                    llm_events.inc(event="retry")
+                    await asyncio.sleep(
+                        backoff_delay(attempt - 1, self.retry_base_delay)
+                    )
+                chunks = provider.stream(prompt, system_instruction).__aiter__()
+                try:
+                    try:
+                        first = await asyncio.wait_for(
+                            chunks.__anext__(), self.attempt_timeout
+                        )
+                    except asyncio.TimeoutError:
+                        raise TransientLLMError(
+                            f"{provider.model} não respondeu em "
+                            f"{self.attempt_timeout}s"
+                        )
+                except StopAsyncIteration:
+                    return
+                except QuotaExceededError as e:
+                    await chunks.aclose()
+                    last_error = e
+                    break
+                except TransientLLMError as e:
+                    await chunks.aclose()
+                    last_error = e
+                    continue
+
+                try:
+                    yield first._replace(model=provider.model)
+                    async for chunk in chunks:
+                        yield chunk._replace(model=provider.model)
+                finally:
+                    await chunks.aclose()
+                return
+        raise last_error
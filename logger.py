@@ -1,89 +1,226 @@
+import atexit
+import json
 import logging
 import os
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
-import json
-from typing import Any, Dict
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
+
+from config import get_config
+from metrics import log_records_dropped
+from request_context import request_id_var
+
+
+class JsonFormatter(logging.Formatter):
+    """Formata cada registro como um objeto JSON por linha.
+
+    Os campos estruturados vêm do atributo `data` do registro, passado com
+    `extra={"data": {...}}`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            **getattr(record, "data", {}),
+        }
+        if hasattr(record, "request_id"):
+            entry["request_id"] = record.request_id
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Anexa ao registro o id da requisição em andamento.
+
+    Roda na thread que gerou o registro, antes de ele entrar na fila.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler que descarta o registro, em vez de bloquear, com a fila cheia."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+
+class BoundedQueueListener(QueueListener):
+    """QueueListener que espera espaço na fila para o sinal de parada."""
+
+    def enqueue_sentinel(self) -> None:
+        # put_nowait falharia com a fila cheia; a thread a esvazia até o sinal
+        self.queue.put(self._sentinel)
 
 
 class APILogger:
-    def __init__(self):
-        # Criar diretório de logs se não existir
+    """Logger da API com escrita em segundo plano.
+
+    Os registros são apenas enfileirados no caminho da requisição; uma thread
+    (QueueListener) os grava nos arquivos e no console, de modo que a latência
+    do disco e a rotação dos arquivos não atrasam as respostas. A thread só é
+    iniciada por `start()`, no startup da aplicação; até lá os registros
+    aguardam na fila, e criar o logger não abre arquivos.
+
+    A fila é limitada a `max_queued` registros: se a thread não der conta (ou
+    `start()` nunca for chamado), os excedentes são descartados e contados em
+    `pop_log_records_dropped_total`, sem crescer a memória indefinidamente.
+    """
+
+    def __init__(
+        self,
+        request_sample_rate: float = 1.0,
+        console: bool = True,
+        max_queued: int = 10000,
+    ):
         self.logs_dir = "logs"
-        os.makedirs(self.logs_dir, exist_ok=True)
 
-        # Configurar logger principal
-        self.logger = logging.getLogger("api_logger")
-        self.logger.setLevel(logging.INFO)
+        # Fração das requisições bem-sucedidas registradas; erros sempre são
+        self.request_sample_rate = request_sample_rate
 
-        # Configurar formato do log
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-        )
+        formatter = JsonFormatter()
 
         # Handler para arquivo com rotação
         file_handler = RotatingFileHandler(
             os.path.join(self.logs_dir, "api.log"),
             maxBytes=10485760,  # 10MB
             backupCount=5,
+            delay=True,  # Aberto no primeiro registro gravado
         )
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
-
-        # Handler para console
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
-
-        # Configurar logger de segurança separado
-        self.security_logger = logging.getLogger("security_logger")
-        self.security_logger.setLevel(logging.INFO)
+        file_handler.addFilter(logging.Filter("api_logger"))
 
+        # Arquivo separado para os eventos de segurança
         security_handler = RotatingFileHandler(
             os.path.join(self.logs_dir, "security.log"),
             maxBytes=10485760,
             backupCount=5,
+            delay=True,
         )
-        security_handler.setFormatter(formatter)
-        self.security_logger.addHandler(security_handler)
+        security_handler.addFilter(logging.Filter("security_logger"))
+
+        handlers = [file_handler, security_handler]
+
+        # Handler para console
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.addFilter(logging.Filter("api_logger"))
+            handlers.append(console_handler)
+
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        # Uma fila compartilhada pelos dois loggers, esvaziada por uma thread
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(max_queued)
+        self._listener = BoundedQueueListener(self._queue, *handlers)
+        self._started = False
+        self._stopped = False
+
+        self.logger = self._queued_logger("api_logger")
+        self.security_logger = self._queued_logger("security_logger")
+
+        atexit.register(self.shutdown)
+
+    def _queued_logger(self, name: str) -> logging.Logger:
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = BoundedQueueHandler(self._queue)
+        handler.addFilter(RequestIdFilter())
+        logger.handlers = [handler]
+        return logger
+
+    def start(self) -> None:
+        """Cria o diretório de logs e inicia a thread de escrita."""
+        if not self._started:
+            os.makedirs(self.logs_dir, exist_ok=True)
+            self._started = True
+            self._listener.start()
+
+    def shutdown(self) -> None:
+        """Grava os registros ainda na fila e encerra a thread de escrita."""
+        if self._started and not self._stopped:
+            self._stopped = True
+            self._listener.stop()
 
     def log_request(
-        self, request: Any, response: Any = None, error: Exception = None
+        self,
+        request: Any,
+        response: Any = None,
+        error: Exception = None,
+        status_code: Optional[int] = None,
+        process_time: Optional[float] = None,
     ) -> None:
         """Registra detalhes da requisição e resposta"""
+        if status_code is None:
+            status_code = getattr(response, "status_code", 500 if error else None)
+        if (
+            error is None
+            and status_code is not None
+            and status_code < 400
+            and random.random() >= self.request_sample_rate
+        ):
+            return
+
+        client = getattr(request, "client", None)
         log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
             "method": getattr(request, "method", "N/A"),
             "url": str(getattr(request, "url", "N/A")),
-            "client_ip": getattr(request, "client.host", "N/A"),
-            "status_code": getattr(response, "status_code", 500 if error else "N/A"),
+            "client_ip": client.host if client else "N/A",
+            "status_code": status_code,
         }
+        if process_time is not None:
+            log_data["process_time"] = process_time
 
         if error:
             log_data["error"] = str(error)
-            self.logger.error(f"Request failed: {json.dumps(log_data)}")
+            self.logger.error("Request failed", extra={"data": log_data})
         else:
-            self.logger.info(f"Request processed: {json.dumps(log_data)}")
+            self.logger.info("Request processed", extra={"data": log_data})
 
     def log_security_event(self, event_type: str, details: Dict[str, Any]) -> None:
         """Registra eventos de segurança"""
-        log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "event_type": event_type,
-            **details,
-        }
-        self.security_logger.warning(f"Security event: {json.dumps(log_data)}")
+        log_data = {"event_type": event_type, **details}
+        self.security_logger.warning("Security event", extra={"data": log_data})
+
+    def log_llm_usage(self, model: str, usage: Dict[str, int]) -> None:
+        """Registra o consumo de tokens de uma chamada ao modelo"""
+        log_data = {"model": model, **usage}
+        self.logger.info("LLM usage", extra={"data": log_data})
+
+    def log_info(self, message: str, details: Dict[str, Any] = None) -> None:
+        """Registra eventos informativos do sistema"""
+        self.logger.info(message, extra={"data": details or {}})
 
     def log_error(self, error: Exception, context: Dict[str, Any] = None) -> None:
         """Registra erros do sistema"""
         log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
             "error_type": type(error).__name__,
             "error_message": str(error),
             "context": context or {},
         }
-        self.logger.error(f"System error: {json.dumps(log_data)}")
+        self.logger.error("System error", extra={"data": log_data})
+
+
+def _create_api_logger() -> APILogger:
+    config = get_config()
+    return APILogger(
+        config["log_request_sample_rate"],
+        console=config["log_console"],
+        max_queued=config["log_queue_max_records"],
+    )
 
 
 # Instância global do logger
-api_logger = APILogger()
+api_logger = _create_api_logger()
@@ -0,0 +1,312 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from request_context import record_timing
+
+# Tipo de conteúdo do formato texto do Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites dos histogramas de latência, em segundos
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class Registry:
+    """Conjunto de métricas exportadas em /metrics."""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Serializa todas as métricas no formato texto do Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "".join(metric.render() for metric in metrics)
+
+
+# Registro global das métricas do processo
+registry = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera os rótulos {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Lê o valor da série de `function` no momento da coleta."""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+        raise NotImplementedError
+
+    def _function_samples(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            yield "", self.labelnames, key, value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, names, values, value in self._samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(names, values)} "
+                f"{_format_value(value)}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """Contador que só aumenta."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", self.labelnames, key, value
+        yield from self._function_samples()
+
+
+class Gauge(_Metric):
+    """Valor que sobe e desce, como operações em andamento."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        """Incrementa o valor enquanto o bloco estiver em execução."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", self.labelnames, key, value
+        yield from self._function_samples()
+
+
+class Histogram(_Metric):
+    """Distribuição de valores em faixas cumulativas, como latências."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por série: contagem por faixa (não cumulativa), soma e total
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Mede a duração do bloco, inclusive quando ele termina com erro."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            series = [
+                (key, list(counts), total[0])
+                for key, (counts, total) in self._series.items()
+            ]
+        names = self.labelnames + ("le",)
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", names, key + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, key, total
+            yield "_count", self.labelnames, key, cumulative
+
+
+# Métricas compartilhadas pelos módulos da aplicação
+stage_seconds = Histogram(
+    "pop_stage_duration_seconds",
+    "Duração de cada etapa da geração e do download de POPs.",
+    ("stage",),
+)
+stage_errors = Counter(
+    "pop_stage_errors_total", "Etapas encerradas com erro.", ("stage",)
+)
+in_flight = Gauge("pop_in_flight", "Operações em andamento, por tipo.", ("operation",))
+pdflatex_failures = Counter(
+    "pop_pdflatex_failures_total",
+    "Execuções do pdflatex que não geraram o PDF.",
+    ("reason",),
+)
+llm_tokens = Counter(
+    "pop_llm_tokens_total", "Tokens consumidos no Gemini, por tipo.", ("kind",)
+)
+llm_requests = Counter("pop_llm_requests_total", "Chamadas concluídas ao Gemini.")
+llm_events = Counter(
+    "pop_llm_events_total",
+    "Pedidos de hedge, novas tentativas e fallbacks de modelo.",
+    ("event",),
+)
+cache_hits = Counter("pop_cache_hits_total", "Acertos por cache.", ("cache",))
+cache_misses = Counter("pop_cache_misses_total", "Falhas por cache.", ("cache",))
+cache_evictions = Counter(
+    "pop_cache_evictions_total", "Itens removidos por limite de tamanho.", ("cache",)
+)
+cache_entries = Gauge("pop_cache_entries", "Itens em cada cache.", ("cache",))
+cache_bytes = Gauge("pop_cache_bytes", "Tamanho de cada cache.", ("cache",))
+artifact_removals = Counter(
+    "pop_artifact_removals_total",
+    "PDFs gerados removidos pela coleta de lixo, por motivo.",
+    ("reason",),
+)
+log_records_dropped = Counter(
+    "pop_log_records_dropped_total", "Registros de log descartados com a fila cheia."
+)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """
+    Mede a duração de uma etapa e conta as que terminam com erro.
+
+    A duração também entra no cabeçalho Server-Timing da requisição atual.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        record_timing(stage, elapsed)
+
+
+def register_cache(name: str, cache) -> None:
+    """Exporta os contadores de `cache.stats()` com o rótulo cache=`name`."""
+    for metric, stat in (
+        (cache_hits, "hits"),
+        (cache_misses, "misses"),
+        (cache_evictions, "evictions"),
+        (cache_entries, "entries"),
+        (cache_bytes, "bytes"),
+    ):
+        metric.set_function(lambda stat=stat: cache.stats()[stat], cache=name)
+
+
+def cached(function: Callable[[], Any], ttl_seconds: float) -> Callable[[], Any]:
+    """
+    Memoriza o resultado de `function` por `ttl_seconds`, para que leituras
+    caras (ex.: consultas ao SQLite) não se repitam a cada coleta.
+    """
+    lock = threading.Lock()
+    state = {"expires_at": 0.0, "value": None}
+
+    def read() -> Any:
+        with lock:
+            now = time.monotonic()
+            if now >= state["expires_at"]:
+                state["value"] = function()
+                state["expires_at"] = now + ttl_seconds
+            return state["value"]
+
+    return read
+
+
+def render() -> str:
+    """
+    Conteúdo do endpoint /metrics.
+
+    As séries com `set_function` são lidas aqui; chame fora do event loop.
+    """
+    return registry.render()
@@ -0,0 +1,115 @@
+import asyncio
+import hmac
+import os
+import random
+import re
+import time
+import uuid
+from typing import Dict, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import get_config
+from logger import api_logger
+from metrics import in_flight
+from profiler import SamplingProfiler
+from request_context import format_server_timing, request_id_var, timings_var
+
+# Identificadores aceitos no cabeçalho X-Request-ID enviado pelo cliente
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+class RequestContextMiddleware:
+    """Middleware ASGI de identificação, tempos e log das requisições.
+
+    Para cada requisição HTTP:
+    - atribui um id (o X-Request-ID recebido, se válido, ou um novo),
+      devolvido no cabeçalho X-Request-ID e incluído nos logs;
+    - devolve no cabeçalho Server-Timing a duração das etapas concluídas até
+      o envio dos cabeçalhos;
+    - registra a requisição no log ao final do envio da resposta;
+    - opcionalmente, grava um perfil por amostragem em `profiling_directory`,
+      para uma fração das requisições ou quando o cabeçalho X-Profile-Token
+      confere com `profiling_token`.
+
+    Por ser um middleware ASGI puro, respostas em streaming e extensões como
+    pathsend passam sem intermediação.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        config = get_config()
+        self.profiling_sample_rate = config["profiling_sample_rate"]
+        self.profiling_token = config["profiling_token"]
+        self.profiling_interval = config["profiling_interval_ms"] / 1000
+        self.profiling_directory = config["profiling_directory"]
+
+    def _should_profile(self, request: Request) -> bool:
+        token = request.headers.get("x-profile-token")
+        if token and self.profiling_token:
+            return hmac.compare_digest(token, self.profiling_token)
+        return random.random() < self.profiling_sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        request_id = request.headers.get("x-request-id", "")
+        if not _REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        timings: Dict[str, float] = {}
+        context_tokens = (request_id_var.set(request_id), timings_var.set(timings))
+
+        profiler: Optional[SamplingProfiler] = None
+        if self._should_profile(request):
+            profiler = SamplingProfiler(interval=self.profiling_interval)
+            profiler.start()
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", request_id)
+                headers.append(
+                    "Server-Timing",
+                    format_server_timing(timings, time.perf_counter() - start_time),
+                )
+            await send(message)
+
+        try:
+            with in_flight.track_inprogress(operation="http"):
+                await self.app(scope, receive, send_with_headers)
+        except Exception as e:
+            api_logger.log_error(
+                error=e,
+                context={
+                    "request_method": request.method,
+                    "request_url": str(request.url),
+                    "process_time": time.perf_counter() - start_time,
+                },
+            )
+            raise
+        else:
+            api_logger.log_request(
+                request=request,
+                status_code=status_code,
+                process_time=time.perf_counter() - start_time,
+            )
+        finally:
+            request_id_var.reset(context_tokens[0])
+            timings_var.reset(context_tokens[1])
+            if profiler is not None:
+                profiler.stop()
+                path = os.path.join(
+                    self.profiling_directory,
+                    f"{time.strftime('%Y%m%d-%H%M%S')}_{request_id}.collapsed",
+                )
+                await asyncio.to_thread(profiler.save, path)
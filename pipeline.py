@@ -0,0 +1,470 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from artifacts import artifact_store
+from document_store import VersionConflictError, document_store
+from download_manager import download_manager
+from latex_compiler import latex_compiler
+from latex_log import LatexCompileError
+from latex_sections import (
+    build_edit_prompt,
+    build_selection_prompt,
+    parse_edited_sections,
+    parse_section_numbers,
+    split_sections,
+)
+from llm import (
+    chat_with_persona_async,
+    response_cache,
+    response_cache_key,
+    stream_with_persona_async,
+)
+from metrics import track_stage
+from personas import PERSONA_EDITOR_SECOES, PERSONA_SELECAO_SECOES
+from prompt_budget import fit_pdf_text
+from utils import (
+    SpooledUpload,
+    extract_tex_content,
+    extract_text_from_pdf_async,
+    extraction_cache,
+    file_sha256,
+    normalize_pdf_text,
+)
+
+DOWNLOAD_BASE_URL = "http://127.0.0.1:8001/secure_download"
+
+# Etapas do pipeline de geração, na ordem em que são executadas
+STAGES = ("extract", "generate", "validate", "compile")
+
+END_DOCUMENT = r"\end{document}"
+
+# Guard do validador de LaTeX, criado uma vez e reutilizado por todas as chamadas
+_tex_guard = None
+_tex_guard_lock = threading.Lock()
+
+
+def get_tex_guard():
+    """
+    Retorna o Guard do validador de LaTeX, criando-o na primeira chamada.
+
+    Importar o guardrails leva alguns segundos; a importação fica fora do
+    startup e é antecipada em segundo plano pelo lifespan da aplicação.
+    """
+    global _tex_guard
+    with _tex_guard_lock:
+        if _tex_guard is None:
+            from guardrails import Guard
+
+            from Validador_tex import ValidTex
+
+            _tex_guard = Guard().use(ValidTex, on_fail="exception")
+        return _tex_guard
+
+
+def has_complete_document(response: str) -> bool:
+    """Indica se a resposta do modelo traz o documento LaTeX até o fim."""
+    return END_DOCUMENT in response
+
+
+async def extract_uploaded_pdf(upload: SpooledUpload) -> str:
+    """
+    Extrai o texto normalizado do PDF enviado e remove o arquivo temporário.
+
+    PDFs já processados são lidos do cache de extração, pelo SHA-256 do
+    arquivo, sem reabrir o PDF.
+    """
+    try:
+        with track_stage("extract"):
+            if extraction_cache is not None:
+                pdf_text = await extraction_cache.get_async(upload.sha256)
+                if pdf_text is not None:
+                    return pdf_text
+
+            pdf_text = normalize_pdf_text(
+                await extract_text_from_pdf_async(upload.path)
+            )
+            if extraction_cache is not None:
+                await extraction_cache.set_async(upload.sha256, pdf_text)
+            return pdf_text
+    finally:
+        os.remove(upload.path)
+
+
+def build_question(question: str, pdf_text: Optional[str] = None) -> str:
+    """Monta a pergunta enviada ao modelo, incluindo o POP atual se houver."""
+    if pdf_text is None:
+        return question
+
+    # Modificar a pergunta para incluir o contexto do PDF
+    return f"""
+            Analise o seguinte POP existente e faça as alterações solicitadas:
+
+            POP Atual:
+            {pdf_text}
+
+            Alterações solicitadas:
+            {question}
+            """
+
+
+async def build_bounded_question(question: str, pdf_text: Optional[str] = None) -> str:
+    """
+    Monta a pergunta como `build_question`, resumindo antes POPs que não
+    caibam no orçamento de tokens do modelo.
+    """
+    if pdf_text is not None:
+        pdf_text = await fit_pdf_text(question, pdf_text)
+    return build_question(question, pdf_text)
+
+
+async def _cached_response(cache_key: str, bypass_cache: bool) -> Optional[str]:
+    if response_cache is None or bypass_cache:
+        return None
+    return await response_cache.get_async(cache_key)
+
+
+async def _store_response(cache_key: str, tex_content: str) -> None:
+    # Só documentos que passaram na validação são armazenados
+    if response_cache is not None:
+        await response_cache.set_async(cache_key, tex_content)
+
+
+def validate_tex(response: str) -> str:
+    """
+    Extrai o documento LaTeX da resposta do modelo e o valida.
+
+    Documentos malformados ou com comandos proibidos são recusados aqui, antes
+    de ocupar o pool de compilação.
+
+    Raises:
+        HTTPException: 422 com o primeiro erro encontrado pelo validador.
+    """
+    with track_stage("extract_tex"):
+        tex_content = extract_tex_content(response)
+    with track_stage("validate"):
+        from guardrails.errors import ValidationError
+
+        tex_guard = get_tex_guard()
+        try:
+            tex_guard.validate(tex_content)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422, detail=f"LaTeX inválido gerado pelo modelo: {e}"
+            )
+    return tex_content
+
+
+async def compile_pdf(tex_content: str, output_directory: str) -> str:
+    """
+    Compila o LaTeX validado no pool de compilação.
+
+    Returns:
+        str: Caminho do PDF gerado em `output_directory`.
+
+    Raises:
+        HTTPException: 422 com os erros do log do pdflatex, ou 500 se o
+            pdflatex não puder ser executado.
+    """
+    try:
+        pdf_path = await latex_compiler.compile(tex_content, output_directory)
+    except LatexCompileError as e:
+        # Erros do documento, com linha e contexto extraídos do log
+        raise HTTPException(status_code=422, detail=e.to_dict())
+    if not pdf_path:
+        raise HTTPException(status_code=500, detail="Falha ao gerar o PDF.")
+    return pdf_path
+
+
+async def compile_pop(tex_content: str, user_id: str) -> dict:
+    """
+    Compila o PDF do POP e cria o token de download.
+
+    Args:
+        tex_content (str): Documento LaTeX já validado.
+        user_id (str): Usuário dono do PDF gerado.
+
+    Returns:
+        dict: Código LaTeX final, token e URL de download.
+    """
+    pdf_path = await compile_pdf(tex_content, artifact_store.staging_directory)
+    return await register_pdf(pdf_path, tex_content, user_id)
+
+
+async def register_pdf(pdf_path: str, tex_content: str, user_id: str) -> dict:
+    """
+    Move o PDF compilado para o armazenamento e cria o token de download.
+
+    Args:
+        pdf_path (str): PDF gerado em `artifact_store.staging_directory`.
+        tex_content (str): Documento LaTeX que originou o PDF.
+        user_id (str): Usuário dono do PDF gerado.
+
+    Returns:
+        dict: Código LaTeX final, token e URL de download.
+    """
+    # O hash do PDF define o subdiretório e vira o ETag do download
+    pdf_sha256 = await asyncio.to_thread(file_sha256, pdf_path)
+    # Protegido da coleta de lixo enquanto o token valer, com uma margem para
+    # downloads iniciados perto da expiração
+    keep_until = time.time() + download_manager.ttl_seconds + 60
+    relative_path = await asyncio.to_thread(
+        artifact_store.add, pdf_path, user_id, pdf_sha256, keep_until
+    )
+
+    # Criar token único para download
+    download_token = await asyncio.to_thread(
+        download_manager.create_download_token, relative_path, user_id, pdf_sha256
+    )
+
+    return {
+        "response": tex_content,
+        "download_token": download_token,
+        "pdf_path": f"{DOWNLOAD_BASE_URL}/{download_token}",
+    }
+
+
+async def store_document(user_id: str, tex_content: str, question: str) -> dict:
+    """
+    Armazena o LaTeX gerado como um documento novo, que pode ser editado depois.
+
+    Returns:
+        dict: `document_id` e `version` do documento criado.
+    """
+    document_id, version = await asyncio.to_thread(
+        document_store.create, user_id, tex_content, question
+    )
+    return {"document_id": document_id, "version": version}
+
+
+async def generate_pop(
+    question: str,
+    user_id: str,
+    upload: Optional[SpooledUpload] = None,
+    on_stage: Optional[Callable[[str], None]] = None,
+    bypass_cache: bool = False,
+) -> dict:
+    """
+    Executa o pipeline completo de geração de um POP.
+
+    Args:
+        question (str): Descrição do processo ou alterações solicitadas.
+        user_id (str): Usuário que solicitou a geração.
+        upload (SpooledUpload, opcional): POP existente em PDF, salvo em um
+            arquivo temporário removido após a extração.
+        on_stage (callable, opcional): Chamado com o nome de cada etapa iniciada.
+        bypass_cache (bool): Ignora respostas em cache e consulta o modelo.
+
+    Returns:
+        dict: Código LaTeX final, token e URL de download, e o id e a versão
+        do documento armazenado.
+    """
+
+    def enter(stage: str) -> None:
+        if on_stage is not None:
+            on_stage(stage)
+
+    pdf_text = None
+    if upload is not None:
+        enter("extract")
+        pdf_text = await extract_uploaded_pdf(upload)
+
+    tex_content = await generate_tex(question, pdf_text, enter, bypass_cache)
+
+    enter("compile")
+    result = await compile_pop(tex_content, user_id)
+    result.update(await store_document(user_id, tex_content, question))
+    return result
+
+
+async def generate_tex(
+    question: str,
+    pdf_text: Optional[str] = None,
+    on_stage: Optional[Callable[[str], None]] = None,
+    bypass_cache: bool = False,
+) -> str:
+    """
+    Gera e valida o LaTeX do POP, consultando o cache de respostas.
+
+    Args:
+        question (str): Descrição do processo ou alterações solicitadas.
+        pdf_text (str, opcional): Texto extraído do POP existente.
+        on_stage (callable, opcional): Chamado com o nome de cada etapa iniciada.
+        bypass_cache (bool): Ignora respostas em cache e consulta o modelo.
+
+    Returns:
+        str: Documento LaTeX validado.
+    """
+
+    def enter(stage: str) -> None:
+        if on_stage is not None:
+            on_stage(stage)
+
+    enter("generate")
+    cache_key = response_cache_key(question, pdf_text)
+    response = await _cached_response(cache_key, bypass_cache)
+    cached = response is not None
+    if not cached:
+        response = await chat_with_persona_async(
+            await build_bounded_question(question, pdf_text),
+            accept=has_complete_document,
+        )
+
+    enter("validate")
+    tex_content = validate_tex(response)
+    if not cached:
+        await _store_response(cache_key, tex_content)
+    return tex_content
+
+
+async def stream_pop(
+    question: str,
+    user_id: str,
+    upload: Optional[SpooledUpload] = None,
+    bypass_cache: bool = False,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Executa o pipeline repassando os trechos do LaTeX conforme são gerados.
+
+    A leitura do modelo é encerrada assim que \\end{document} chega; em seguida
+    o documento é validado e compilado.
+
+    Yields:
+        tuple: Nome do evento e seus dados (`token`, `stage` e, por fim, `done`).
+    """
+    pdf_text = None
+    if upload is not None:
+        try:
+            yield "stage", {"stage": "extract"}
+            pdf_text = await extract_uploaded_pdf(upload)
+        finally:
+            # O stream pode ser encerrado no primeiro evento, antes da extração
+            # que removeria o PDF enviado
+            upload.discard()
+
+    yield "stage", {"stage": "generate"}
+    cache_key = response_cache_key(question, pdf_text)
+    response = await _cached_response(cache_key, bypass_cache)
+    cached = response is not None
+    if cached:
+        yield "token", {"text": response, "cached": True}
+    else:
+        chunks = []
+        tail = ""
+        stream = stream_with_persona_async(
+            await build_bounded_question(question, pdf_text)
+        )
+        try:
+            async for text in stream:
+                chunks.append(text)
+                yield "token", {"text": text}
+                # O delimitador pode chegar dividido entre vários trechos
+                window = tail + text
+                if END_DOCUMENT in window:
+                    break
+                tail = window[-len(END_DOCUMENT) :]
+        finally:
+            await stream.aclose()
+        response = "".join(chunks)
+
+    yield "stage", {"stage": "validate"}
+    tex_content = validate_tex(response)
+    if not cached:
+        await _store_response(cache_key, tex_content)
+
+    yield "stage", {"stage": "compile"}
+    result = await compile_pop(tex_content, user_id)
+    result.update(await store_document(user_id, tex_content, question))
+    yield "done", result
+
+
+async def edit_pop(
+    document_id: str,
+    user_id: str,
+    instruction: str,
+    sections: Optional[List[int]] = None,
+    base_version: Optional[int] = None,
+) -> dict:
+    """
+    Edita um POP armazenado regenerando apenas as seções afetadas.
+
+    O modelo recebe o sumário do documento e só as seções a alterar; o texto
+    devolvido substitui essas seções, e o documento remontado é validado,
+    compilado e armazenado como uma nova versão.
+
+    Args:
+        document_id (str): Documento criado por uma geração anterior.
+        user_id (str): Dono do documento.
+        instruction (str): Alteração solicitada.
+        sections (list, opcional): Números das seções a alterar, a partir de
+            1. Sem eles, o modelo escolhe as seções pelo sumário.
+        base_version (int, opcional): Versão editada; padrão, a última.
+
+    Returns:
+        dict: Código LaTeX final, token e URL de download, id e nova versão
+        do documento e as seções alteradas.
+
+    Raises:
+        HTTPException: 404 se o documento ou a versão não existir, 400 para
+            seções inválidas e 409 se a versão base não for a última.
+    """
+    document = await asyncio.to_thread(
+        document_store.get, document_id, user_id, base_version
+    )
+    if document is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    if document["version"] != document["latest_version"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Documento já está na versão {document['latest_version']}",
+        )
+
+    split = split_sections(document["tex"])
+    count = len(split.sections)
+    if sections:
+        numbers = sorted(set(sections))
+        if numbers[0] < 1 or numbers[-1] > count:
+            raise HTTPException(
+                status_code=400, detail=f"Seções válidas: de 1 a {count}"
+            )
+    else:
+        # Chamada curta, só com o sumário, para escolher as seções
+        response = await chat_with_persona_async(
+            build_selection_prompt(split, instruction),
+            system_instruction=PERSONA_SELECAO_SECOES,
+        )
+        numbers = parse_section_numbers(response, count) or list(range(1, count + 1))
+
+    response = await chat_with_persona_async(
+        build_edit_prompt(split, numbers, instruction),
+        system_instruction=PERSONA_EDITOR_SECOES,
+        accept=lambda text: len(parse_edited_sections(text, numbers)) == len(numbers),
+    )
+    edited = parse_edited_sections(response, numbers)
+    if not edited:
+        raise HTTPException(
+            status_code=422, detail="O modelo não devolveu as seções editadas."
+        )
+
+    tex_content = validate_tex(split.join(edited))
+    pdf_path = await compile_pdf(tex_content, artifact_store.staging_directory)
+    # A versão é gravada antes de registrar o PDF: se outra edição vencer, o
+    # PDF é descartado sem ocupar o armazenamento nem ganhar token
+    try:
+        version = await asyncio.to_thread(
+            document_store.add_version,
+            document_id,
+            tex_content,
+            instruction,
+            document["version"],
+        )
+    except VersionConflictError as e:
+        os.remove(pdf_path)
+        raise HTTPException(status_code=409, detail=str(e))
+    result = await register_pdf(pdf_path, tex_content, user_id)
+    result.update(document_id=document_id, version=version, sections=sorted(edited))
+    return result
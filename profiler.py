@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """Profiler por amostragem da pilha de uma thread.
+
+    Uma thread auxiliar lê a pilha da thread alvo a cada `interval` segundos,
+    sem instrumentar as chamadas, e conta quantas vezes cada pilha apareceu.
+    O resultado usa o formato "collapsed stacks" (uma pilha por linha, com os
+    quadros separados por ";" seguidos da contagem), aceito por ferramentas de
+    flame graph como flamegraph.pl e speedscope.
+
+    Perfilando a thread do event loop, as amostras incluem as demais
+    requisições atendidas no mesmo período e não incluem o trabalho feito em
+    pools de threads ou processos.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Pilhas amostradas no formato "collapsed stacks"."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def save(self, path: str) -> None:
+        """Grava as amostras em `path`, criando o diretório se necessário."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.collapsed())
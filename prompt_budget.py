@@ -0,0 +1,166 @@
+import asyncio
+import math
+import re
+from typing import List, Sequence
+
+from fastapi import HTTPException
+
+from config import get_config
+from llm import chat_with_persona_async
+from metrics import track_stage
+from personas import PERSONA_DESCRIPTION_GERAPOP, PERSONA_RESUMO_POP
+
+# Estimativa de tokens por caracteres; texto em português fica perto de 4
+CHARS_PER_TOKEN = 4
+# Reserva para o texto que envolve a pergunta e o POP no prompt
+PROMPT_OVERHEAD_TOKENS = 256
+# Palavras consideradas na relevância de um trecho para a pergunta
+_WORD_PATTERN = re.compile(r"\w{4,}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local do número de tokens de um texto, sem chamar o modelo."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def input_token_budget() -> int:
+    """
+    Tokens disponíveis para o prompt de uma geração.
+
+    O limite vem de `llm_input_token_budgets` (por modelo) ou, para modelos
+    não listados, de `llm_input_token_budget`. Como qualquer modelo de
+    fallback pode responder, vale o menor limite entre eles.
+    """
+    config = get_config()
+    budgets = config["llm_input_token_budgets"]
+    models = [config["llm_model"], *config["llm_fallback_models"]]
+    return min(budgets.get(model, config["llm_input_token_budget"]) for model in models)
+
+
+def split_chunks(text: str, chunk_tokens: int) -> List[str]:
+    """
+    Divide o texto em trechos de até `chunk_tokens` tokens estimados.
+
+    Os cortes são feitos entre parágrafos e, se um parágrafo sozinho passar do
+    limite, entre linhas; só linhas enormes são cortadas no meio.
+    """
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    pieces: List[str] = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            pieces.extend(
+                line[i : i + max_chars] for i in range(0, len(line), max_chars)
+            )
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def select_chunks(chunks: Sequence[str], question: str, limit: int) -> List[str]:
+    """
+    Escolhe os `limit` trechos mais relevantes para a pergunta.
+
+    A relevância é o número de palavras distintas da pergunta presentes no
+    trecho; no empate, vale o trecho mais próximo do início do documento. Os
+    trechos escolhidos mantêm a ordem original.
+    """
+    if len(chunks) <= limit:
+        return list(chunks)
+    terms = {word.lower() for word in _WORD_PATTERN.findall(question)}
+
+    def score(index: int) -> tuple:
+        words = {word.lower() for word in _WORD_PATTERN.findall(chunks[index])}
+        return (-len(terms & words), index)
+
+    chosen = sorted(sorted(range(len(chunks)), key=score)[:limit])
+    return [chunks[index] for index in chosen]
+
+
+def truncate_to_budget(text: str, tokens: int) -> str:
+    """Corta o texto no último parágrafo que cabe no limite de tokens."""
+    max_chars = tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n\n", 0, max_chars)
+    return text[: cut if cut > 0 else max_chars]
+
+
+async def _summarize(chunk: str, question: str, target_tokens: int) -> str:
+    return await chat_with_persona_async(
+        f"Alterações solicitadas:\n{question}\n\n"
+        f"Limite do resumo: cerca de {target_tokens * CHARS_PER_TOKEN // 6} "
+        f"palavras.\n\nTrecho do POP:\n{chunk}",
+        system_instruction=PERSONA_RESUMO_POP,
+    )
+
+
+async def fit_pdf_text(
+    question: str,
+    pdf_text: str,
+    system_instruction: str = PERSONA_DESCRIPTION_GERAPOP,
+) -> str:
+    """
+    Reduz o texto do POP enviado até caber no orçamento de tokens do prompt.
+
+    O orçamento do POP é o do modelo menos a system instruction, a pergunta
+    e o texto que os envolve.
+
+    Textos que já cabem são devolvidos sem alteração. Os demais são
+    divididos em trechos; os mais relevantes para a pergunta (até
+    `pdf_summary_max_chunks`) são resumidos em paralelo (map) e os resumos,
+    na ordem do documento, são juntados (reduce). Se os resumos ainda
+    passarem do limite, a redução é repetida uma vez e, por fim, o texto é
+    truncado.
+
+    Args:
+        question (str): Alterações solicitadas pelo usuário.
+        pdf_text (str): Texto normalizado do POP em PDF.
+        system_instruction (str): Persona enviada junto com o prompt.
+
+    Returns:
+        str: Texto do POP que cabe no orçamento.
+
+    Raises:
+        HTTPException: 413 se a pergunta e a persona, sem o POP, não couberem
+            no orçamento.
+    """
+    config = get_config()
+    budget = (
+        input_token_budget()
+        - estimate_tokens(system_instruction)
+        - estimate_tokens(question)
+        - PROMPT_OVERHEAD_TOKENS
+    )
+    if budget <= 0:
+        raise HTTPException(
+            status_code=413, detail="Pergunta excede o limite de tokens do modelo"
+        )
+    if estimate_tokens(pdf_text) <= budget:
+        return pdf_text
+
+    with track_stage("summarize"):
+        text = pdf_text
+        for _ in range(2):
+            chunks = split_chunks(text, config["pdf_chunk_tokens"])
+            chunks = select_chunks(chunks, question, config["pdf_summary_max_chunks"])
+            target = max(budget // len(chunks), 64)
+            summaries = await asyncio.gather(
+                *(_summarize(chunk, question, target) for chunk in chunks)
+            )
+            text = "\n\n".join(summary.strip() for summary in summaries)
+            if estimate_tokens(text) <= budget:
+                return text
+        return truncate_to_budget(text, budget)
@@ -0,0 +1,35 @@
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Identificador da requisição em andamento (usado nos logs)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Duração acumulada de cada etapa da requisição em andamento, em segundos. O
+# dicionário é compartilhado com as tarefas criadas durante a requisição, que
+# herdam o contexto.
+timings_var: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Soma a duração de uma etapa aos tempos da requisição, se houver uma."""
+    timings = timings_var.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def format_server_timing(timings: Dict[str, float], total: float) -> str:
+    """
+    Monta o valor do cabeçalho Server-Timing.
+
+    Args:
+        timings (dict): Duração de cada etapa, em segundos.
+        total (float): Tempo até o envio dos cabeçalhos, em segundos.
+
+    Returns:
+        str: Por exemplo, "generate;dur=812.4, compile;dur=95.0, total;dur=915.2".
+    """
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import time
+
+import jwt
+import pytest
+
+import users
+from auth import ALGORITHM, SECRET_KEY, JWTBearer, VerifiedTokenCache
+from auth import create_access_token, verified_tokens
+from users import UserStore, hash_password, verify_password
+
+
+def test_expired_tokens_are_evicted_from_the_cache():
+    cache = VerifiedTokenCache(max_entries=4)
+    cache.set("old", {"sub": "a", "exp": time.time() - 1})
+    cache.set("new", {"sub": "b", "exp": time.time() + 60})
+
+    assert cache.get("old") is None
+    assert list(cache._entries) == ["new"]
+
+
+def test_cache_discards_the_least_recently_used_token():
+    cache = VerifiedTokenCache(max_entries=2)
+    exp = time.time() + 60
+    cache.set("a", {"sub": "a", "exp": exp})
+    cache.set("b", {"sub": "b", "exp": exp})
+    cache.get("a")
+    cache.set("c", {"sub": "c", "exp": exp})
+
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_tampered_token_is_rejected_even_when_the_original_is_cached():
+    bearer = JWTBearer()
+    token = create_access_token({"sub": "maria"})
+    assert bearer.verify_jwt(token)["sub"] == "maria"
+    assert verified_tokens.get(token) is not None
+
+    header, payload, signature = token.split(".")
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    forged = jwt.encode({**claims, "sub": "admin"}, "x" * 32, algorithm=ALGORITHM)
+    # Mesmo cabeçalho e assinatura, payload trocado
+    spliced = ".".join([header, forged.split(".")[1], signature])
+
+    assert bearer.verify_jwt(forged) is None
+    assert bearer.verify_jwt(spliced) is None
+    assert bearer.verify_jwt(token[:-2] + "xx") is None
+
+
+def test_scrypt_hash_round_trip():
+    encoded = hash_password("segredo")
+    assert encoded.startswith("scrypt$")
+    assert verify_password("segredo", encoded)
+    assert not verify_password("errada", encoded)
+
+
+def test_pbkdf2_hash_round_trip(monkeypatch):
+    # Sem scrypt no OpenSSL, o hash recai no PBKDF2
+    monkeypatch.delattr(hashlib, "scrypt")
+    monkeypatch.setattr(users, "PBKDF2_ITERATIONS", 1000)
+    encoded = hash_password("segredo")
+
+    assert encoded.startswith("pbkdf2_sha256$1000$")
+    assert verify_password("segredo", encoded)
+    assert not verify_password("errada", encoded)
+
+
+@pytest.mark.parametrize("encoded", ["", "md5$abc$def", "scrypt$x$8$1$AA==$AA=="])
+def test_malformed_hashes_never_match(encoded):
+    assert not verify_password("segredo", encoded)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UserStore(str(tmp_path / "users.json"))
+
+
+def test_unknown_user_is_checked_against_the_dummy_hash(store, monkeypatch):
+    store.set_password("maria", "segredo")
+    checked = []
+    real_verify = users.verify_password
+
+    def spy(password, encoded):
+        checked.append(encoded)
+        return real_verify(password, encoded)
+
+    monkeypatch.setattr(users, "verify_password", spy)
+
+    assert not store.check_password("joao", "segredo")
+    assert not store.check_password("joao", "segredo")
+    # O mesmo hash fictício, criado uma vez, é verificado a cada tentativa
+    assert len(checked) == 2 and checked[0] == checked[1]
+    assert checked[0] == store._dummy_hash
+    assert store.check_password("maria", "segredo")
+
+
+def test_store_reloads_when_the_file_changes(store):
+    store.set_password("maria", "segredo")
+    assert store.usernames() == ["maria"]
+
+    # Outro processo (ex.: python users.py add) grava o arquivo
+    with open(store.path, encoding="utf-8") as file:
+        data = json.load(file)
+    data["joao"] = {"password_hash": hash_password("outra")}
+    with open(store.path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    stat = os.stat(store.path)
+    os.utime(store.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert store.usernames() == ["joao", "maria"]
+    assert store.check_password("joao", "outra")
+
+    os.remove(store.path)
+    assert store.usernames() == []
@@ -0,0 +1,170 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+import batch
+from batch import BatchItem, check_pdf_references, parse_batch_items, run_batch
+from utils import SpooledUpload
+
+
+def test_jsonl_items():
+    data = (
+        '{"id": "a", "question": "Limpeza", "pdf": "manual.pdf"}\n'
+        "\n"
+        '{"question": "Recebimento"}\n'
+    ).encode()
+
+    assert parse_batch_items(data, "lote.jsonl") == [
+        BatchItem("a", "Limpeza", "manual.pdf"),
+        BatchItem("002", "Recebimento"),
+    ]
+
+
+def test_csv_items_with_bom():
+    data = '\ufeffid,question,pdf\na,Limpeza,\nb,"Recebimento, conferência",m.pdf\n'
+
+    assert parse_batch_items(data.encode(), "lote.csv") == [
+        BatchItem("a", "Limpeza"),
+        BatchItem("b", "Recebimento, conferência", "m.pdf"),
+    ]
+
+
+def test_format_is_detected_without_extension():
+    assert parse_batch_items(b'{"question": "Limpeza"}', None)[0].question == "Limpeza"
+    assert parse_batch_items(b"question\nLimpeza\n", None)[0].question == "Limpeza"
+
+
+def test_ids_are_sanitised():
+    data = (
+        b'{"id": "../../etc/passwd", "question": "a"}\n{"id": "...", "question": "b"}'
+    )
+
+    assert [item.id for item in parse_batch_items(data, "lote.jsonl")] == [
+        "etc_passwd",
+        "002",
+    ]
+
+
+@pytest.mark.parametrize(
+    "data, status, detail",
+    [
+        (b'{"id": "a b", "question": "x"}\n{"id": "a/b", "question": "y"}', 400, "a_b"),
+        (b'{"question": "x"}\n{"id": "001", "question": "y"}', 400, "001"),
+        (b'{"question": "x"}\n[1]', 400, "Linha 2"),
+        (b'{"question": ""}', 400, "question"),
+        (b"", 400, "vazio"),
+        (b"\xff\xfe", 400, "UTF-8"),
+    ],
+)
+def test_invalid_batches_are_rejected(data, status, detail):
+    with pytest.raises(HTTPException) as error:
+        parse_batch_items(data, "lote.jsonl")
+    assert error.value.status_code == status
+    assert detail in error.value.detail
+
+
+def test_batch_size_limit(monkeypatch):
+    monkeypatch.setattr(batch, "get_config", lambda: {"batch_max_items": 2})
+    data = b"question\na\nb\nc\n"
+
+    with pytest.raises(HTTPException) as error:
+        parse_batch_items(data, "lote.csv")
+    assert error.value.status_code == 413
+
+
+def test_missing_pdfs_are_reported():
+    items = [BatchItem("a", "x", "b.pdf"), BatchItem("b", "y", "a.pdf")]
+    uploads = {"a.pdf": SpooledUpload("/tmp/a.pdf", 1, "0" * 64)}
+
+    with pytest.raises(HTTPException) as error:
+        check_pdf_references(items, uploads)
+    assert error.value.detail == "PDFs não enviados: b.pdf"
+    check_pdf_references(items[1:], uploads)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Substitui as etapas do pipeline; a pergunta "falha" gera um erro."""
+    extracted = []
+
+    async def extract_uploaded_pdf(upload):
+        extracted.append(upload.path)
+        return "texto do PDF"
+
+    async def generate_tex(question, text, bypass_cache=False):
+        if question == "falha":
+            raise HTTPException(status_code=502, detail="Resposta inválida")
+        await asyncio.sleep(0.01 if question == "lenta" else 0)
+        return f"% {question} {text}"
+
+    async def compile_pdf(tex_content, directory):
+        path = os.path.join(directory, f"{abs(hash(tex_content))}.pdf")
+        with open(path, "wb") as file:
+            file.write(b"%PDF-1.4 " + tex_content.encode())
+        return path
+
+    async def store_document(user_id, tex_content, question):
+        return {"document_id": f"doc-{question}", "version": 1}
+
+    monkeypatch.setattr(batch, "extract_uploaded_pdf", extract_uploaded_pdf)
+    monkeypatch.setattr(batch, "generate_tex", generate_tex)
+    monkeypatch.setattr(batch, "compile_pdf", compile_pdf)
+    monkeypatch.setattr(batch, "store_document", store_document)
+    return extracted
+
+
+def build_zip(items, uploads):
+    async def collect():
+        return b"".join([part async for part in run_batch(items, uploads, "user")])
+
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(collect())))
+
+
+def test_streamed_zip_ends_with_the_manifest(pipeline, tmp_path):
+    upload_path = tmp_path / "m.pdf"
+    upload_path.write_bytes(b"%PDF")
+    uploads = {"m.pdf": SpooledUpload(str(upload_path), 4, "0" * 64)}
+    items = [
+        BatchItem("lenta", "lenta", "m.pdf"),
+        BatchItem("rapida", "rápida", "m.pdf"),
+    ]
+
+    archive = build_zip(items, uploads)
+
+    assert archive.testzip() is None
+    assert archive.namelist()[-1] == "manifest.json"
+    assert sorted(archive.namelist()[:-1]) == [
+        "lenta.pdf",
+        "lenta.tex",
+        "rapida.pdf",
+        "rapida.tex",
+    ]
+    assert archive.read("rapida.tex").decode() == "% rápida texto do PDF"
+    assert archive.read("lenta.pdf").startswith(b"%PDF-1.4")
+    # O PDF citado por dois itens é extraído uma vez e removido no fim
+    assert pipeline == [str(upload_path)]
+    assert not upload_path.exists()
+
+
+def test_failed_item_is_listed_and_others_complete(pipeline):
+    items = [BatchItem("a", "ok"), BatchItem("b", "falha"), BatchItem("c", "outro")]
+
+    archive = build_zip(items, {})
+    manifest = json.loads(archive.read("manifest.json"))
+
+    assert (manifest["total"], manifest["done"]) == (3, 2)
+    assert [entry["id"] for entry in manifest["items"]] == ["a", "b", "c"]
+    assert [entry["status"] for entry in manifest["items"]] == [
+        "done",
+        "failed",
+        "done",
+    ]
+    assert manifest["items"][1]["error"] == "Resposta inválida"
+    assert manifest["items"][0]["document_id"] == "doc-ok"
+    assert "b.pdf" not in archive.namelist()
+    assert {"a.pdf", "c.tex"} <= set(archive.namelist())
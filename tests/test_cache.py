@@ -0,0 +1,40 @@
+import asyncio
+
+from cache import TieredCache
+
+
+def test_disk_tier_keeps_the_newest_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = TieredCache(max_entries=2, disk_path=path, disk_max_entries=3)
+    for number in range(5):
+        cache.set(f"k{number}", f"v{number}")
+
+    # Um cache novo só enxerga o disco
+    reopened = TieredCache(disk_path=path)
+    assert [reopened.get(f"k{number}") for number in range(5)] == [
+        None,
+        None,
+        "v2",
+        "v3",
+        "v4",
+    ]
+    assert cache.stats()["disk_evictions"] == 2
+
+
+def test_async_access_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    asyncio.run(TieredCache(disk_path=path).set_async("key", "value"))
+
+    cache = TieredCache(disk_path=path)
+    assert asyncio.run(cache.get_async("key")) == "value"
+    assert asyncio.run(cache.get_async("key")) == "value"
+    assert asyncio.run(cache.get_async("missing")) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (2, 1, 1)
+
+
+def test_expired_disk_entries_are_not_returned(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    TieredCache(ttl_seconds=-1, disk_path=path).set("key", "value")
+
+    assert TieredCache(disk_path=path).get("key") is None
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import utils
+from benchmarks.common import FAKE_PDFLATEX
+from config import get_config
+from latex_log import LatexCompileError, LatexMessage
+
+DOCUMENT = "\\documentclass{article}\n\\begin{document}\nPOP\n\\end{document}\n"
+
+
+@pytest.fixture
+def config(monkeypatch):
+    config = {
+        **get_config(),
+        "pdflatex_path": FAKE_PDFLATEX,
+        "latex_timeout_seconds": 10,
+        "latex_max_runs": 3,
+    }
+    monkeypatch.setattr(utils, "get_config", lambda: config)
+    monkeypatch.setattr(utils, "latex_format", None)
+    monkeypatch.setenv("FAKE_PDFLATEX_DELAY", "0")
+    return config
+
+
+def runs(job_directory):
+    with open(os.path.join(job_directory, "document.runs")) as file:
+        return int(file.read())
+
+
+@pytest.mark.parametrize(
+    "reruns, max_runs, expected", [(0, 3, 1), (1, 3, 2), (5, 3, 3)]
+)
+def test_pdflatex_reruns_until_the_log_settles(
+    config, monkeypatch, tmp_path, reruns, max_runs, expected
+):
+    monkeypatch.setenv("FAKE_PDFLATEX_RERUNS", str(reruns))
+    config["latex_max_runs"] = max_runs
+    utils._write_document(str(tmp_path), DOCUMENT)
+
+    log = utils._compile_document(FAKE_PDFLATEX, str(tmp_path))
+
+    assert runs(tmp_path) == expected
+    # No limite de execuções, o último log ainda pede outra
+    assert log.needs_rerun == (reruns >= max_runs)
+
+
+def test_compile_latex_moves_the_pdf_and_cleans_up(config, tmp_path):
+    pdf_path = utils.compile_latex(DOCUMENT, str(tmp_path))
+
+    assert os.path.dirname(pdf_path) == str(tmp_path)
+    with open(pdf_path, "rb") as file:
+        assert file.read(8) == b"%PDF-1.4"
+    assert os.listdir(tmp_path) == [os.path.basename(pdf_path)]
+
+
+def failure(config, tmp_path, document=DOCUMENT):
+    with pytest.raises(LatexCompileError) as error:
+        utils.compile_latex(document, str(tmp_path))
+    assert os.listdir(tmp_path) == []
+    return error.value
+
+
+def test_document_error_reports_the_line(config, tmp_path):
+    document = DOCUMENT.replace("POP\n", "POP\n\\undefined\n")
+
+    error = failure(config, tmp_path, document)
+
+    assert error.reason == "error"
+    assert error.errors == [
+        LatexMessage("Undefined control sequence.", 4, "\\undefined")
+    ]
+
+
+def test_timeout_is_reported(config, monkeypatch, tmp_path):
+    monkeypatch.setenv("FAKE_PDFLATEX_DELAY", "5")
+    config["latex_timeout_seconds"] = 0.2
+
+    assert failure(config, tmp_path).reason == "timeout"
+
+
+def test_killed_process_is_reported_as_a_limit(config, monkeypatch, tmp_path):
+    # SIGKILL, como no limite de CPU ou de memória
+    monkeypatch.setenv("FAKE_PDFLATEX_SIGNAL", "9")
+
+    assert failure(config, tmp_path).reason == "limit"
+
+
+def test_failures_are_logged_with_the_first_error(config, monkeypatch, tmp_path):
+    logged = []
+    monkeypatch.setattr(
+        utils.api_logger, "log_error", lambda error, context: logged.append(context)
+    )
+    document = DOCUMENT.replace("POP\n", "\\undefined\n\\undefined\n")
+
+    failure(config, tmp_path, document)
+
+    assert logged == [
+        {
+            "stage": "pdflatex",
+            "reason": "error",
+            "first_error": {
+                "message": "Undefined control sequence.",
+                "line": 3,
+                "context": "\\undefined",
+                "package": None,
+            },
+        }
+    ]
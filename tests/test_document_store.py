@@ -0,0 +1,45 @@
+import pytest
+
+from document_store import DocumentStore, VersionConflictError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(str(tmp_path / "documents.sqlite3"))
+
+
+def test_versions_advance_from_the_latest(store):
+    document_id, version = store.create("maria", "v1", "Crie um POP")
+    assert version == 1
+
+    assert store.add_version(document_id, "v2", "Ajuste", 1) == 2
+    assert store.get(document_id, "maria")["tex"] == "v2"
+    assert store.get(document_id, "maria", 1)["tex"] == "v1"
+    assert [v["version"] for v in store.versions(document_id, "maria")] == [1, 2]
+
+
+def test_stale_base_version_conflicts_without_writing(store):
+    document_id, _ = store.create("maria", "v1", "Crie um POP")
+    store.add_version(document_id, "v2", "Primeira edição", 1)
+
+    with pytest.raises(VersionConflictError) as error:
+        store.add_version(document_id, "outra v2", "Edição concorrente", 1)
+
+    assert error.value.latest_version == 2
+    assert store.get(document_id, "maria")["tex"] == "v2"
+    assert len(store.versions(document_id, "maria")) == 2
+    # A transação foi desfeita: a conexão continua utilizável
+    assert store.add_version(document_id, "v3", "Depois", 2) == 3
+
+
+def test_unknown_document_conflicts_with_version_zero(store):
+    with pytest.raises(VersionConflictError) as error:
+        store.add_version("inexistente", "v2", "Ajuste", 1)
+    assert error.value.latest_version == 0
+
+
+def test_documents_of_other_users_are_hidden(store):
+    document_id, _ = store.create("maria", "v1", "Crie um POP")
+
+    assert store.get(document_id, "joao") is None
+    assert store.versions(document_id, "joao") == []
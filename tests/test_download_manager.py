@@ -0,0 +1,150 @@
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from download_manager import (
+    DownloadManager,
+    MemoryTokenStore,
+    RedisTokenStore,
+    SqliteTokenStore,
+)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Servidor RESP mínimo com os comandos usados pelo RedisTokenStore."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.strings = {}  # chave -> (valor, expiração em segundos ou None)
+        self.sorted_sets = {}  # chave -> {membro: score}
+        self.lock = threading.Lock()
+
+    def execute(self, command, *args):
+        now = time.time()
+        strings, sorted_sets = self.strings, self.sorted_sets
+        if command == "SET":
+            key, value, *options = args
+            expires_at = None
+            if options and options[0].upper() == "PX":
+                expires_at = now + int(options[1]) / 1000
+            strings[key] = (value, expires_at)
+            return "OK"
+        if command in ("GET", "GETDEL"):
+            key = args[0]
+            entry = strings.pop(key, None) if command == "GETDEL" else strings.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                # Chave expirada, como a expiração passiva do Redis
+                strings.pop(key, None)
+                entry = None
+            return None if entry is None else entry[0]
+        if command == "ZADD":
+            key, score, member = args
+            sorted_sets.setdefault(key, {})[member] = float(score)
+            return 1
+        if command == "ZREM":
+            return int(sorted_sets.get(args[0], {}).pop(args[1], None) is not None)
+        if command == "ZREMRANGEBYSCORE":
+            key, low, high = args
+            members = sorted_sets.get(key, {})
+            removed = [m for m, score in members.items() if score <= float(high)]
+            for member in removed:
+                del members[member]
+            return len(removed)
+        if command == "ZCARD":
+            return len(sorted_sets.get(args[0], {}))
+        raise ValueError(f"ERR unknown command '{command}'")
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+    def handle(self):
+        while (args := self.read_command()) is not None:
+            try:
+                with self.server.lock:
+                    reply = self.server.execute(args[0].upper(), *args[1:])
+            except ValueError as e:
+                self.wfile.write(f"-{e}\r\n".encode())
+                continue
+            if reply is None:
+                self.wfile.write(b"$-1\r\n")
+            elif isinstance(reply, int):
+                self.wfile.write(b":%d\r\n" % reply)
+            elif reply == "OK":
+                self.wfile.write(b"+OK\r\n")
+            else:
+                value = reply.encode("utf-8")
+                self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+
+
+@pytest.fixture
+def fake_redis():
+    server = FakeRedisServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryTokenStore()
+    if request.param == "sqlite":
+        return SqliteTokenStore(str(tmp_path / "tokens.sqlite3"))
+    host, port = request.getfixturevalue("fake_redis").server_address
+    return RedisTokenStore(f"redis://{host}:{port}/0")
+
+
+def test_consume_is_single_use(store):
+    manager = DownloadManager(store)
+    token = manager.create_download_token("ab/pop.pdf", "user", "ab12")
+
+    assert manager.get_download(token) == {
+        "filename": "ab/pop.pdf",
+        "user_id": "user",
+        "sha256": "ab12",
+    }
+    # get_download não consome: o download pode ser retomado
+    assert manager.get_download(token) is not None
+    assert store.consume(token)["filename"] == "ab/pop.pdf"
+    assert store.consume(token) is None
+    assert manager.get_download(token) is None
+
+
+def test_concurrent_consume_has_one_winner(store):
+    token = DownloadManager(store).create_download_token("pop.pdf", "user")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: store.consume(token), range(8)))
+
+    assert sum(result is not None for result in results) == 1
+
+
+def test_expired_tokens_are_invalid_and_swept(store):
+    manager = DownloadManager(store, ttl_minutes=0.1 / 60)
+    expired = manager.create_download_token("old.pdf", "user")
+    time.sleep(0.2)
+    manager.ttl_seconds = 60
+    valid = manager.create_download_token("new.pdf", "user")
+
+    assert manager.get_download(expired) is None
+    assert manager.sweep_expired() == 1
+    assert store.count() == 1
+    assert store.consume(expired) is None
+    assert manager.get_download(valid)["filename"] == "new.pdf"
@@ -0,0 +1,68 @@
+import asyncio
+
+from jobs import JobManager
+
+
+async def collect_events(job):
+    return [payload["event"] async for payload in job.subscribe()]
+
+
+def test_cancelled_job_ends_the_event_stream():
+    async def scenario():
+        manager = JobManager()
+
+        async def run(on_stage):
+            on_stage("generate")
+            await asyncio.sleep(60)
+
+        job = manager.create_job("user", run)
+        subscriber = asyncio.create_task(collect_events(job))
+        await asyncio.sleep(0.01)
+        await manager.cancel_all()
+        return job, await asyncio.wait_for(subscriber, timeout=1)
+
+    job, events = asyncio.run(scenario())
+    assert events == ["queued", "stage", "cancelled"]
+    assert job.to_dict()["status"] == "cancelled"
+    assert job.finished_at is not None
+
+
+def test_job_cancelled_while_queued_runs_cleanup(tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF")
+
+    async def scenario():
+        manager = JobManager()
+        started = []
+
+        async def run(on_stage):
+            started.append(True)
+
+        job = manager.create_job("user", run, cleanup=upload.unlink)
+        # Cancelado antes da primeira execução da task
+        job.task.cancel()
+        await manager.cancel_all()
+        await asyncio.sleep(0)
+        return job, started
+
+    job, started = asyncio.run(scenario())
+    assert started == []
+    assert job.status == "cancelled"
+    assert job.events[-1]["event"] == "cancelled"
+    assert not upload.exists()
+
+
+def test_finished_jobs_are_purged_on_get_job():
+    async def scenario():
+        manager = JobManager(ttl_minutes=0)
+
+        async def run(on_stage):
+            return {"ok": True}
+
+        job = manager.create_job("user", run)
+        await job.task
+        assert job.finished_at.tzinfo is not None
+        await asyncio.sleep(0.01)
+        return manager.get_job(job.id, "user")
+
+    assert asyncio.run(scenario()) is None
@@ -0,0 +1,72 @@
+from latex_log import LatexMessage, parse_log, read_log
+
+LOG = r"""This is pdfTeX, Version 3.141592653-2.6-1.40.25
+(./document.tex
+LaTeX2e <2023-11-01>
+! Undefined control sequence.
+l.12 \textbff
+             {Objetivo}
+The control sequence at the end of the top line
+of your error message was never \def'ed.
+
+! Missing $ inserted.
+<inserted text>
+                $
+l.30 x_
+       1
+LaTeX Font Warning: Font shape `OT1/cmr/bx/n' in size <5> not available
+(Font)              size <7> substituted on input line 18.
+
+Package hyperref Warning: Token not allowed in a PDF string (Unicode):
+(hyperref)                removing `math shift' on input line 41.
+
+LaTeX Warning: Reference `LastPage' on page 1 undefined on input line 7.
+
+LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.
+
+! Emergency stop.
+<*> document.tex
+"""
+
+
+def test_errors_carry_the_document_line_and_context():
+    log = parse_log(LOG)
+
+    assert log.errors == [
+        LatexMessage("Undefined control sequence.", 12, r"\textbff"),
+        LatexMessage("Missing $ inserted.", 30, "x_"),
+    ]
+
+
+def test_warnings_join_continuation_lines():
+    warnings = parse_log(LOG).warnings
+
+    assert warnings[0] == LatexMessage(
+        "Font shape `OT1/cmr/bx/n' in size <5> not available "
+        "size <7> substituted on input line 18.",
+        18,
+    )
+    assert warnings[1] == LatexMessage(
+        "Token not allowed in a PDF string (Unicode): "
+        "removing `math shift' on input line 41.",
+        41,
+        package="hyperref",
+    )
+    assert warnings[2].line == 7 and warnings[2].package is None
+
+
+def test_rerun_request_is_detected():
+    assert parse_log(LOG).needs_rerun
+    assert not parse_log(LOG.replace("Rerun to get", "Run to get")).needs_rerun
+
+
+def test_error_without_line_number():
+    log = parse_log(
+        "! LaTeX Error: File `missing.sty' not found.\n\n! Emergency stop.\n"
+    )
+
+    assert log.errors == [LatexMessage("LaTeX Error: File `missing.sty' not found.")]
+
+
+def test_missing_log_is_empty(tmp_path):
+    assert read_log(str(tmp_path / "document.log")) == ([], [], False)
@@ -0,0 +1,61 @@
+import pytest
+
+from latex_sections import parse_edited_sections, split_sections
+
+PREAMBLE = "\\documentclass{article}\n\\usepackage{lastpage}\n\\begin{document}\n"
+
+DOCUMENTS = {
+    "sections": PREAMBLE
+    + "\\maketitle\n\n\\section{Objetivo}\nTexto.\n\n"
+    + "% Responsáveis pela execução\n\\section*{Responsáveis}\nEquipe.\n"
+    + "  \\section {Procedimento}\n\\begin{enumerate}\n\\item Passo\n\\end{enumerate}\n"
+    + "\\end{document}\n",
+    "no_sections": PREAMBLE + "Só um parágrafo.\n\\end{document}",
+    "inline_section": PREAMBLE + "Ver \\section{x} no texto? Não.\n\\end{document}\n",
+    "crlf": PREAMBLE.replace("\n", "\r\n")
+    + "\\section{A}\r\nUm.\r\n\\section{B}\r\nDois.\r\n\\end{document}\r\n",
+}
+
+
+@pytest.mark.parametrize("name", DOCUMENTS)
+def test_split_then_join_gives_the_original(name):
+    document = DOCUMENTS[name]
+    split = split_sections(document)
+
+    assert split.join() == document
+    assert split.head + "".join(s.text for s in split.sections) + split.tail == document
+
+
+def test_sections_include_their_leading_comments():
+    split = split_sections(DOCUMENTS["sections"])
+
+    assert [section.title for section in split.sections] == [
+        "Objetivo",
+        "Responsáveis",
+        "Procedimento",
+    ]
+    assert split.head.endswith("\\maketitle\n")
+    assert split.sections[1].text.startswith("% Responsáveis pela execução\n")
+    assert split.tail == "\\end{document}\n"
+
+
+def test_document_without_sections_is_one_section():
+    split = split_sections(DOCUMENTS["no_sections"])
+
+    assert [section.title for section in split.sections] == ["Documento"]
+    assert split.sections[0].text == "Só um parágrafo.\n"
+
+
+def test_join_replaces_only_the_edited_sections():
+    split = split_sections(DOCUMENTS["sections"])
+    edited = parse_edited_sections(
+        "```latex\n%%% SECAO 2\n\\section*{Responsáveis}\nQualidade.\n```", [2]
+    )
+
+    result = split.join(edited)
+
+    assert result == DOCUMENTS["sections"].replace(
+        "% Responsáveis pela execução\n\\section*{Responsáveis}\nEquipe.\n",
+        "\\section*{Responsáveis}\nQualidade.\n",
+    )
+    assert split_sections(result).join() == result
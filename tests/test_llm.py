@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+import llm
+import llm_providers
+from llm_providers import (
+    FakeProvider,
+    LLMChunk,
+    LLMResult,
+    QuotaExceededError,
+    ResilientLLM,
+    TransientLLMError,
+    backoff_delay,
+)
+
+
+class ScriptedProvider(FakeProvider):
+    """FakeProvider com um roteiro por chamada: atraso em segundos ou exceção."""
+
+    def __init__(self, model, script=(), on_call=None):
+        super().__init__(model)
+        self.script = list(script)
+        self.on_call = on_call
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate(self, prompt, system_instruction):
+        self.calls += 1
+        call = self.calls
+        step = self.script[call - 1] if call <= len(self.script) else 0.0
+        if self.on_call is not None:
+            self.on_call()
+        if isinstance(step, Exception):
+            raise step
+        try:
+            await asyncio.sleep(step)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return LLMResult(f"{self.model}#{call}", self._usage(prompt), self.model)
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Registra as esperas pedidas ao backoff, sem esperar de fato."""
+    delays = []
+
+    def record(attempt, base, cap=30.0):
+        delays.append((attempt, base))
+        return 0
+
+    monkeypatch.setattr(llm_providers, "backoff_delay", record)
+    return delays
+
+
+def test_hedge_cancels_the_losing_request():
+    provider = ScriptedProvider("a", [10, 0])
+    client = ResilientLLM([provider], hedge_delay=0.01)
+
+    async def scenario():
+        result = await client.generate("p", "s")
+        # Deixa o cancelamento do pedido perdedor chegar ao provedor
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(scenario()).text == "a#2"
+    assert provider.calls == 2
+    assert provider.cancelled == 1
+
+
+def test_quota_error_skips_retries_and_falls_back(backoffs):
+    primary = ScriptedProvider("a", [QuotaExceededError("429")] * 3)
+    fallback = ScriptedProvider("b")
+    client = ResilientLLM([primary, fallback], retry_attempts=2)
+
+    result = asyncio.run(client.generate("p", "s"))
+
+    assert (result.model, primary.calls, fallback.calls) == ("b", 1, 1)
+    assert backoffs == []
+
+
+def test_timeouts_are_retried_with_backoff(backoffs):
+    provider = ScriptedProvider("a", [1, 1, 0])
+    client = ResilientLLM(
+        [provider], retry_attempts=2, retry_base_delay=0.25, attempt_timeout=0.05
+    )
+
+    result = asyncio.run(client.generate("p", "s"))
+
+    assert result.text == "a#3"
+    assert provider.cancelled == 2
+    assert backoffs == [(0, 0.25), (1, 0.25)]
+
+
+def test_timeouts_exhaust_retries_then_raise(backoffs):
+    provider = ScriptedProvider("a", [1, 1])
+    client = ResilientLLM([provider], retry_attempts=1, attempt_timeout=0.02)
+
+    with pytest.raises(TransientLLMError):
+        asyncio.run(client.generate("p", "s"))
+    assert provider.calls == 2
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, 0.5, cap=4)
+        assert 0 <= delay <= min(4, 0.5 * 2**attempt)
+
+
+class BrokenStreamProvider(FakeProvider):
+    """Envia um trecho e então falha de forma transitória."""
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.calls = 0
+
+    async def stream(self, prompt, system_instruction):
+        self.calls += 1
+        yield LLMChunk("primeiro")
+        raise TransientLLMError("conexão perdida")
+
+
+def test_stream_is_not_retried_after_the_first_chunk(backoffs):
+    primary = BrokenStreamProvider("a")
+    fallback = ScriptedProvider("b")
+    client = ResilientLLM([primary, fallback], retry_attempts=2)
+
+    async def consume():
+        received = []
+        with pytest.raises(TransientLLMError):
+            async for chunk in client.stream("p", "s"):
+                received.append((chunk.text, chunk.model))
+        return received
+
+    assert asyncio.run(consume()) == [("primeiro", "a")]
+    assert (primary.calls, fallback.calls) == (1, 0)
+    assert backoffs == []
+
+
+def test_hedged_call_holds_a_single_semaphore_permit(monkeypatch):
+    permits = []
+
+    async def scenario():
+        semaphore = asyncio.Semaphore(2)
+        provider = ScriptedProvider(
+            "a", [10, 0], on_call=lambda: permits.append(semaphore._value)
+        )
+        monkeypatch.setattr(llm, "_llm_semaphore", semaphore)
+        monkeypatch.setattr(
+            llm, "llm_client", ResilientLLM([provider], hedge_delay=0.01)
+        )
+        text = await llm.chat_with_persona_async("pergunta", timeout=5)
+        return text, provider.calls, semaphore._value
+
+    text, calls, released = asyncio.run(scenario())
+    assert (text, calls) == ("a#2", 2)
+    # Pedido original e hedge rodam sob a mesma permissão
+    assert permits == [1, 1]
+    assert released == 2
@@ -0,0 +1,59 @@
+import json
+import logging
+
+import pytest
+
+from logger import APILogger
+from metrics import log_records_dropped
+
+
+@pytest.fixture
+def logger_factory(tmp_path, monkeypatch):
+    # APILogger reconfigura os loggers globais; restaura os handlers da aplicação
+    monkeypatch.chdir(tmp_path)
+    loggers = [logging.getLogger(name) for name in ("api_logger", "security_logger")]
+    saved = [list(logger.handlers) for logger in loggers]
+    created = []
+
+    def create(**kwargs):
+        api_logger = APILogger(console=False, **kwargs)
+        created.append(api_logger)
+        return api_logger
+
+    yield create
+    for api_logger in created:
+        api_logger.shutdown()
+    for logger, handlers in zip(loggers, saved):
+        logger.handlers = handlers
+
+
+def dropped() -> float:
+    return log_records_dropped._values.get((), 0)
+
+
+def test_full_queue_drops_and_counts_records(logger_factory, tmp_path):
+    api_logger = logger_factory(max_queued=3)
+    before = dropped()
+
+    # Sem start(), nada esvazia a fila
+    for index in range(5):
+        api_logger.log_error(ValueError(str(index)))
+
+    assert dropped() - before == 2
+    api_logger.start()
+    api_logger.shutdown()
+    lines = (tmp_path / "logs" / "api.log").read_text().splitlines()
+    assert [json.loads(line)["error_message"] for line in lines] == ["0", "1", "2"]
+
+
+def test_shutdown_with_a_full_queue_writes_every_queued_record(
+    logger_factory, tmp_path
+):
+    api_logger = logger_factory(max_queued=2)
+    api_logger.log_security_event("login", {"user": "a"})
+    api_logger.log_security_event("login", {"user": "b"})
+
+    api_logger.start()
+    api_logger.shutdown()
+    lines = (tmp_path / "logs" / "security.log").read_text().splitlines()
+    assert [json.loads(line)["user"] for line in lines] == ["a", "b"]
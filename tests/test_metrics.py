@@ -0,0 +1,125 @@
+import re
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Counter, Gauge, Histogram, Registry, cached, track_stage
+from middleware import RequestContextMiddleware
+from request_context import format_server_timing
+
+# Uma amostra do formato texto: nome{rótulos} valor
+SAMPLE = re.compile(
+    r'([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-z_]+="(?:[^"\\]|\\.)*",?)*\})? (\S+)'
+)
+
+
+def parse(text):
+    """Converte o formato texto do Prometheus em {(nome, rótulos): valor}."""
+    samples = {}
+    types = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+            continue
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.fullmatch(line)
+        assert match, f"amostra inválida: {line!r}"
+        name, labels, value = match.groups()
+        samples[(name, labels or "")] = float(value)
+    return types, samples
+
+
+def test_counter_and_gauge_render_labels_and_functions():
+    counter = Counter("test_requests_total", "Pedidos.", ("path",))
+    counter.inc(path="/a")
+    counter.inc(2, path='/b"\n')
+    gauge = Gauge("test_queue", "Fila.")
+    gauge.set_function(lambda: 7)
+
+    types, samples = parse(counter.render() + gauge.render())
+
+    assert types == {"test_requests_total": "counter", "test_queue": "gauge"}
+    assert samples[("test_requests_total", '{path="/a"}')] == 1
+    assert samples[("test_requests_total", '{path="/b\\"\\n"}')] == 2
+    assert samples[("test_queue", "")] == 7
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Duração.", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, stage="x")
+
+    _, samples = parse(histogram.render())
+
+    assert samples[("test_seconds_bucket", '{stage="x",le="0.1"}')] == 1
+    assert samples[("test_seconds_bucket", '{stage="x",le="1"}')] == 3
+    assert samples[("test_seconds_bucket", '{stage="x",le="+Inf"}')] == 4
+    assert samples[("test_seconds_count", '{stage="x"}')] == 4
+    assert samples[("test_seconds_sum", '{stage="x"}')] == pytest.approx(4.05)
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    first, second = Counter("test_a_total", "A."), Counter("test_b_total", "B.")
+    registry.register(first)
+    registry.register(second)
+
+    assert registry.render() == first.render() + second.render()
+
+
+def test_cached_reuses_the_value_until_it_expires():
+    calls = []
+    read = cached(lambda: calls.append(None) or len(calls), ttl_seconds=0.05)
+
+    assert (read(), read()) == (1, 1)
+    time.sleep(0.06)
+    assert read() == 2
+
+
+def test_metrics_endpoint_output_parses(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    import app as app_module
+
+    app = FastAPI()
+    app.include_router(app_module.router)
+    with TestClient(app) as client:
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    types, samples = parse(response.text)
+    assert types["pop_stage_duration_seconds"] == "histogram"
+    assert ("pop_cache_entries", '{cache="artifacts"}') in samples
+    assert ("pop_cache_bytes", '{cache="artifacts"}') in samples
+
+
+def test_server_timing_header_lists_the_stages():
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        with track_stage("test_generate"):
+            time.sleep(0.01)
+        return {}
+
+    app.add_middleware(RequestContextMiddleware)
+    with TestClient(app) as client:
+        response = client.get("/work", headers={"X-Request-ID": "abc-123"})
+
+    assert response.headers["x-request-id"] == "abc-123"
+    entries = dict(
+        entry.split(";dur=") for entry in response.headers["server-timing"].split(", ")
+    )
+    assert list(entries) == ["test_generate", "total"]
+    assert 10 <= float(entries["test_generate"]) <= float(entries["total"])
+
+
+def test_format_server_timing():
+    assert (
+        format_server_timing({"generate": 0.8124, "compile": 0.095}, 0.9152)
+        == "generate;dur=812.4, compile;dur=95.0, total;dur=915.2"
+    )
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import pipeline
+from document_store import DocumentStore
+from pipeline import stream_pop
+from utils import SpooledUpload
+
+
+def spooled_upload(tmp_path) -> SpooledUpload:
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"%PDF-1.4")
+    return SpooledUpload(str(path), 8, "0" * 64)
+
+
+def test_stream_closed_before_extraction_removes_the_upload(tmp_path):
+    upload = spooled_upload(tmp_path)
+
+    async def first_event():
+        stream = stream_pop("Crie um POP", "user", upload)
+        event = await stream.__anext__()
+        await stream.aclose()
+        return event
+
+    assert asyncio.run(first_event()) == ("stage", {"stage": "extract"})
+    assert not (tmp_path / "upload.pdf").exists()
+
+
+def test_discard_tolerates_removed_uploads(tmp_path):
+    upload = spooled_upload(tmp_path)
+    upload.discard()
+    upload.discard()
+    assert not (tmp_path / "upload.pdf").exists()
+
+
+def test_edit_conflict_discards_the_pdf_without_a_token(tmp_path, monkeypatch):
+    store = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    tex = "\\documentclass{article}\n\\begin{document}\n\\section{A}\nUm.\n\\end{document}\n"
+    document_id, _ = store.create("user", tex, "Crie um POP")
+    staged = []
+
+    async def chat(prompt, system_instruction=None, accept=None):
+        return "%%% SECAO 1\n\\section{A}\nDois.\n"
+
+    async def compile_pdf(tex_content, directory):
+        # Outra edição grava a versão 2 enquanto esta compila
+        store.add_version(document_id, tex_content, "Concorrente", 1)
+        path = tmp_path / "staged.pdf"
+        path.write_bytes(b"%PDF-1.4")
+        staged.append(path)
+        return str(path)
+
+    async def register_pdf(*args):
+        raise AssertionError("PDF de uma edição recusada não deve ser registrado")
+
+    monkeypatch.setattr(pipeline, "document_store", store)
+    monkeypatch.setattr(pipeline, "chat_with_persona_async", chat)
+    monkeypatch.setattr(pipeline, "validate_tex", lambda text: text)
+    monkeypatch.setattr(pipeline, "compile_pdf", compile_pdf)
+    monkeypatch.setattr(pipeline, "register_pdf", register_pdf)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(pipeline.edit_pop(document_id, "user", "Troque", sections=[1]))
+
+    assert error.value.status_code == 409
+    assert not staged[0].exists()
+    assert store.get(document_id, "user")["version"] == 2
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import pipeline
+import prompt_budget
+from llm import build_prompt
+from personas import PERSONA_DESCRIPTION_GERAPOP
+from prompt_budget import estimate_tokens
+
+BUDGET = 6000
+QUESTION = "Atualize a seção de responsabilidades e inclua o uso de EPI."
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    async def summarize(prompt, system_instruction=None, **kwargs):
+        # Resumo que cumpre o limite pedido no prompt
+        words = int(prompt.split("cerca de ", 1)[1].split(" ", 1)[0])
+        chunk = prompt.rsplit("Trecho do POP:\n", 1)[1]
+        return " ".join(chunk.split()[:words])
+
+    monkeypatch.setattr(prompt_budget, "chat_with_persona_async", summarize)
+    monkeypatch.setattr(prompt_budget, "input_token_budget", lambda: BUDGET)
+
+
+def pop_text(tokens: int) -> str:
+    paragraph = "O operador deve registrar a limpeza do equipamento no formulário. "
+    count = tokens * prompt_budget.CHARS_PER_TOKEN // len(paragraph) + 1
+    return "\n\n".join(f"{number}. {paragraph}" for number in range(count))
+
+
+def prompt_tokens(pdf_text: str) -> int:
+    """Tokens do prompt completo enviado ao modelo, com a persona."""
+    question = asyncio.run(pipeline.build_bounded_question(QUESTION, pdf_text))
+    return estimate_tokens(PERSONA_DESCRIPTION_GERAPOP) + estimate_tokens(
+        build_prompt(question)
+    )
+
+
+@pytest.mark.parametrize("pdf_tokens", [1000, 3000, BUDGET, 50000])
+def test_final_prompt_fits_the_budget(pdf_tokens):
+    assert prompt_tokens(pop_text(pdf_tokens)) <= BUDGET
+
+
+def test_small_pop_is_sent_unchanged():
+    pdf_text = pop_text(500)
+    assert asyncio.run(prompt_budget.fit_pdf_text(QUESTION, pdf_text)) == pdf_text
+
+
+def test_question_and_persona_over_budget(monkeypatch):
+    tokens = estimate_tokens(PERSONA_DESCRIPTION_GERAPOP)
+    monkeypatch.setattr(prompt_budget, "input_token_budget", lambda: tokens)
+
+    with pytest.raises(prompt_budget.HTTPException) as error:
+        asyncio.run(prompt_budget.fit_pdf_text(QUESTION, pop_text(100)))
+    assert error.value.status_code == 413
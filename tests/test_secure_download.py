@@ -0,0 +1,130 @@
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from artifacts import ArtifactStore
+from download_manager import DownloadManager, MemoryTokenStore, range_reaches_end
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 4  # 1033 bytes
+SIZE = len(PDF)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, True),
+        ("bytes=0-", True),
+        ("bytes=100-", True),
+        (f"bytes=0-{SIZE - 1}", True),
+        (f"bytes=0-{SIZE + 50}", True),
+        ("bytes=-10", True),
+        ("BYTES=0-9, 500-", True),
+        ("bytes=0-9", False),
+        ("bytes=0-9,20-29", False),
+        (f"bytes={SIZE}-", False),  # início após o fim: 416
+        (f"bytes={SIZE + 10}-{SIZE + 20}", False),
+        ("bytes=-0", False),
+        ("bytes=9-0", False),
+        ("bytes=abc-", False),
+        ("bytes=0-9x", False),
+        ("bytes=--5", False),
+        ("bytes=", False),
+        ("bytes=0-9,", False),
+        ("items=0-", False),
+        ("0-", False),
+    ],
+)
+def test_range_reaches_end(header, expected):
+    assert range_reaches_end(header, SIZE) is expected
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    import app as app_module
+
+    store = ArtifactStore(str(tmp_path / "pdfs"), str(tmp_path / "index.sqlite3"))
+    os.makedirs(tmp_path / "pdfs" / "ab")
+    (tmp_path / "pdfs" / "ab" / "pop.pdf").write_bytes(PDF)
+    manager = DownloadManager(MemoryTokenStore())
+    monkeypatch.setattr(app_module, "artifact_store", store)
+    monkeypatch.setattr(app_module, "download_manager", manager)
+
+    # Só o router: sem o lifespan e suas tarefas em segundo plano
+    app = FastAPI()
+    app.include_router(app_module.router)
+    with TestClient(app) as client:
+        client.manager = manager
+        yield client
+
+
+def download(client, **headers):
+    headers = {name.replace("_", "-"): value for name, value in headers.items()}
+    token = client.manager.create_download_token("ab/pop.pdf", "user", "ab12")
+    response = client.get(f"/secure_download/{token}", headers=headers)
+    return response, client.manager.get_download(token) is None
+
+
+def test_full_download_consumes_the_token(client):
+    response, consumed = download(client)
+    assert response.status_code == 200
+    assert response.content == PDF
+    assert response.headers["etag"] == '"ab12"'
+    assert consumed
+
+
+@pytest.mark.parametrize("header", ["bytes=-10", "bytes=1000-"])
+def test_range_with_the_last_byte_consumes_the_token(client, header):
+    response, consumed = download(client, range=header)
+    assert response.status_code == 206
+    assert response.content == PDF[-len(response.content) :]
+    assert consumed
+
+
+def test_partial_range_keeps_the_token(client):
+    response, consumed = download(client, range="bytes=0-9")
+    assert response.status_code == 206
+    assert response.content == PDF[:10]
+    assert not consumed
+
+
+@pytest.mark.parametrize(
+    "header, status", [(f"bytes={SIZE}-", 416), ("bytes=abc", 400)]
+)
+def test_rejected_range_keeps_the_token(client, header, status):
+    response, consumed = download(client, range=header)
+    assert response.status_code == status
+    assert not consumed
+
+
+def test_if_range_mismatch_sends_and_consumes_the_whole_file(client):
+    # ETag diferente: o Range é ignorado e o arquivo inteiro é enviado (200)
+    response, consumed = download(client, range="bytes=0-9", if_range='"old"')
+    assert response.status_code == 200
+    assert response.content == PDF
+    assert consumed
+
+
+def test_if_range_match_honours_the_partial_range(client):
+    response, consumed = download(client, range="bytes=0-9", if_range='"ab12"')
+    assert response.status_code == 206
+    assert not consumed
+
+
+def test_not_modified_keeps_the_token(client):
+    response, consumed = download(client, if_none_match='"ab12"')
+    assert response.status_code == 304
+    assert not consumed
+
+
+def test_artifacts_are_not_served_without_a_token(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    import app as app_module
+
+    app = app_module.create_app()
+    paths = [getattr(route, "path", "") for route in app.routes]
+    assert not any(path.startswith("/static") for path in paths)
+    # Sem o bloco with, o lifespan (e suas tarefas) não é executado
+    assert TestClient(app).get("/static/ab/pop.pdf").status_code == 404
@@ -0,0 +1,41 @@
+import asyncio
+import hashlib
+import io
+import tempfile
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from utils import spool_upload
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    # mkstemp usa tempfile.tempdir quando definido
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return tmp_path
+
+
+def test_spool_upload_copies_and_hashes(spool_dir):
+    content = b"%PDF-1.4" + b"x" * 200_000
+    upload = asyncio.run(spool_upload(UploadFile(io.BytesIO(content))))
+
+    with open(upload.path, "rb") as file:
+        assert file.read() == content
+    assert upload.size == len(content)
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+    upload.discard()
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_oversized_upload_is_rejected_and_removed(spool_dir, monkeypatch):
+    # Sem max_bytes explícito, vale o max_upload_mb da configuração
+    monkeypatch.setattr("utils.get_config", lambda: {"max_upload_mb": 2})
+    content = b"x" * (3 * 1024 * 1024)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(spool_upload(UploadFile(io.BytesIO(content))))
+
+    assert error.value.status_code == 413
+    assert "2 MB" in error.value.detail
+    assert list(spool_dir.iterdir()) == []
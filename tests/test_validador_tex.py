@@ -0,0 +1,82 @@
+import pytest
+
+from Validador_tex import ValidTex
+
+
+def document(preamble: str = "", body: str = "Text.") -> str:
+    return (
+        "\\documentclass{article}\n"
+        f"{preamble}\n"
+        "\\begin{document}\n"
+        f"{body}\n"
+        "\\end{document}\n"
+    )
+
+
+@pytest.fixture
+def scan():
+    return ValidTex()._scan
+
+
+@pytest.mark.parametrize(
+    "preamble",
+    [
+        r"\newenvironment{box}{\begin{center}}{\end{center}}",
+        r"\renewenvironment*{box}[1][x]{\begin{minipage}{#1}}{\end{minipage}}",
+        r"\newcommand{\bi}{\begin{itemize}}",
+        r"\newcommand\ei{\end{itemize}}",
+        r"\renewcommand{\bi}[1]{\begin{itemize}\item #1}",
+        r"\def\bi#1{\begin{itemize}\item #1} % {",
+        r"\usepackage{hyperref}\hypersetup{colorlinks}",
+    ],
+)
+def test_definitions_in_preamble_are_not_paired(scan, preamble):
+    assert scan(document(preamble, r"\bi Item \ei")) is None
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        r"\href{http://a/c%20d}{link}",
+        r"\url{http://a/c%20d#section}",
+        r"\url|http://a/c%20d|",
+        r"\href{http://a/{x}%7D}{\textbf{link}}",
+    ],
+)
+def test_url_arguments_are_verbatim(scan, body):
+    assert scan(document(body=body)) is None
+
+
+def test_href_text_is_still_checked(scan):
+    assert "Unmatched" in scan(document(body=r"\href{http://a/%}{link}}"))
+
+
+def test_environments_are_paired_in_the_body(scan):
+    error = scan(document(body=r"\begin{itemize}\item A"))
+    assert "closes environment itemize" in error
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        document(r"\newcommand{\x}{\input{/etc/passwd}}"),
+        document(r"\def\x{\immediate\write18{ls}}"),
+        document(r"\newenvironment{x}{\csname input\endcsname}{}"),
+        document(body=r"\href{\input{/etc/passwd}}{link}"),
+        document(body=r"\url{^^5cinput}"),
+        document(r"\begin{filecontents}{x.tex}\end{filecontents}"),
+    ],
+)
+def test_forbidden_commands_in_skipped_text(scan, source):
+    assert "not allowed" in scan(source) or "Forbidden" in scan(source)
+
+
+@pytest.mark.parametrize(
+    "preamble", [r"\newcommand{\x}{\textbf{x}", r"\def\x{x", r"\newenvironment{x}{a}"]
+)
+def test_incomplete_definitions(scan, preamble):
+    assert "Incomplete" in scan(document(preamble))
+
+
+def test_unterminated_url(scan):
+    assert "Unterminated \\url" in scan(document(body=r"\url{http://a"))
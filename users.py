@@ -0,0 +1,224 @@
+"""Cadastro de usuários com senhas protegidas por hash.
+
+Os usuários ficam em um arquivo JSON (`users_file` no config.json), no
+formato {"usuario": {"password_hash": "..."}}. As senhas usam scrypt ou,
+se o OpenSSL não oferecer scrypt, PBKDF2-SHA256.
+
+Uso pela linha de comando:
+    python users.py add maria
+    python users.py remove maria
+    python users.py list
+"""
+
+import argparse
+import asyncio
+import base64
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from config import get_config
+
+# Custo do scrypt: cerca de 16 MB de memória e algumas dezenas de ms por hash
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password: str) -> str:
+    """
+    Calcula o hash de uma senha com um salt aleatório.
+
+    Returns:
+        str: "scrypt$n$r$p$salt$hash" ou "pbkdf2_sha256$iterações$salt$hash".
+    """
+    salt = os.urandom(SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        digest = hashlib.scrypt(
+            password.encode("utf-8"), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P
+        )
+        return "$".join(
+            ["scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+            + [_b64encode(salt), _b64encode(digest)]
+        )
+    digest = hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS
+    )
+    return "$".join(
+        ["pbkdf2_sha256", str(PBKDF2_ITERATIONS), _b64encode(salt), _b64encode(digest)]
+    )
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """Compara a senha com o hash armazenado, em tempo constante."""
+    try:
+        algorithm, *params, salt, expected = encoded.split("$")
+        salt = base64.b64decode(salt)
+        expected = base64.b64decode(expected)
+        if algorithm == "scrypt":
+            n, r, p = (int(value) for value in params)
+            digest = hashlib.scrypt(
+                password.encode("utf-8"),
+                salt=salt,
+                n=n,
+                r=r,
+                p=p,
+                maxmem=256 * r * (n + p + 1),
+                dklen=len(expected),
+            )
+        elif algorithm == "pbkdf2_sha256":
+            digest = hashlib.pbkdf2_hmac(
+                "sha256", password.encode("utf-8"), salt, int(params[0])
+            )
+        else:
+            return False
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+class UserStore:
+    """Usuários do arquivo JSON, relidos quando o arquivo muda.
+
+    A verificação de senha é deliberadamente lenta; `authenticate` a executa
+    em uma thread para não bloquear o event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, str]] = {}
+        self._mtime: Optional[float] = None
+        # Hash usado para usuários inexistentes, para que o tempo de resposta
+        # não revele quais usuários existem
+        self._dummy_hash: Optional[str] = None
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            self._users, self._mtime = {}, None
+            return self._users
+        if mtime != self._mtime:
+            with open(self.path, encoding="utf-8") as file:
+                self._users = json.load(file)
+            self._mtime = mtime
+        return self._users
+
+    def _save(self, users: Dict[str, Dict[str, str]]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(users, file, indent=2, ensure_ascii=False)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._mtime = None
+
+    def usernames(self) -> List[str]:
+        with self._lock:
+            return sorted(self._load())
+
+    def set_password(self, username: str, password: str) -> None:
+        """Cria o usuário ou troca a senha de um usuário existente."""
+        password_hash = hash_password(password)
+        with self._lock:
+            users = dict(self._load())
+            users[username] = {
+                **users.get(username, {}),
+                "password_hash": password_hash,
+            }
+            self._save(users)
+
+    def remove(self, username: str) -> bool:
+        """Remove o usuário; retorna False se ele não existir."""
+        with self._lock:
+            users = dict(self._load())
+            if users.pop(username, None) is None:
+                return False
+            self._save(users)
+            return True
+
+    def check_password(self, username: str, password: str) -> bool:
+        """Verifica as credenciais (bloqueante)."""
+        with self._lock:
+            user = self._load().get(username)
+            if user is None and self._dummy_hash is None:
+                self._dummy_hash = hash_password(os.urandom(SALT_BYTES).hex())
+        if user is None:
+            verify_password(password, self._dummy_hash)
+            return False
+        return verify_password(password, user.get("password_hash", ""))
+
+    async def authenticate(self, username: str, password: str) -> bool:
+        """
+        Verifica as credenciais fora do event loop.
+
+        Args:
+            username (str): Nome do usuário.
+            password (str): Senha informada no login.
+
+        Returns:
+            bool: True se o usuário existir e a senha conferir.
+        """
+        return await asyncio.to_thread(self.check_password, username, password)
+
+
+# Cadastro de usuários compartilhado pela aplicação
+user_store = UserStore(get_config()["users_file"])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gerencia os usuários da API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Cria o usuário ou troca a senha")
+    add.add_argument("username")
+    add.add_argument(
+        "--password-stdin", action="store_true", help="Lê a senha da entrada padrão"
+    )
+    remove = commands.add_parser("remove", help="Remove o usuário")
+    remove.add_argument("username")
+    commands.add_parser("list", help="Lista os usuários")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        if args.password_stdin:
+            password = sys.stdin.readline().rstrip("\n")
+        else:
+            password = getpass.getpass("Senha: ")
+            if password != getpass.getpass("Confirme a senha: "):
+                print("As senhas não conferem.", file=sys.stderr)
+                return 1
+        if not password:
+            print("A senha não pode ser vazia.", file=sys.stderr)
+            return 1
+        user_store.set_password(args.username, password)
+        print(f"Usuário {args.username} salvo em {user_store.path}.")
+    elif args.command == "remove":
+        if not user_store.remove(args.username):
+            print(f"Usuário {args.username} não encontrado.", file=sys.stderr)
+            return 1
+        print(f"Usuário {args.username} removido.")
+    else:
+        for username in user_store.usernames():
+            print(username)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,28 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
 import os
 import re  # Para capturar conteúdo entre delimitadores
+import shutil
 import subprocess
-import fitz  # PyMuPDF for PDF text extraction
-from PyPDF2 import PdfReader
-import google.generativeai as genai
-from fastapi import HTTPException
-from personas import PERSONA_DESCRIPTION_GERAPOP
-import json
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+from fastapi import HTTPException, Request, UploadFile
+from cache import TieredCache
+from config import get_config
+from latex_format import latex_format
+from latex_log import LatexCompileError, LatexLog, read_log
+from logger import api_logger
+from metrics import pdflatex_failures, register_cache, stage_seconds
+
+try:
+    import resource  # Limites de CPU e memória do pdflatex (prlimit: só Linux)
+except ImportError:
+    resource = None
 
 
 # Função para extrair conteúdo entre delimitadores
@@ -37,95 +53,431 @@ def extract_tex_content(tex_string):
         return "Erro: Delimitadores \\documentclass e \\end{document} não encontrados."
 
 
+# Tamanho dos blocos lidos ao salvar uploads em disco
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Pool de processos para extração de texto de PDFs grandes (criado sob demanda)
+_pdf_executor = None
+
+# Argumentos passados ao pdflatex em toda compilação; -halt-on-error encerra a
+# execução no primeiro erro, em vez de processar o restante do documento
+PDFLATEX_ARGS = ["-interaction=nonstopmode", "-halt-on-error", "-no-shell-escape"]
+
+
+def _limit_resources(pid):
+    """
+    Aplica os limites de CPU e memória ao processo do pdflatex (Linux).
+
+    Os limites são aplicados com prlimit depois que o processo é criado: um
+    preexec_fn não é seguro aqui, porque o pool de compilação tem várias
+    threads e o processo filho pode travar em um lock herdado.
+    """
+    if getattr(resource, "prlimit", None) is None:
+        return
+    config = get_config()
+    cpu_seconds = config["latex_cpu_seconds"]
+    memory_mb = config["latex_memory_mb"]
+    try:
+        if cpu_seconds:
+            # SIGXCPU no limite; SIGKILL um segundo depois, se ignorado
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        if memory_mb:
+            memory = memory_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory, memory))
+    except ProcessLookupError:
+        # O pdflatex já terminou
+        pass
+
+
+def _write_document(job_directory, tex_content, fmt=None):
+    """Grava o document.tex (e o formato, se usado) no diretório do job."""
+    # Salvar o conteúdo LaTeX em um arquivo .tex
+    with open(
+        os.path.join(job_directory, "document.tex"), "w", encoding="utf-8"
+    ) as file:
+        file.write(tex_content)
+
+    if fmt is not None:
+        # O pdflatex procura o formato também no diretório de trabalho
+        link_or_copy(fmt.path, os.path.join(job_directory, f"{fmt.name}.fmt"))
+
+
+def _run_pdflatex(pdflatex_path, job_directory, fmt=None) -> LatexLog:
+    """
+    Executa o pdflatex uma vez sobre o document.tex do diretório do job.
+
+    Returns:
+        LatexLog: Erros e avisos lidos do document.log.
+
+    Raises:
+        LatexCompileError: Se o pdflatex falhar, exceder o tempo limite ou for
+            encerrado pelos limites de CPU ou memória.
+    """
+    args = [pdflatex_path, *PDFLATEX_ARGS]
+    if fmt is not None:
+        args.append(f"-fmt={fmt.name}")
+
+    timeout = get_config()["latex_timeout_seconds"]
+    with subprocess.Popen(
+        [*args, "document.tex"],
+        cwd=job_directory,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as process:
+        try:
+            _limit_resources(process.pid)
+            process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise LatexCompileError(
+                "timeout", f"O pdflatex excedeu o tempo limite de {timeout}s."
+            )
+        except BaseException:
+            process.kill()
+            raise
+
+    log = read_log(os.path.join(job_directory, "document.log"))
+    if process.returncode < 0:
+        # Encerrado por sinal: SIGXCPU/SIGKILL do limite de CPU ou falta de memória
+        raise LatexCompileError(
+            "limit",
+            "O pdflatex foi encerrado por exceder os limites de CPU ou memória.",
+            log.errors,
+        )
+    if process.returncode != 0:
+        raise LatexCompileError(
+            "error", "Erro durante a compilação do LaTeX.", log.errors
+        )
+    return log
+
+
+def _compile_document(pdflatex_path, job_directory, fmt=None) -> LatexLog:
+    """Executa o pdflatex até as referências se estabilizarem."""
+    max_runs = max(1, get_config()["latex_max_runs"])
+    for _ in range(max_runs):
+        log = _run_pdflatex(pdflatex_path, job_directory, fmt)
+        # Só repetir quando o próprio log pede (ex.: \pageref{LastPage})
+        if not log.needs_rerun:
+            break
+    return log
+
+
+def _compile_error_details(error: LatexCompileError) -> dict:
+    """Contexto de log de uma falha do pdflatex: motivo e primeiro erro."""
+    return {
+        "stage": "pdflatex",
+        "reason": error.reason,
+        "first_error": error.errors[0]._asdict() if error.errors else None,
+    }
+
+
 # Gera o PDF a partir do código LaTeX
 def compile_latex(tex_content, output_directory):
     """
     Compila o código LaTeX diretamente em PDF usando pdflatex.
 
+    Cada compilação usa um diretório de trabalho exclusivo e gera um PDF com
+    nome único, para que compilações simultâneas não sobrescrevam umas às outras.
+    O pdflatex para no primeiro erro, roda com tempo limite e limites de CPU e
+    memória, e só é executado novamente quando o log pede.
+
     Args:
         tex_content (str): Código LaTeX a ser compilado.
         output_directory (str): Diretório onde o PDF será salvo.
 
     Returns:
-        str: Caminho do arquivo PDF gerado.
+        str: Caminho do arquivo PDF gerado, ou None se o pdflatex não puder ser
+        executado.
+
+    Raises:
+        LatexCompileError: Se o documento não compilar, com os erros do log.
     """
-    # Caminho do arquivo .tex
-    tex_file = os.path.join(output_directory, "document.tex")
-    pdf_file = os.path.join(output_directory, "document.pdf")
+    start = time.perf_counter()
+    job_name = f"pop_{uuid.uuid4().hex}"
+    job_directory = tempfile.mkdtemp(prefix=f"{job_name}_")
 
-    # Salvar o conteúdo LaTeX em um arquivo .tex
-    with open(tex_file, "w", encoding="utf-8") as file:
-        file.write(tex_content)
+    # PDF final com nome único
+    pdf_file = os.path.join(output_directory, f"{job_name}.pdf")
 
     try:
-        # Ler o caminho do pdflatex do arquivo de configuração
-        with open("config.json", "r") as config_file:
-            config = json.load(config_file)
-            pdflatex_path = config["pdflatex_path"]
-
-        # Executar o pdflatex para compilar o arquivo .tex
-        subprocess.run(
-            [
-                pdflatex_path,
-                "-interaction=nonstopmode",
-                "document.tex",
-            ],
-            cwd=output_directory,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-        )
+        pdflatex_path = get_config()["pdflatex_path"]
+
+        # Usar o formato pré-compilado quando o preâmbulo for o padrão
+        format_name = None
+        if latex_format is not None:
+            compile_content, format_name = latex_format.prepare(tex_content)
 
-        print(f"PDF gerado com sucesso: {pdf_file}")
+        if format_name is not None:
+            try:
+                _write_document(job_directory, compile_content, latex_format)
+                _compile_document(pdflatex_path, job_directory, latex_format)
+            except LatexCompileError as e:
+                if e.reason != "error":
+                    raise
+                # Recompilar sem o formato também dá os erros com as linhas do
+                # documento original
+                pdflatex_failures.inc(reason="format")
+                api_logger.log_info(
+                    "Falha com o formato pré-compilado, compilando sem ele",
+                    _compile_error_details(e),
+                )
+                format_name = None
+
+        if format_name is None:
+            _write_document(job_directory, tex_content)
+            _compile_document(pdflatex_path, job_directory)
+
+        shutil.move(os.path.join(job_directory, "document.pdf"), pdf_file)
         return pdf_file
 
-    except subprocess.CalledProcessError as e:
-        print("Erro durante a compilação do LaTeX:", e)
-        return None
+    except LatexCompileError as e:
+        pdflatex_failures.inc(reason=e.reason)
+        api_logger.log_error(e, _compile_error_details(e))
+        raise
 
     except FileNotFoundError as e:
-        print("Erro: Arquivo de configuração não encontrado.", e)
+        # pdflatex ou PDF gerado não encontrado
+        pdflatex_failures.inc(reason="not_found")
+        api_logger.log_error(e, {"stage": "pdflatex", "reason": "not_found"})
         return None
 
     except KeyError as e:
-        print(
-            "Erro: Caminho do pdflatex não especificado no arquivo de configuração.", e
-        )
+        # Caminho do pdflatex não especificado no arquivo de configuração
+        pdflatex_failures.inc(reason="config")
+        api_logger.log_error(e, {"stage": "pdflatex", "reason": "config"})
         return None
 
+    finally:
+        # Remover o diretório de trabalho e os arquivos intermediários
+        shutil.rmtree(job_directory, ignore_errors=True)
+        stage_seconds.observe(time.perf_counter() - start, stage="pdflatex")
+
+
+class SpooledUpload(NamedTuple):
+    """Upload salvo em arquivo temporário."""
+
+    path: str
+    size: int
+    sha256: str
+
+    def discard(self) -> None:
+        """Remove o arquivo temporário, se ainda existir."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _write_chunk(file, digest, chunk: bytes) -> None:
+    file.write(chunk)
+    digest.update(chunk)
 
-# Função para interagir com o Gemini
-def chat_with_persona(question):
+
+# Função para salvar o upload em disco
+async def spool_upload(upload: UploadFile, max_bytes=None) -> SpooledUpload:
     """
-    Envia uma pergunta para o Gemini e retorna a resposta gerada utilizando a persona GERAPOP.
+    Copia o arquivo enviado para um arquivo temporário, em blocos, calculando
+    o SHA-256 do conteúdo durante a cópia.
+
+    Args:
+        upload (UploadFile): Arquivo recebido na requisição.
+        max_bytes (int, opcional): Tamanho máximo aceito.
+
+    Returns:
+        SpooledUpload: Arquivo temporário (o chamador deve removê-lo).
     """
+    if max_bytes is None:
+        max_bytes = get_config()["max_upload_mb"] * 1024 * 1024
+
+    fd, path = tempfile.mkstemp(prefix="pop_upload_", suffix=".pdf")
+    size = 0
+    digest = hashlib.sha256()
     try:
-        # Inicializar o modelo
-        model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+        with os.fdopen(fd, "wb") as file:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    limit_mb = max_bytes // (1024 * 1024)
+                    raise HTTPException(
+                        status_code=413, detail=f"PDF excede o limite de {limit_mb} MB"
+                    )
+                # Escrita e hash fora do event loop: blocos grandes o bloqueariam
+                await asyncio.to_thread(_write_chunk, file, digest, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest())
 
-        # Criar o prompt com a persona fixa e a pergunta
-        prompt = f"{PERSONA_DESCRIPTION_GERAPOP}\n\nPergunta: {question}"
 
-        # Enviar o prompt para o modelo Gemini
-        response = model.generate_content(prompt)
+def normalize_pdf_text(text: str) -> str:
+    """Remove espaços redundantes do texto extraído de um PDF."""
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in text.splitlines())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
 
-        # Retornar a resposta gerada
-        return response.text
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao acessar o Gemini: {e}")
+
+def _create_extraction_cache():
+    config = get_config()
+    if not config["extraction_cache_enabled"]:
+        return None
+    return TieredCache(
+        max_entries=config["extraction_cache_max_entries"],
+        ttl_seconds=config["extraction_cache_ttl_seconds"],
+        disk_path=config["extraction_cache_disk_path"],
+        max_bytes=config["extraction_cache_max_mb"] * 1024 * 1024,
+        disk_max_entries=config["extraction_cache_disk_max_entries"],
+    )
+
+
+# Cache do texto extraído, indexado pelo SHA-256 do PDF (None se desabilitado)
+extraction_cache = _create_extraction_cache()
+if extraction_cache is not None:
+    register_cache("extraction", extraction_cache)
 
 
 # Função para extrair texto do PDF
-def extract_text_from_pdf(pdf_file: bytes) -> str:
+def extract_text_from_pdf(pdf_file, start=0, stop=None) -> str:
     """
     Extrai texto de um arquivo PDF.
+
+    Args:
+        pdf_file (bytes | str): Conteúdo do PDF ou caminho do arquivo.
+        start (int): Primeira página a extrair.
+        stop (int, opcional): Página final (exclusiva); padrão é até o fim.
+
+    Returns:
+        str: Texto das páginas, na ordem.
     """
+    import fitz  # PyMuPDF, importado só quando um PDF é processado
+
     try:
         # Usando PyMuPDF para melhor extração de texto
-        doc = fitz.open(stream=pdf_file, filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        return text
+        if isinstance(pdf_file, bytes):
+            doc = fitz.open(stream=pdf_file, filetype="pdf")
+        else:
+            doc = fitz.open(pdf_file, filetype="pdf")
+        with doc:
+            stop = doc.page_count if stop is None else min(stop, doc.page_count)
+            return "".join(doc[number].get_text() for number in range(start, stop))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao processar PDF: {str(e)}")
+
+
+def _count_pdf_pages(pdf_path: str) -> int:
+    import fitz
+
+    try:
+        with fitz.open(pdf_path, filetype="pdf") as doc:
+            return doc.page_count
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao processar PDF: {str(e)}")
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    if _pdf_executor is None:
+        # "spawn": o processo já tem threads (log, compilação, coleta de lixo) e
+        # um fork poderia herdar locks presos e travar os workers
+        _pdf_executor = ProcessPoolExecutor(
+            max_workers=get_config()["pdf_extract_workers"] or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pdf_executor
+
+
+async def extract_text_from_pdf_async(pdf_path: str) -> str:
+    """
+    Extrai o texto de um PDF em disco fora do event loop.
+
+    PDFs pequenos são processados em uma thread; PDFs maiores têm as páginas
+    divididas em faixas, extraídas em paralelo por um pool de processos.
+
+    Args:
+        pdf_path (str): Caminho do arquivo PDF.
+
+    Returns:
+        str: Texto do PDF.
+    """
+    config = get_config()
+    loop = asyncio.get_running_loop()
+
+    page_count = await loop.run_in_executor(None, _count_pdf_pages, pdf_path)
+    if page_count > config["pdf_max_pages"]:
+        raise HTTPException(
+            status_code=413,
+            detail=f"PDF excede o limite de {config['pdf_max_pages']} páginas",
+        )
+
+    pages_per_task = config["pdf_pages_per_task"]
+    if page_count <= pages_per_task:
+        return await loop.run_in_executor(None, extract_text_from_pdf, pdf_path)
+
+    executor = _get_pdf_executor()
+    parts = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                executor, extract_text_from_pdf, pdf_path, start, start + pages_per_task
+            )
+            for start in range(0, page_count, pages_per_task)
+        )
+    )
+    return "".join(parts)
+
+
+# Função para cancelar tarefas quando o cliente desconecta
+async def cancel_on_disconnect(request: Request, awaitable, poll_interval=0.5):
+    """
+    Aguarda o resultado de `awaitable`, cancelando-o se o cliente desconectar.
+
+    Args:
+        request (Request): Requisição cuja conexão será monitorada.
+        awaitable: Corrotina ou tarefa a ser executada.
+        poll_interval (float): Intervalo entre verificações da conexão.
+
+    Returns:
+        Resultado de `awaitable`.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Cliente desconectado")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+# Formata um evento no padrão Server-Sent Events
+def format_sse(event: str, data) -> str:
+    """
+    Serializa um evento para envio via Server-Sent Events.
+
+    Args:
+        event (str): Nome do evento.
+        data: Conteúdo do evento, serializado em JSON.
+
+    Returns:
+        str: Evento formatado, terminado por uma linha em branco.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    """Cria um hard link (sem cópia de dados) ou copia, se não for possível."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def file_sha256(path: str) -> str:
+    """Calcula o SHA-256 de um arquivo, lendo em blocos."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()